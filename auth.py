@@ -1,5 +1,5 @@
 # auth.py - Fixed role update and session refresh
-from fastapi import APIRouter, Request, Response
+from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import RedirectResponse, JSONResponse, HTMLResponse
 from supabase import create_client, Client
 from config import (
@@ -7,6 +7,7 @@ from config import (
     REDIRECT_URI, COOKIE_SECRET, COOKIE_NAME, ALLOWED_DOMAIN
 )
 from constants import SESSION_MAX_AGE, SESSION_SALT, ADMIN_EMAILS, USER_ROLES
+from local_store import create_metadata_client
 from datetime import datetime
 import itsdangerous
 import secrets
@@ -16,6 +17,8 @@ router = APIRouter(tags=["Authentication"])
 # Initialize Supabase clients
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 admin_supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+# Users/whitelist tables (Supabase, or the local SQLite store)
+metadata_db = create_metadata_client()
 
 # Cookie serializer
 serializer = itsdangerous.URLSafeSerializer(COOKIE_SECRET, salt=SESSION_SALT)
@@ -23,7 +26,7 @@ serializer = itsdangerous.URLSafeSerializer(COOKIE_SECRET, salt=SESSION_SALT)
 def ensure_users_table():
     """Ensure users table exists"""
     try:
-        admin_supabase.table("users").select("id").limit(1).execute()
+        metadata_db.table("users").select("id").limit(1).execute()
         return True
     except Exception:
         print("Users table not accessible. Please run the database schema.")
@@ -32,7 +35,7 @@ def ensure_users_table():
 def ensure_spoc_assignments_table():
     """Ensure spoc_assignments table exists"""
     try:
-        admin_supabase.table("spoc_assignments").select("id").limit(1).execute()
+        metadata_db.table("spoc_assignments").select("id").limit(1).execute()
         return True
     except Exception:
         print("SPOC assignments table not accessible. Creating if needed...")
@@ -41,7 +44,7 @@ def ensure_spoc_assignments_table():
 def ensure_email_whitelist_table():
     """Ensure email_whitelist table exists"""
     try:
-        admin_supabase.table("email_whitelist").select("id").limit(1).execute()
+        metadata_db.table("email_whitelist").select("id").limit(1).execute()
         return True
     except Exception:
         print("Email whitelist table not accessible. Creating if needed...")
@@ -61,7 +64,7 @@ def determine_user_role(email: str) -> str:
     
     # Check whitelist for current role (single source of truth)
     try:
-        result = admin_supabase.table("email_whitelist").select("role").eq("email", email_lower).eq("is_active", True).execute()
+        result = metadata_db.table("email_whitelist").select("role").eq("email", email_lower).eq("is_active", True).execute()
         if result.data and len(result.data) > 0:
             db_role = result.data[0].get("role", "user")
             if db_role in USER_ROLES.values():
@@ -75,7 +78,7 @@ def determine_user_role(email: str) -> str:
 def is_email_whitelisted(email: str) -> bool:
     """Check if email is in whitelist (for non-domain restriction)"""
     try:
-        result = admin_supabase.table("email_whitelist").select("email").eq("email", email.lower()).eq("is_active", True).execute()
+        result = metadata_db.table("email_whitelist").select("email").eq("email", email.lower()).eq("is_active", True).execute()
         return bool(result.data)
     except Exception:
         return False
@@ -233,11 +236,11 @@ async def create_session(payload: dict, response: Response):
             }
             
             # Check if user exists
-            existing_user = admin_supabase.table("users").select("id, role").eq("id", user_id).execute()
+            existing_user = metadata_db.table("users").select("id, role").eq("id", user_id).execute()
             
             if existing_user.data:
                 # Update with current role (including any role changes made via UI)
-                admin_supabase.table("users").update({
+                metadata_db.table("users").update({
                     "last_login": datetime.utcnow().isoformat(),
                     "name": name,
                     "role": user_role,
@@ -247,7 +250,7 @@ async def create_session(payload: dict, response: Response):
                 print(f"DEBUG: Updated existing user: {email} with role: {user_role}")
             else:
                 # Create new user
-                admin_supabase.table("users").insert(user_data).execute()
+                metadata_db.table("users").insert(user_data).execute()
                 print(f"DEBUG: Created new user: {email} with role: {user_role}")
                 
         except Exception as db_error:
@@ -338,4 +341,11 @@ def get_logged_in_user(request: Request):
         }
     except Exception as e:
         print(f"WARNING: Could not parse user session: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def require_admin(request: Request) -> dict:
+    """Return the logged-in admin for an API endpoint, or reject the request with 403"""
+    user = get_logged_in_user(request)
+    if not user or user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
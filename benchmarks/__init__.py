@@ -0,0 +1 @@
+# benchmarks - Offline performance benchmarks with deterministic stand-ins for external services
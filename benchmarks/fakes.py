@@ -0,0 +1,587 @@
+# benchmarks/fakes.py - Deterministic stand-ins for OpenAI, tiktoken, Supabase and S3
+#
+# install_fakes() must run before any service module is imported: the services bind
+# create_client / ChatOpenAI / OpenAIEmbeddings / boto3.client at import time.
+# Each stand-in can add a fixed per-call latency so round-trip counts show up in timings.
+import io
+import asyncio
+import os
+import re
+import sys
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from copy import deepcopy
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+from botocore.exceptions import ClientError
+from botocore.hooks import HierarchicalEmitter
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+
+# Modules that bind the faked clients at import time
+SERVICE_MODULES = (
+    "config", "local_store", "auth", "rag_service", "chat_service", "ui_service", "file_services",
+    "context_packer",
+    "user_management", "s3_storage", "s3_archive_service", "review_clarification_service"
+)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def _approx_tokens(text: str) -> int:
+    """~4 characters per token; the stand-ins never call tiktoken"""
+    return max(1, len(text) // 4)
+
+# ========== OPENAI ==========
+
+class WordTokenizer:
+    """tiktoken Encoding stand-in: one token per word with its leading whitespace, so
+    decode(encode(text)) == text and counts need no downloaded encoding files"""
+
+    pattern = re.compile(r"\s*\S+|\s+")
+
+    def encode(self, text: str, **kwargs) -> List[str]:
+        return self.pattern.findall(text)
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+class HashEmbeddings(Embeddings):
+    """Feature-hashed bag-of-words vectors: same text, same vector, and overlapping words score higher"""
+
+    latency_seconds = 0.0
+    calls = 0
+
+    def __init__(self, model: str = "text-embedding-3-small", dimensions: Optional[int] = None, **kwargs):
+        from constants import EMBEDDING_MODEL_DIMENSIONS
+        self.model = model
+        self.dimensions = dimensions or EMBEDDING_MODEL_DIMENSIONS.get(model, 1536)
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = 1.0
+            norm = 1.0
+        return (vector / norm).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        HashEmbeddings.calls += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class CannedChatModel:
+    """ChatOpenAI stand-in: fixed latency, an answer citing the first document in the prompt"""
+
+    latency_seconds = 0.0
+    answer_words = 120
+    calls = 0
+
+    def __init__(self, model: str = "gpt-4o", **kwargs):
+        self.model = model
+
+    def invoke(self, messages, *args, **kwargs) -> AIMessage:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return self._answer(messages)
+
+    async def ainvoke(self, messages, *args, **kwargs) -> AIMessage:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return self._answer(messages)
+
+    def _answer(self, messages) -> AIMessage:
+        CannedChatModel.calls += 1
+        prompt = "\n".join(str(getattr(m, "content", m)) for m in messages)
+        cited = re.search(r"\[Document: ([^\]]+)\]", prompt)
+        source = cited.group(1) if cited else "the available documents"
+        words = TOKEN_PATTERN.findall(prompt.lower())[-self.answer_words:]
+        content = f"Based on [{source}], " + " ".join(words)
+
+        prompt_tokens = _approx_tokens(prompt)
+        completion_tokens = _approx_tokens(content)
+        return AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "input_token_details": {"cache_read": 0}
+            },
+            response_metadata={"model_name": self.model}
+        )
+
+# ========== SUPABASE ==========
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+# Column defaults from database_schema.sql that the services read back
+TABLE_DEFAULTS = {
+    "email_whitelist": {"role": "user", "is_active": True, "added_at": _now},
+    "users": {"role": "user", "created_at": _now},
+    "spoc_assignments": {"created_at": _now},
+    "conversations": {"summary": None, "summarized_turns": 0, "created_at": _now, "updated_at": _now},
+    "messages": {"feedback": None, "clarification_text": None, "created_at": _now},
+    "message_usage": {"created_at": _now},
+    "common_knowledge_documents": {"chunks_count": 0, "uploaded_at": _now, "indexed_at": None},
+    "user_documents": {"chunks_count": 0, "uploaded_at": _now, "created_at": _now, "indexed_at": None},
+    "departments": {"created_at": _now},
+}
+
+PRIMARY_KEYS = {"message_usage": "message_id"}
+
+
+class InMemoryDatabase:
+    """Tables as lists of dicts behind one lock, shared by every fake client"""
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.tables: Dict[str, List[Dict]] = {}
+        self.lock = threading.Lock()
+        self.queries = 0
+
+    def rows(self, table: str) -> List[Dict]:
+        return self.tables.setdefault(table, [])
+
+    def new_row(self, table: str, values: Dict) -> Dict:
+        row = {}
+        for column, default in TABLE_DEFAULTS.get(table, {}).items():
+            row[column] = default() if callable(default) else default
+        key = PRIMARY_KEYS.get(table, "id")
+        if key == "id":
+            row["id"] = str(uuid.uuid4())
+        row.update(deepcopy(values))
+        return row
+
+    def table(self, name: str) -> "FakeQuery":
+        return FakeQuery(self, name)
+
+
+class FakeQuery:
+    """Chainable subset of the postgrest builder API used by the services"""
+
+    def __init__(self, db: InMemoryDatabase, table: str):
+        self.db = db
+        self.table = table
+        self.operation = "select"
+        self.columns = "*"
+        self.count_mode = None
+        self.payload = None
+        self.on_conflict = None
+        self.filters = []
+        self.ordering = []
+        self.limit_count = None
+        self.offset = 0
+
+    # ---- operations ----
+
+    def select(self, columns: str = "*", count: Optional[str] = None):
+        if self.operation == "select":
+            self.columns = columns
+        self.count_mode = count
+        return self
+
+    def insert(self, values):
+        self.operation, self.payload = "insert", values
+        return self
+
+    def upsert(self, values, on_conflict: Optional[str] = None, **kwargs):
+        self.operation, self.payload, self.on_conflict = "upsert", values, on_conflict
+        return self
+
+    def update(self, values: Dict):
+        self.operation, self.payload = "update", values
+        return self
+
+    def delete(self):
+        self.operation = "delete"
+        return self
+
+    # ---- filters ----
+
+    def _filter(self, column: str, test):
+        self.filters.append((column, test))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, lambda v: v == value)
+
+    def neq(self, column, value):
+        return self._filter(column, lambda v: v != value)
+
+    def gt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v > value)
+
+    def gte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v >= value)
+
+    def lt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v < value)
+
+    def lte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v <= value)
+
+    def in_(self, column, values):
+        values = list(values)
+        return self._filter(column, lambda v: v in values)
+
+    def is_(self, column, value):
+        expected = None if value in (None, "null") else value
+        return self._filter(column, lambda v: v is expected or v == expected)
+
+    def ilike(self, column, pattern):
+        regex = re.compile("^" + re.escape(pattern).replace("%", ".*") + "$", re.IGNORECASE)
+        return self._filter(column, lambda v: v is not None and bool(regex.match(str(v))))
+
+    def like(self, column, pattern):
+        regex = re.compile("^" + re.escape(pattern).replace("%", ".*") + "$")
+        return self._filter(column, lambda v: v is not None and bool(regex.match(str(v))))
+
+    def order(self, column, desc: bool = False, **kwargs):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, count: int, **kwargs):
+        self.limit_count = count
+        return self
+
+    def range(self, start: int, end: int, **kwargs):
+        self.offset, self.limit_count = start, end - start + 1
+        return self
+
+    # ---- execution ----
+
+    def _embeds(self) -> List[tuple]:
+        """(table, columns, inner) for resources like conversations!inner(user_id, title)"""
+        return [
+            (name, [c.strip() for c in cols.split(",")], bool(inner))
+            for name, inner, cols in re.findall(r"(\w+)(!inner)?\(([^)]*)\)", self.columns)
+        ]
+
+    def _joined(self, row: Dict) -> Optional[Dict]:
+        joined = dict(row)
+        for name, columns, inner in self._embeds():
+            foreign_key = name.rstrip("s") + "_id"
+            parent = next((r for r in self.db.rows(name) if r.get("id") == row.get(foreign_key)), None)
+            if parent is None and inner:
+                return None
+            joined[name] = {c: parent.get(c) for c in columns} if parent else None
+        return joined
+
+    @staticmethod
+    def _value(row: Dict, column: str):
+        if "." in column:
+            embedded, _, field = column.partition(".")
+            return (row.get(embedded) or {}).get(field)
+        return row.get(column)
+
+    def _matches(self, row: Dict) -> bool:
+        return all(test(self._value(row, column)) for column, test in self.filters)
+
+    def _project(self, row: Dict) -> Dict:
+        plain = re.sub(r"\w+(!inner)?\([^)]*\)", "", self.columns)
+        columns = [c.strip() for c in plain.split(",") if c.strip()]
+        if "*" in columns:
+            projected = {k: v for k, v in row.items()}
+        else:
+            projected = {c: row.get(c) for c in columns}
+        for name, _, _ in self._embeds():
+            projected[name] = row.get(name)
+        return deepcopy(projected)
+
+    def execute(self):
+        # Same span name as the instrumented postgrest builders, so stage stats line up
+        from tracing import span
+        method = {"select": "GET", "insert": "POST", "upsert": "POST", "update": "PATCH", "delete": "DELETE"}
+        with span(f"supabase.{method[self.operation]} {self.table}"):
+            return self._execute()
+
+    def _execute(self):
+        if self.db.latency_seconds:
+            time.sleep(self.db.latency_seconds)
+
+        with self.db.lock:
+            self.db.queries += 1
+            rows = self.db.rows(self.table)
+
+            if self.operation in ("insert", "upsert"):
+                values = self.payload if isinstance(self.payload, list) else [self.payload]
+                written = []
+                for value in values:
+                    existing = None
+                    if self.operation == "upsert":
+                        keys = [k.strip() for k in (self.on_conflict or PRIMARY_KEYS.get(self.table, "id")).split(",")]
+                        existing = next((r for r in rows if all(r.get(k) == value.get(k) for k in keys)), None)
+                    if existing is not None:
+                        existing.update(deepcopy(value))
+                        written.append(deepcopy(existing))
+                    else:
+                        row = self.db.new_row(self.table, value)
+                        rows.append(row)
+                        written.append(deepcopy(row))
+                if self.table == "messages":
+                    # messages_touch_conversation trigger from database_schema.sql
+                    for message in written:
+                        for conversation in self.db.rows("conversations"):
+                            if conversation["id"] == message["conversation_id"]:
+                                conversation["updated_at"] = message["created_at"]
+                return SimpleNamespace(data=written, count=None)
+
+            if self.operation == "update":
+                updated = []
+                for row in rows:
+                    if self._matches(row):
+                        row.update(deepcopy(self.payload))
+                        updated.append(deepcopy(row))
+                return SimpleNamespace(data=updated, count=None)
+
+            if self.operation == "delete":
+                kept, deleted = [], []
+                for row in rows:
+                    (deleted if self._matches(row) else kept).append(row)
+                self.db.tables[self.table] = kept
+                return SimpleNamespace(data=deepcopy(deleted), count=None)
+
+            selected = []
+            for row in rows:
+                joined = self._joined(row)
+                if joined is not None and self._matches(joined):
+                    selected.append(joined)
+
+        for column, desc in reversed(self.ordering):
+            selected.sort(key=lambda r: (r.get(column) is None, r.get(column) or ""), reverse=desc)
+
+        total = len(selected)
+        selected = selected[self.offset:]
+        if self.limit_count is not None:
+            selected = selected[:self.limit_count]
+        return SimpleNamespace(
+            data=[self._project(row) for row in selected],
+            count=total if self.count_mode else None
+        )
+
+
+class FakeSupabaseClient:
+    def __init__(self, db: InMemoryDatabase):
+        self._db = db
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self._db, name)
+
+    from_ = table
+
+# ========== S3 ==========
+
+class NoSuchKey(ClientError):
+    pass
+
+
+class LocalS3Client:
+    """Directory-backed S3 client; emits before-call/after-call events like botocore does"""
+
+    def __init__(self, root: Path, latency_seconds: float = 0.0):
+        self.root = Path(root)
+        self.latency_seconds = latency_seconds
+        self._object_metadata: Dict[str, Dict] = {}
+        self.exceptions = SimpleNamespace(NoSuchKey=NoSuchKey, ClientError=ClientError)
+        self.meta = SimpleNamespace(
+            service_model=SimpleNamespace(service_name="s3"),
+            events=HierarchicalEmitter()
+        )
+
+    def _path(self, bucket: str, key: str) -> Path:
+        return self.root / bucket / key
+
+    def _call(self, operation: str, action, body=None, streaming_input=False, streaming_output=False):
+        model = SimpleNamespace(name=operation, has_streaming_input=streaming_input,
+                                has_streaming_output=streaming_output)
+        context = {}
+        self.meta.events.emit(f"before-call.s3.{operation}", model=model,
+                              params={"body": body}, context=context)
+        try:
+            if self.latency_seconds:
+                time.sleep(self.latency_seconds)
+            parsed = action()
+        except Exception as e:
+            self.meta.events.emit(f"after-call-error.s3.{operation}", model=model,
+                                  context=context, exception=e)
+            raise
+        self.meta.events.emit(f"after-call.s3.{operation}", model=model, context=context,
+                              parsed=parsed, http_response=None)
+        return parsed
+
+    @staticmethod
+    def _missing(operation: str, code: str = "404"):
+        error = {"Error": {"Code": code, "Message": "Not Found"}}
+        if code == "NoSuchKey":
+            return NoSuchKey(error, operation)
+        return ClientError(error, operation)
+
+    def head_bucket(self, Bucket: str, **kwargs):
+        def _head():
+            if not (self.root / Bucket).is_dir():
+                raise self._missing("HeadBucket")
+            return {}
+        return self._call("HeadBucket", _head)
+
+    def create_bucket(self, Bucket: str, **kwargs):
+        return self._call("CreateBucket", lambda: (self.root / Bucket).mkdir(parents=True, exist_ok=True) or {})
+
+    def put_object(self, Bucket: str, Key: str, Body=b"", Metadata: Optional[Dict] = None, **kwargs):
+        data = Body.encode() if isinstance(Body, str) else (Body.read() if hasattr(Body, "read") else bytes(Body))
+
+        def _put():
+            path = self._path(Bucket, Key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            self._object_metadata[f"{Bucket}/{Key}"] = dict(Metadata or {})
+            return {"ETag": hashlib.md5(data).hexdigest()}
+        return self._call("PutObject", _put, body=data, streaming_input=True)
+
+    def upload_fileobj(self, Fileobj, Bucket: str, Key: str, ExtraArgs: Optional[Dict] = None, **kwargs):
+        self.put_object(Bucket=Bucket, Key=Key, Body=Fileobj.read(), Metadata=(ExtraArgs or {}).get("Metadata"))
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, ExtraArgs: Optional[Dict] = None, **kwargs):
+        with open(Filename, "rb") as f:
+            self.upload_fileobj(f, Bucket, Key, ExtraArgs)
+
+    def get_object(self, Bucket: str, Key: str, **kwargs):
+        def _get():
+            path = self._path(Bucket, Key)
+            if not path.is_file():
+                raise self._missing("GetObject", "NoSuchKey")
+            data = path.read_bytes()
+            return {"Body": io.BytesIO(data), "ContentLength": len(data),
+                    "Metadata": self._object_metadata.get(f"{Bucket}/{Key}", {})}
+        return self._call("GetObject", _get, streaming_output=True)
+
+    def download_file(self, Bucket: str, Key: str, Filename: str, **kwargs):
+        response = self.get_object(Bucket=Bucket, Key=Key)
+        Path(Filename).write_bytes(response["Body"].read())
+
+    def head_object(self, Bucket: str, Key: str, **kwargs):
+        def _head():
+            path = self._path(Bucket, Key)
+            if not path.is_file():
+                raise self._missing("HeadObject")
+            return {"ContentLength": path.stat().st_size,
+                    "Metadata": self._object_metadata.get(f"{Bucket}/{Key}", {})}
+        return self._call("HeadObject", _head)
+
+    def delete_object(self, Bucket: str, Key: str, **kwargs):
+        def _delete():
+            self._path(Bucket, Key).unlink(missing_ok=True)
+            self._object_metadata.pop(f"{Bucket}/{Key}", None)
+            return {}
+        return self._call("DeleteObject", _delete)
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", **kwargs):
+        def _list():
+            bucket_path = self.root / Bucket
+            contents = []
+            if bucket_path.is_dir():
+                for path in sorted(bucket_path.rglob("*")):
+                    key = path.relative_to(bucket_path).as_posix()
+                    if path.is_file() and key.startswith(Prefix):
+                        stat = path.stat()
+                        contents.append({
+                            "Key": key, "Size": stat.st_size,
+                            "LastModified": datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+                        })
+            response = {"KeyCount": len(contents)}
+            if contents:
+                response["Contents"] = contents
+            return response
+        return self._call("ListObjectsV2", _list)
+
+    def generate_presigned_url(self, operation: str, Params: Dict, ExpiresIn: int = 3600, **kwargs):
+        return self._path(Params["Bucket"], Params["Key"]).as_uri()
+
+# ========== INSTALLATION ==========
+
+def install_fakes(workdir: Path, use_s3: bool = False, chat_latency: float = 0.0,
+                  embedding_latency: float = 0.0, supabase_latency: float = 0.0,
+                  s3_latency: float = 0.0, metadata_backend: str = "supabase"):
+    """Point config at workdir and swap every external client for its stand-in
+
+    With metadata_backend="sqlite" the services use the real local SQLite store in
+    workdir instead of the in-memory Supabase stand-in (supabase_latency then has no effect).
+    Either way the returned database has table() and a queries counter.
+    """
+    loaded = [name for name in SERVICE_MODULES if name in sys.modules]
+    if loaded:
+        raise RuntimeError(f"install_fakes() must run before importing {', '.join(loaded)}")
+
+    workdir = Path(workdir)
+    if workdir.exists():
+        shutil.rmtree(workdir)
+    workdir.mkdir(parents=True)
+
+    os.environ.update({
+        "OPENAI_API_KEY": "benchmark",
+        "SUPABASE_URL": "http://supabase.benchmark.local",
+        "SUPABASE_KEY": "benchmark",
+        "SUPABASE_SERVICE_ROLE_KEY": "benchmark",
+        "COOKIE_SECRET": "benchmark",
+        "USE_S3_STORAGE": str(use_s3).lower(),
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "TRACE_LOG_PATH": str(workdir / "traces.jsonl"),
+        "METADATA_BACKEND": metadata_backend,
+        "METADATA_DB_PATH": str(workdir / "metadata.db"),
+    })
+
+    import config
+    # Paths are fixed to /app in S3 mode; keep everything under the scratch directory
+    config.RAG_INDEX_PATH = str(workdir / "rag_index")
+    config.COMMON_KNOWLEDGE_PATH = str(workdir / "common_knowledge")
+    config.RAG_DOCUMENTS_PATH = str(workdir / "user_documents")
+    # Supabase-backed code paths only run in production; the fake database makes them safe
+    config.IS_PRODUCTION = True
+
+    db = InMemoryDatabase(supabase_latency)
+    import supabase
+    supabase.create_client = lambda url, key, *args, **kwargs: FakeSupabaseClient(db)
+
+    async def _acreate_client(url, key, *args, **kwargs):
+        from local_store import AsyncMetadataClient
+        return AsyncMetadataClient(FakeSupabaseClient(db))
+    supabase.acreate_client = _acreate_client
+
+    HashEmbeddings.latency_seconds = embedding_latency
+    CannedChatModel.latency_seconds = chat_latency
+    import langchain_openai
+    langchain_openai.OpenAIEmbeddings = HashEmbeddings
+    langchain_openai.ChatOpenAI = CannedChatModel
+
+    # context_packer counts prompt tokens with tiktoken, which downloads its encodings
+    import tiktoken
+    tokenizer = WordTokenizer()
+    tiktoken.encoding_for_model = lambda model: tokenizer
+    tiktoken.get_encoding = lambda name: tokenizer
+
+    s3_client = LocalS3Client(workdir / "s3", s3_latency)
+    import boto3
+    boto3.client = lambda service, *args, **kwargs: s3_client
+
+    if metadata_backend == "sqlite":
+        from local_store import get_local_store
+        return get_local_store()
+    return db
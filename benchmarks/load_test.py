@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# benchmarks/load_test.py - Concurrent volunteer sessions against the FastAPI/Gradio app
+#
+# Usage:
+#   python -m benchmarks.load_test                                   # ramp 1 5 10 25 50 users
+#   python -m benchmarks.load_test --users 10 25 50 100 --chat-latency-ms 6000 --step-seconds 120
+#   python -m benchmarks.load_test --url http://staging:8001 --users 5 10   # an already running app
+#
+# Every virtual user is a browser session: it signs in (landing page, Gradio config, initial
+# load), lists its conversations, reopens the latest one or starts a new one, sends messages
+# and rates each answer, then opens the conversation again. Requests go over HTTP through the
+# Gradio queue, so GRADIO_CONCURRENCY_LIMIT and the worker thread pool are part of what is
+# measured. By default the app runs in-process with the stand-ins from benchmarks/fakes.py.
+#
+# Each concurrency step reports throughput, per-action latency percentiles, errors and
+# requests that would have exceeded the nginx proxy_read_timeout (--timeout-seconds).
+import sys
+import json
+import time
+import random
+import socket
+import platform
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from benchmarks.fakes import install_fakes
+from benchmarks.reporting import RESULTS_DIR, summarize, git_commit, compare_reports
+from benchmarks.run_benchmarks import (
+    ADMIN_EMAIL, topic_vocabulary, write_documents, make_queries, seed_directory
+)
+
+REPORT_VERSION = 1
+
+FEEDBACK_CHOICES = ["✅ Fully", "⚠️ Partially", "❌ Nopes"]
+# Partially/Nopes are only accepted with remarks
+FEEDBACK_REMARKS = "Load test: the answer missed part of the question."
+# Assistant replies ui_service produces instead of an answer
+FAILED_REPLY_PREFIXES = ("Error", "Please log in", "Access denied")
+
+def load_user_email(i: int) -> str:
+    return f"bench.user{i:04d}@example.org"
+
+# ========== IN-PROCESS APP ==========
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_app(port: int):
+    """Serve main.app with uvicorn on a background thread"""
+    import uvicorn
+    import main
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True, name="load-test-app").start()
+    while not server.started:
+        time.sleep(0.1)
+    return server
+
+def seed_corpus(args, rng: random.Random, vocabulary) -> int:
+    """Index generated common knowledge documents so chat turns retrieve real chunks"""
+    from file_services import enhanced_file_service
+    from rag_service import rag_service
+
+    paths = write_documents(Path(args.workdir) / "uploads", rng, vocabulary, 0, args.corpus_docs, args.doc_chars)
+    for i in range(0, len(paths), 25):
+        enhanced_file_service.upload_common_knowledge_files(paths[i:i + 25], ADMIN_EMAIL)
+    return rag_service.get_common_knowledge_vectorstore()._collection.count()
+
+# ========== VIRTUAL USERS ==========
+
+class LoadStats:
+    """Latency samples and failures per action for one concurrency step"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.timeouts: Dict[str, int] = {}
+        self.error_messages: Dict[str, int] = {}
+        self.sessions = 0
+
+    def record(self, action: str, seconds: Optional[float], error: Optional[str] = None, timed_out: bool = False):
+        with self._lock:
+            self.samples.setdefault(action, [])
+            if seconds is not None:
+                self.samples[action].append(seconds)
+            if timed_out:
+                self.timeouts[action] = self.timeouts.get(action, 0) + 1
+            elif error:
+                self.errors[action] = self.errors.get(action, 0) + 1
+                message = f"{action}: {error[:120]}"
+                self.error_messages[message] = self.error_messages.get(message, 0) + 1
+
+    def session_done(self):
+        with self._lock:
+            self.sessions += 1
+
+    def report(self, elapsed: float) -> Dict:
+        with self._lock:
+            actions = {}
+            total_requests = total_failures = 0
+            for action, samples in self.samples.items():
+                errors = self.errors.get(action, 0)
+                timeouts = self.timeouts.get(action, 0)
+                requests = len(samples) + errors + timeouts
+                total_requests += requests
+                total_failures += errors + timeouts
+                actions[action] = {
+                    **summarize(samples),
+                    "errors": errors,
+                    "timeouts": timeouts,
+                    "error_rate": round((errors + timeouts) / requests, 4) if requests else 0.0
+                }
+
+            messages = len(self.samples.get("send_message", []))
+            top_errors = sorted(self.error_messages.items(), key=lambda item: -item[1])[:5]
+            return {
+                "seconds": round(elapsed, 1),
+                "sessions": self.sessions,
+                "requests": total_requests,
+                "requests_per_second": round(total_requests / elapsed, 2) if elapsed else None,
+                "messages_per_second": round(messages / elapsed, 3) if elapsed else None,
+                "error_rate": round(total_failures / total_requests, 4) if total_requests else 0.0,
+                "actions": actions,
+                "top_errors": [{"error": message, "count": count} for message, count in top_errors]
+            }
+
+
+class VirtualUser:
+    """One signed-in volunteer repeating realistic chat sessions until the step ends"""
+
+    def __init__(self, base_url: str, cookie_header: str, queries: List[str], args,
+                 stats: LoadStats, rng: random.Random):
+        self.base_url = base_url.rstrip("/")
+        self.cookie_header = cookie_header
+        self.queries = queries
+        self.args = args
+        self.stats = stats
+        self.rng = rng
+
+    def _think(self):
+        if self.args.think_ms:
+            time.sleep(self.rng.uniform(0.5, 1.5) * self.args.think_ms / 1000)
+
+    def _timed(self, action: str, fn):
+        """Run one request; None when it failed or ran past the proxy timeout"""
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except FutureTimeoutError:
+            self.stats.record(action, None, timed_out=True)
+            return None
+        except Exception as e:
+            self.stats.record(action, None, error=f"{type(e).__name__}: {e}")
+            return None
+        self.stats.record(action, time.perf_counter() - started)
+        return result
+
+    def _predict(self, client, api_name: str, *inputs):
+        job = client.submit(*inputs, api_name=api_name)
+        try:
+            return job.result(timeout=self.args.timeout_seconds)
+        except FutureTimeoutError:
+            job.cancel()
+            raise
+
+    def _login(self):
+        import httpx
+        from gradio_client import Client
+
+        headers = {"Cookie": self.cookie_header}
+        response = httpx.get(f"{self.base_url}/", headers=headers, timeout=self.args.timeout_seconds)
+        if response.status_code != 307 or "/gradio" not in response.headers.get("location", ""):
+            raise RuntimeError(f"landing page returned {response.status_code} instead of the app redirect")
+
+        client = Client(f"{self.base_url}/gradio/", headers=headers, verbose=False,
+                        httpx_kwargs={"timeout": self.args.timeout_seconds})
+        self._predict(client, "/get_initial_visibility")
+        return client
+
+    def run_session(self):
+        client = self._timed("login", self._login)
+        if client is None:
+            return
+
+        try:
+            self._think()
+            sessions = self._timed("list_conversations",
+                                   lambda: self._predict(client, "/refresh_current_user_chats"))
+            conversation_ids = [choice[1] for choice in (sessions or {}).get("choices", [])]
+
+            history = []
+            if conversation_ids and self.rng.random() < self.args.resume_ratio:
+                self._think()
+                loaded = self._timed("load_history",
+                                     lambda: self._predict(client, "/safe_load_conversation", conversation_ids[0]))
+                if loaded is None:
+                    return
+                history = loaded[0]
+            elif len(conversation_ids) >= self.args.max_conversations:
+                # Stay under MAX_SESSIONS_PER_USER the way a volunteer would: drop the oldest chat
+                self._timed("delete_conversation",
+                            lambda: self._predict(client, "/safe_delete_conversation", conversation_ids[-1]))
+
+            conversation_id = None
+            for _ in range(self.args.messages_per_session):
+                self._think()
+                query = self.rng.choice(self.queries)
+                result = self._timed("send_message", lambda: self._predict(
+                    client, "/send_message_with_radio_disable", query, history
+                ))
+                if result is None:
+                    return
+                history = result[0]
+                reply = history[-1]["content"] if history else ""
+                if isinstance(reply, str) and reply.startswith(FAILED_REPLY_PREFIXES):
+                    self.stats.record("send_message", None, error=reply)
+                    return
+                conversation_id = (result[2] or {}).get("value") or conversation_id
+
+                self._think()
+                rating = self.rng.choice(FEEDBACK_CHOICES)
+                remarks = "" if rating == FEEDBACK_CHOICES[0] else FEEDBACK_REMARKS
+                rated = self._timed("feedback", lambda: self._predict(
+                    client, "/handle_feedback_submission", rating, remarks, history
+                ))
+                if rated is None:
+                    return
+
+            if conversation_id:
+                self._think()
+                self._timed("load_history", lambda: self._predict(client, "/safe_load_conversation", conversation_id))
+            self.stats.session_done()
+        finally:
+            client.close()
+
+    def run_until(self, deadline: float):
+        while time.perf_counter() < deadline:
+            self.run_session()
+
+# ========== RAMP ==========
+
+def run_step(users: int, base_url: str, cookies: List[str], queries: List[str], args, seed: int) -> Dict:
+    stats = LoadStats()
+    started = time.perf_counter()
+    deadline = started + args.step_seconds
+    threads = []
+    for i in range(users):
+        user = VirtualUser(base_url, cookies[i], queries, args, stats, random.Random(seed + i))
+        thread = threading.Thread(target=user.run_until, args=(deadline,), daemon=True, name=f"vu-{i}")
+        thread.start()
+        threads.append(thread)
+        if args.spawn_rate:
+            time.sleep(1 / args.spawn_rate)
+
+    # Users finish the session they are in; a stuck request gives up after the proxy timeout
+    for thread in threads:
+        thread.join()
+    return {"users": users, **stats.report(time.perf_counter() - started)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-user load test for the chat path")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 5, 10, 25, 50],
+                        help="Concurrent virtual users per step (ramped in this order)")
+    parser.add_argument("--step-seconds", type=float, default=60, help="Duration of each step")
+    parser.add_argument("--spawn-rate", type=float, default=5, help="Users started per second within a step")
+    parser.add_argument("--messages-per-session", type=int, default=3)
+    parser.add_argument("--resume-ratio", type=float, default=0.5,
+                        help="Share of sessions that reopen their latest conversation")
+    parser.add_argument("--max-conversations", type=int, default=8,
+                        help="Delete the oldest chat before starting another beyond this many")
+    parser.add_argument("--think-ms", type=float, default=1500, help="Mean pause between a user's actions")
+    parser.add_argument("--timeout-seconds", type=float, default=300,
+                        help="Requests slower than this count as timeouts (nginx proxy_read_timeout)")
+    parser.add_argument("--stop-error-rate", type=float, default=0.5,
+                        help="Stop ramping once a step fails more requests than this")
+    parser.add_argument("--url", help="Load an already running app instead of starting one with stand-ins")
+    parser.add_argument("--workdir", default="/tmp/sevabot-load-test",
+                        help="Scratch directory for the in-process app (wiped at start)")
+    parser.add_argument("--corpus-docs", type=int, default=100)
+    parser.add_argument("--doc-chars", type=int, default=6000)
+    parser.add_argument("--departments", type=int, default=12)
+    parser.add_argument("--chat-latency-ms", type=float, default=3000, help="Canned chat model delay")
+    parser.add_argument("--embedding-latency-ms", type=float, default=150, help="Delay per embedding call")
+    parser.add_argument("--supabase-latency-ms", type=float, default=15, help="Delay per Supabase query")
+    parser.add_argument("--s3-latency-ms", type=float, default=20, help="Delay per S3 request")
+    parser.add_argument("--s3", action="store_true", help="Run with USE_S3_STORAGE=true against the local S3 stand-in")
+    parser.add_argument("--metadata", choices=["supabase", "sqlite"], default="supabase",
+                        help="Supabase stand-in, or the real local SQLite metadata store")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Report path (default: benchmarks/results/load-<run_id>.json)")
+    parser.add_argument("--compare", help="Earlier load report to diff against")
+    args = parser.parse_args()
+
+    max_users = max(args.users)
+    rng = random.Random(args.seed)
+    vocabulary = topic_vocabulary(rng)
+    run_id = "load-" + datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    if args.url:
+        base_url = args.url
+        corpus_chunks = None
+    else:
+        db = install_fakes(
+            Path(args.workdir), use_s3=args.s3,
+            chat_latency=args.chat_latency_ms / 1000,
+            embedding_latency=args.embedding_latency_ms / 1000,
+            supabase_latency=args.supabase_latency_ms / 1000,
+            s3_latency=args.s3_latency_ms / 1000,
+            metadata_backend=args.metadata
+        )
+        seed_directory(db, max_users, args.departments)
+
+        print(f"📚 Indexing {args.corpus_docs} common knowledge documents...")
+        corpus_chunks = seed_corpus(args, rng, vocabulary)
+        port = _free_port()
+        start_app(port)
+        base_url = f"http://127.0.0.1:{port}"
+
+    import itsdangerous
+    import config
+    from constants import SESSION_SALT
+
+    # The same signed cookie the OAuth callback would set; the app trusts it without Google
+    serializer = itsdangerous.URLSafeSerializer(config.COOKIE_SECRET, salt=SESSION_SALT)
+    cookies = [
+        f"{config.COOKIE_NAME}=" + serializer.dumps({
+            "email": load_user_email(i), "user_id": f"00000000-0000-0000-0000-{i + 3:012d}",
+            "name": f"Bench User{i:04d}", "role": "user"
+        })
+        for i in range(max_users)
+    ]
+    queries = make_queries(rng, vocabulary, 48)
+
+    print(f"🎯 Target {base_url} (Gradio concurrency {config.GRADIO_CONCURRENCY_LIMIT}, "
+          f"{config.UVICORN_WORKERS} worker(s))")
+    steps = []
+    for step, users in enumerate(args.users):
+        print(f"\n▶ {users} concurrent users for {args.step_seconds:.0f}s")
+        result = run_step(users, base_url, cookies, queries, args, args.seed + step * 1000)
+        steps.append(result)
+        send = result["actions"].get("send_message", {})
+        print(f"  {result['sessions']} sessions, {result['requests_per_second']} req/s, "
+              f"{result['messages_per_second']} msg/s, send p50 {send.get('p50_ms')} ms "
+              f"p99 {send.get('p99_ms')} ms, errors {result['error_rate']:.1%}, "
+              f"timeouts {sum(a['timeouts'] for a in result['actions'].values())}")
+        if result["error_rate"] > args.stop_error_rate:
+            print(f"  ⛔ error rate above {args.stop_error_rate:.0%}, stopping the ramp")
+            break
+
+    # Highest step where no request failed or hit the proxy timeout
+    healthy = [s["users"] for s in steps if s["error_rate"] == 0]
+    report = {
+        "report_version": REPORT_VERSION,
+        "run_id": run_id,
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "arguments": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "config": {
+            "target": "external" if args.url else "in-process stand-ins",
+            "gradio_concurrency_limit": config.GRADIO_CONCURRENCY_LIMIT,
+            "uvicorn_workers": config.UVICORN_WORKERS,
+            "metadata_backend": config.METADATA_BACKEND,
+            "chat_model": config.CHAT_MODEL,
+            "top_k": config.TOP_K,
+            "corpus_chunks": corpus_chunks
+        },
+        "results": {
+            "max_users_without_errors": max(healthy) if healthy else 0,
+            "steps": steps
+        }
+    }
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{run_id}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\n✅ Report written to {output}")
+
+    if args.compare:
+        compare_reports(json.loads(Path(args.compare).read_text(encoding="utf-8")), report)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
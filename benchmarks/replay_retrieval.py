@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# benchmarks/replay_retrieval.py - Replay logged user queries against common knowledge index variants
+#
+# Usage:
+#   python -m benchmarks.replay_retrieval                                  # current config
+#   python -m benchmarks.replay_retrieval --top-k 4 6 8 --retrieval-mode similarity mmr
+#   python -m benchmarks.replay_retrieval --chunk-size 600 1000 --dimensions 512 1536
+#
+# Queries and the documents cited for them come from sevabot_call_logs.json (one JSON object
+# per line, written by cost_logger.py). Every combination of the given options is searched
+# with the same query embeddings and reported with retrieval latency, packed prompt tokens and
+# overlap between the packed documents and the logged ones. This uses the real embedding API
+# and index, not the offline fakes.
+#
+# The live index is used when chunk size and dimensions match the config, an existing
+# rag_index/dim_<n> index when one was built by the embedding migration, otherwise a scratch
+# index under --workdir (truncated copy of the live vectors, or re-chunked and re-embedded
+# source documents). Scratch indexes are kept between runs unless --rebuild is given.
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from config import (
+    TOP_K, CHUNK_SIZE, CHUNK_OVERLAP, RETRIEVAL_MODE, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS,
+    EMBEDDING_MODEL_DIMENSIONS, RAG_INDEX_PATH, COMMON_KNOWLEDGE_PATH, USE_S3_STORAGE,
+    CONTEXT_TOKEN_BUDGET
+)
+from langchain_chroma import Chroma
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from rag_service import rag_service
+from context_packer import pack_context
+from vector_backends import copy_collection, truncate_embeddings, dimension_index_path
+from benchmarks.reporting import RESULTS_DIR, summarize, git_commit, compare_reports
+
+REPORT_VERSION = 1
+DEFAULT_LOG = Path(__file__).resolve().parent.parent / "sevabot_call_logs.json"
+DEFAULT_WORKDIR = RESULTS_DIR / "replay_indexes"
+SUPPORTED_EXTENSIONS = {".txt", ".md", ".pdf", ".docx"}
+
+# ========== QUERY LOG ==========
+
+def load_query_log(path: Path, limit: int = 0) -> List[Dict]:
+    """Logged queries with the documents cited for them (later duplicates of a query win)"""
+    entries = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("query"):
+                entries[record["query"]] = record
+    records = list(entries.values())
+    return records[:limit] if limit else records
+
+# ========== INDEX VARIANTS ==========
+
+def _model_dimensions(dimensions: int) -> int:
+    return dimensions or EMBEDDING_MODEL_DIMENSIONS.get(EMBEDDING_MODEL, 0)
+
+def _scratch_store(path: Path, embeddings, rebuild: bool) -> Tuple[Chroma, bool]:
+    """Local Chroma store under the workdir; second value says whether it still needs filling"""
+    if rebuild and path.exists():
+        shutil.rmtree(path)
+    path.mkdir(parents=True, exist_ok=True)
+    store = Chroma(persist_directory=str(path), embedding_function=embeddings,
+                   collection_name="common_knowledge")
+    return store, store._collection.count() == 0
+
+def _common_source_documents() -> List[Tuple[str, list]]:
+    """(file name, loaded pages) for every common knowledge file, from S3 or local disk"""
+    documents = []
+    if USE_S3_STORAGE:
+        from s3_storage import s3_storage
+        for file_info in s3_storage.list_common_knowledge_files():
+            file_name = file_info["file_name"]
+            with tempfile.TemporaryDirectory() as temp_dir:
+                temp_path = Path(temp_dir) / file_name
+                if s3_storage.download_common_knowledge_file(file_name, str(temp_path)):
+                    docs, used_ocr = rag_service.load_document(str(temp_path))
+                    if docs and not used_ocr:
+                        documents.append((file_name, docs))
+    else:
+        for file_path in sorted(Path(COMMON_KNOWLEDGE_PATH).iterdir()):
+            if file_path.is_file() and file_path.suffix.lower() in SUPPORTED_EXTENSIONS:
+                docs, used_ocr = rag_service.load_document(str(file_path))
+                if docs and not used_ocr:
+                    documents.append((file_path.name, docs))
+    return documents
+
+def open_index(chunk_size: int, dimensions: int, workdir: Path, rebuild: bool, source_cache: Dict):
+    """(vector store, embeddings, description) for one chunk size / embedding size"""
+    embeddings = rag_service.create_embeddings(dimensions)
+    same_dimensions = _model_dimensions(dimensions) == _model_dimensions(EMBEDDING_DIMENSIONS)
+
+    if chunk_size == CHUNK_SIZE:
+        if same_dimensions:
+            return rag_service.get_common_knowledge_vectorstore(), rag_service.embeddings, "live index"
+
+        migrated = dimension_index_path(RAG_INDEX_PATH, dimensions) / "common_knowledge"
+        if (migrated / "chroma.sqlite3").exists():
+            store = Chroma(persist_directory=str(migrated), embedding_function=embeddings,
+                           collection_name="common_knowledge")
+            if store._collection.count():
+                return store, embeddings, f"migrated index {migrated}"
+
+    store, empty = _scratch_store(workdir / f"cs{chunk_size}_d{dimensions}", embeddings, rebuild)
+    if not empty:
+        return store, embeddings, "scratch index (reused)"
+
+    if chunk_size == CHUNK_SIZE:
+        live = rag_service.get_common_knowledge_vectorstore()._collection
+        source_dimensions = _model_dimensions(EMBEDDING_DIMENSIONS)
+        if (EMBEDDING_MODEL.startswith("text-embedding-3") and dimensions
+                and source_dimensions and dimensions < source_dimensions):
+            copy_collection(live, store._collection,
+                            transform_embeddings=lambda batch: truncate_embeddings(batch["embeddings"], dimensions))
+            return store, embeddings, "scratch index (truncated live vectors)"
+        copy_collection(live, store._collection,
+                        transform_embeddings=lambda batch: embeddings.embed_documents(batch["documents"]))
+        return store, embeddings, "scratch index (re-embedded live chunks)"
+
+    if "documents" not in source_cache:
+        print("Loading common knowledge source documents...")
+        source_cache["documents"] = _common_source_documents()
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=min(CHUNK_OVERLAP, chunk_size // 5),
+        length_function=len,
+        separators=["\n\n", "\n", ". ", " ", ""]
+    )
+    for file_name, docs in source_cache["documents"]:
+        chunks = rag_service._create_chunks(docs, file_name, is_common=True, text_splitter=text_splitter)
+        rag_service._index_chunks_batch(store, chunks)
+    return store, embeddings, "scratch index (re-chunked source documents)"
+
+# ========== REPLAY ==========
+
+def _overlap(logged: List[str], replayed: List[str]) -> Dict:
+    logged_set, replayed_set = set(logged), set(replayed)
+    shared = len(logged_set & replayed_set)
+    return {
+        "recall": shared / len(logged_set) if logged_set else None,
+        "precision": shared / len(replayed_set) if replayed_set else None
+    }
+
+def _mean(values: List) -> float:
+    values = [v for v in values if v is not None]
+    return round(sum(values) / len(values), 4) if values else None
+
+def replay_variant(vectorstore, records: List[Dict], query_embeddings: List[List[float]],
+                   top_k: int, mode: str, repeats: int) -> Dict:
+    latencies, prompt_tokens, chunks_used, recalls, precisions = [], [], [], [], []
+    per_query = []
+
+    for record, query_embedding in zip(records, query_embeddings):
+        query = record["query"]
+        for _ in range(repeats):
+            started = time.perf_counter()
+            results = rag_service.search_vectorstore(vectorstore, query, top_k, mode, query_embedding)
+            latencies.append(time.perf_counter() - started)
+
+        packed = pack_context(results, [], query)
+        overlap = _overlap(record.get("document_names") or [], packed["document_names"])
+        prompt_tokens.append(packed["prompt_tokens"])
+        chunks_used.append(packed["chunks_used"])
+        recalls.append(overlap["recall"])
+        precisions.append(overlap["precision"])
+        per_query.append({
+            "query": query,
+            "prompt_tokens": packed["prompt_tokens"],
+            "logged_input_tokens": record.get("input_tokens"),
+            "documents": packed["document_names"],
+            **overlap
+        })
+
+    ordered_tokens = sorted(prompt_tokens)
+    return {
+        "retrieval": summarize(latencies),
+        "prompt_tokens": {
+            "mean": _mean(prompt_tokens),
+            "p50": ordered_tokens[len(ordered_tokens) // 2] if ordered_tokens else None,
+            "max": ordered_tokens[-1] if ordered_tokens else None
+        },
+        "chunks_used_mean": _mean(chunks_used),
+        "document_recall": _mean(recalls),
+        "document_precision": _mean(precisions),
+        "queries": per_query
+    }
+
+def run_replay(args) -> Dict:
+    records = load_query_log(Path(args.log), args.limit)
+    if not records:
+        print(f"No queries found in {args.log}")
+        sys.exit(1)
+
+    logged = {
+        "queries": len(records),
+        "input_tokens_mean": _mean([r.get("input_tokens") for r in records]),
+        "documents_cited_mean": _mean([len(r.get("document_names") or []) for r in records]),
+        "top_k": sorted({r["top_k_retrieved"] for r in records if r.get("top_k_retrieved")})
+    }
+    print(f"Replaying {len(records)} logged queries (logged prompt mean {logged['input_tokens_mean']} tokens)")
+
+    workdir = Path(args.workdir)
+    source_cache = {}
+    results = {"logged": logged, "indexes": {}, "variants": []}
+
+    for dimensions in args.dimensions:
+        # One embedding call per query and embedding size, shared by every variant below
+        embeddings = rag_service.create_embeddings(dimensions)
+        embedding_latencies, query_embeddings = [], []
+        for record in records:
+            started = time.perf_counter()
+            query_embeddings.append(embeddings.embed_query(record["query"]))
+            embedding_latencies.append(time.perf_counter() - started)
+
+        for chunk_size in args.chunk_size:
+            vectorstore, _, description = open_index(chunk_size, dimensions, workdir, args.rebuild, source_cache)
+            index_key = f"cs{chunk_size}_d{dimensions}"
+            results["indexes"][index_key] = {
+                "source": description,
+                "vectors": vectorstore._collection.count(),
+                "query_embedding": summarize(embedding_latencies)
+            }
+            print(f"  {index_key}: {description}, {results['indexes'][index_key]['vectors']} vectors")
+
+            for top_k, mode in itertools.product(args.top_k, args.retrieval_mode):
+                variant = replay_variant(vectorstore, records, query_embeddings, top_k, mode, args.repeats)
+                variant = {"index": index_key, "chunk_size": chunk_size, "dimensions": dimensions,
+                           "top_k": top_k, "retrieval_mode": mode, **variant}
+                results["variants"].append(variant)
+                print(f"    top_k={top_k:<3} {mode:<10} p50 {variant['retrieval'].get('p50_ms')} ms, "
+                      f"prompt {variant['prompt_tokens']['mean']} tokens, "
+                      f"doc recall {variant['document_recall']}, precision {variant['document_precision']}")
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay logged queries against retrieval configurations")
+    parser.add_argument("--log", default=str(DEFAULT_LOG), help="JSONL query log from cost_logger.py")
+    parser.add_argument("--limit", type=int, default=0, help="Replay only the first N distinct queries")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[TOP_K])
+    parser.add_argument("--retrieval-mode", nargs="+", choices=["similarity", "mmr"], default=[RETRIEVAL_MODE])
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[CHUNK_SIZE])
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[EMBEDDING_DIMENSIONS],
+                        help="Embedding size (0 = model default)")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed searches per query and variant")
+    parser.add_argument("--workdir", default=str(DEFAULT_WORKDIR), help="Where scratch indexes are kept")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild scratch indexes")
+    parser.add_argument("--output", help="Report path (default benchmarks/results/replay-<run_id>.json)")
+    parser.add_argument("--compare", help="Earlier replay report to diff against")
+    args = parser.parse_args()
+
+    run_id = "replay-" + datetime.now().strftime("%Y%m%d-%H%M%S")
+    results = run_replay(args)
+
+    report = {
+        "report_version": REPORT_VERSION,
+        "run_id": run_id,
+        "git_commit": git_commit(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "config": {
+            "EMBEDDING_MODEL": EMBEDDING_MODEL,
+            "EMBEDDING_DIMENSIONS": EMBEDDING_DIMENSIONS,
+            "CHUNK_SIZE": CHUNK_SIZE,
+            "CHUNK_OVERLAP": CHUNK_OVERLAP,
+            "TOP_K": TOP_K,
+            "RETRIEVAL_MODE": RETRIEVAL_MODE,
+            "CONTEXT_TOKEN_BUDGET": CONTEXT_TOKEN_BUDGET
+        },
+        "results": results
+    }
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{run_id}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nReport written to {output}")
+
+    if args.compare:
+        compare_reports(json.loads(Path(args.compare).read_text()), report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# benchmarks/reporting.py - Latency summaries and report comparison shared by the benchmark scripts
+import time
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Callable
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+def summarize(samples: List[float]) -> Dict:
+    """Latency summary in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def _pct(p):
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": _pct(50),
+        "p95_ms": _pct(95),
+        "p99_ms": _pct(99),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+def time_calls(fn: Callable, iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).parent, timeout=10
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+def flatten(data, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            flat.update(flatten(value, f"{prefix}.{key}" if prefix else key))
+    elif isinstance(data, list):
+        for i, value in enumerate(data):
+            flat.update(flatten(value, f"{prefix}[{i}]"))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        flat[prefix] = data
+    return flat
+
+def compare_reports(baseline: Dict, current: Dict):
+    """Print relative change of every numeric result present in both reports"""
+    before = flatten(baseline.get("results", {}))
+    after = flatten(current.get("results", {}))
+    print(f"\nComparison with {baseline.get('run_id')} ({baseline.get('git_commit')}):")
+    for key in sorted(before.keys() & after.keys()):
+        if before[key] == after[key]:
+            continue
+        change = f"{(after[key] - before[key]) / before[key] * 100:+.1f}%" if before[key] else "new"
+        print(f"  {key}: {before[key]} -> {after[key]} ({change})")
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# benchmarks/run_benchmarks.py - End-to-end performance benchmark against offline stand-ins
+#
+# Usage:
+#   python -m benchmarks.run_benchmarks                          # default corpus steps, JSON report
+#   python -m benchmarks.run_benchmarks --corpus-docs 50 200 800 --chat-latency-ms 800
+#   python -m benchmarks.run_benchmarks --s3 --compare benchmarks/results/<earlier>.json
+#
+# OpenAI, Supabase and S3 are replaced by the deterministic fakes in benchmarks/fakes.py,
+# so runs on the same machine with the same arguments are comparable. The report is
+# written to benchmarks/results/<run_id>.json.
+import sys
+import asyncio
+import json
+import time
+import random
+import platform
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.fakes import install_fakes, HashEmbeddings, CannedChatModel
+from benchmarks.reporting import (
+    RESULTS_DIR, summarize, time_calls, git_commit, compare_reports
+)
+
+REPORT_VERSION = 1
+
+TOPICS = [
+    "volunteer", "kitchen", "accommodation", "transport", "medical", "finance",
+    "security", "gardening", "library", "events", "housekeeping", "procurement"
+]
+FILLER_WORDS = (
+    "the a of to and in for is on with as by at from that this be are it or "
+    "must should may all each every team process request approval schedule"
+).split()
+
+ADMIN_EMAIL = "bench.admin@example.org"
+SPOC_EMAIL = "bench.spoc@example.org"
+CHAT_USER_EMAIL = "bench.user@example.org"
+
+# ========== DATA GENERATION ==========
+
+def topic_vocabulary(rng: random.Random) -> Dict[str, List[str]]:
+    """30 pseudo-words per topic so queries have something topical to match"""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return {
+        topic: [topic] + ["".join(rng.choice(letters) for _ in range(rng.randint(5, 9))) for _ in range(29)]
+        for topic in TOPICS
+    }
+
+def generate_document(rng: random.Random, vocabulary: Dict[str, List[str]], topic: str, characters: int) -> str:
+    paragraphs = []
+    length = 0
+    while length < characters:
+        words = [
+            rng.choice(vocabulary[topic]) if rng.random() < 0.35 else rng.choice(FILLER_WORDS)
+            for _ in range(rng.randint(40, 90))
+        ]
+        paragraph = " ".join(words).capitalize() + "."
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return f"# {topic.title()} guidelines\n\n" + "\n\n".join(paragraphs)
+
+def write_documents(directory: Path, rng: random.Random, vocabulary: Dict[str, List[str]],
+                    start: int, count: int, characters: int) -> List[str]:
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(start, start + count):
+        topic = TOPICS[i % len(TOPICS)]
+        path = directory / f"{topic}_guide_{i:05d}.md"
+        path.write_text(generate_document(rng, vocabulary, topic, characters), encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+def make_queries(rng: random.Random, vocabulary: Dict[str, List[str]], count: int) -> List[str]:
+    queries = []
+    for i in range(count):
+        topic = TOPICS[i % len(TOPICS)]
+        words = rng.sample(vocabulary[topic], 5)
+        queries.append(f"What is the process for {topic} regarding {' '.join(words)}?")
+    return queries
+
+def seed_directory(db, users: int, departments: int):
+    """Whitelist, users, departments and SPOC assignments as the admin pages expect them"""
+    db.table("departments").insert([
+        {"name": f"Department {d:02d}", "created_by": ADMIN_EMAIL} for d in range(departments)
+    ]).execute()
+
+    people = [(ADMIN_EMAIL, "admin"), (SPOC_EMAIL, "spoc"), (CHAT_USER_EMAIL, "user")]
+    people += [(f"bench.user{i:04d}@example.org", "user") for i in range(users)]
+    whitelist, directory, assignments = [], [], []
+    for i, (email, role) in enumerate(people):
+        department = f"Department {i % departments:02d}"
+        whitelist.append({"email": email, "role": role, "added_by": ADMIN_EMAIL, "department": department})
+        directory.append({
+            "id": f"00000000-0000-0000-0000-{i:012d}", "email": email,
+            "name": email.split("@")[0].replace(".", " ").title(), "role": role,
+            "metadata": {"department": department}
+        })
+        if role == "user" and i % 3 == 0:
+            assignments.append({"spoc_email": SPOC_EMAIL, "assigned_user_email": email})
+    db.table("email_whitelist").insert(whitelist).execute()
+    db.table("users").insert(directory).execute()
+    db.table("spoc_assignments").insert(assignments).execute()
+
+# ========== SCENARIOS ==========
+
+def bench_ingestion_and_search(args, rng, vocabulary, db) -> Dict:
+    """Grow the common knowledge corpus step by step; time ingestion and search at each size"""
+    import config
+    from file_services import enhanced_file_service
+    from rag_service import rag_service
+
+    upload_dir = Path(args.workdir) / "uploads"
+    queries = make_queries(rng, vocabulary, args.queries)
+    rag_service.search_common_knowledge(queries[0])  # open the collection outside the timings
+
+    steps = []
+    written = 0
+    for target in sorted(args.corpus_docs):
+        paths = write_documents(upload_dir, rng, vocabulary, written, target - written, args.doc_chars)
+        written = target
+
+        chunks_before = rag_service.get_common_knowledge_vectorstore()._collection.count()
+        embed_calls_before = HashEmbeddings.calls
+        queries_before = db.queries
+        started = time.perf_counter()
+        for i in range(0, len(paths), args.upload_batch):
+            enhanced_file_service.upload_common_knowledge_files(paths[i:i + args.upload_batch], ADMIN_EMAIL)
+        elapsed = time.perf_counter() - started
+        chunks = rag_service.get_common_knowledge_vectorstore()._collection.count()
+
+        search_samples = time_calls(lambda q=iter(queries * args.search_rounds): rag_service.search_common_knowledge(next(q)),
+                                    len(queries) * args.search_rounds)
+        steps.append({
+            "corpus_docs": target,
+            "corpus_chunks": chunks,
+            "ingestion": {
+                "docs": len(paths),
+                "chunks": chunks - chunks_before,
+                "seconds": round(elapsed, 3),
+                "docs_per_second": round(len(paths) / elapsed, 2) if elapsed else None,
+                "chunks_per_second": round((chunks - chunks_before) / elapsed, 2) if elapsed else None,
+                "embedding_calls": HashEmbeddings.calls - embed_calls_before,
+                "supabase_queries": db.queries - queries_before
+            },
+            "search": summarize(search_samples)
+        })
+        print(f"📚 {target} docs / {chunks} chunks: "
+              f"{steps[-1]['ingestion']['chunks_per_second']} chunks/s, "
+              f"search p50 {steps[-1]['search']['p50_ms']} ms")
+
+    return {"steps": steps, "retrieval_mode": config.RETRIEVAL_MODE, "top_k": config.TOP_K}
+
+def bench_chat_turns(args, rng, vocabulary, db) -> Dict:
+    """Full send_message_for_user path: conversation rows, history, retrieval, packing, LLM, usage"""
+    from ui_service import ui_service
+    from chat_service import chat_service
+
+    ui_service.set_user({"email": CHAT_USER_EMAIL, "name": "Bench User", "role": "user"},
+                        session_key="benchmark-user")
+    queries = make_queries(rng, vocabulary, args.chat_turns)
+
+    samples = []
+    queries_before = db.queries
+    llm_calls_before = CannedChatModel.calls
+
+    async def _turns():
+        conversation_id = None
+        history = []
+        for i, query in enumerate(queries):
+            if i % args.turns_per_conversation == 0:
+                conversation_id, history = None, []
+            started = time.perf_counter()
+            history, _, conversation_id, *_ = await ui_service.send_message_for_user(query, history, conversation_id)
+            samples.append(time.perf_counter() - started)
+
+    asyncio.run(_turns())
+
+    chat_service._background_executor.submit(lambda: None).result()  # let summary writes drain
+    chat_service.flush_usage_writes()
+    return {
+        "turns": len(samples),
+        "turns_per_conversation": args.turns_per_conversation,
+        "chat_latency_ms": args.chat_latency_ms,
+        "latency": summarize(samples),
+        "supabase_queries_per_turn": round((db.queries - queries_before) / len(samples), 2) if samples else None,
+        "llm_calls": CannedChatModel.calls - llm_calls_before
+    }
+
+def bench_file_lists(args, rng, vocabulary, db) -> Dict:
+    """Files tab: common knowledge list and the user's personal list"""
+    from file_services import enhanced_file_service
+    from ui_service import ui_service
+
+    personal_paths = write_documents(Path(args.workdir) / "personal_uploads", rng, vocabulary,
+                                     0, args.personal_docs, args.doc_chars // 2)
+    enhanced_file_service.upload_user_files(CHAT_USER_EMAIL, personal_paths, CHAT_USER_EMAIL)
+    ui_service.set_user({"email": CHAT_USER_EMAIL, "name": "Bench User", "role": "user"},
+                        session_key="benchmark-user")
+
+    common_rows = len(ui_service.get_common_files_for_display())
+    personal_rows = len(ui_service.get_personal_files_for_display())
+    return {
+        "common_rows": common_rows,
+        "personal_rows": personal_rows,
+        "common": summarize(time_calls(ui_service.get_common_files_for_display, args.page_rounds)),
+        "personal": summarize(time_calls(ui_service.get_personal_files_for_display, args.page_rounds)),
+        "files_tab": summarize(time_calls(ui_service.load_files_tab_data, args.page_rounds))
+    }
+
+def bench_admin_page(args, rng, vocabulary, db) -> Dict:
+    """What an admin's page load and Users/Roles tabs fetch, through the same service calls"""
+    from ui_service import ui_service
+    from user_management import user_management
+
+    ui_service.set_user({"email": ADMIN_EMAIL, "name": "Bench Admin", "role": "admin"},
+                        session_key="benchmark-admin")
+
+    def _page_load():
+        ui_service.load_initial_data()
+        users = user_management.get_all_users()
+        [(user_management.format_user_for_dropdown(u), u["email"]) for u in users]
+
+    def _users_tab():
+        ui_service.load_concurrently({
+            "whitelist": user_management.get_whitelisted_emails_with_roles,
+            "departments": user_management.get_departments,
+            "spocs": user_management.get_spoc_users,
+        })
+
+    def _roles_tab():
+        user_management.get_all_users()
+        user_management.get_users_by_role_simple("spoc")
+        user_management.get_assignments_with_names("ALL")
+
+    def _cold(fn):
+        # The user directory is cached; measure both the first (invalidated) and warm loads
+        def _run():
+            user_management.invalidate_directory()
+            fn()
+        return _run
+
+    queries_before = db.queries
+    _page_load()
+    page_load_queries = db.queries - queries_before
+
+    return {
+        "directory_users": len(db.table("users").select("id").execute().data),
+        "page_load_supabase_queries": page_load_queries,
+        "page_load": summarize(time_calls(_page_load, args.page_rounds)),
+        "page_load_cold": summarize(time_calls(_cold(_page_load), args.page_rounds)),
+        "users_tab": summarize(time_calls(_users_tab, args.page_rounds)),
+        "roles_tab": summarize(time_calls(_roles_tab, args.page_rounds))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmarks for Sevabot")
+    parser.add_argument("--workdir", default="/tmp/sevabot-benchmark",
+                        help="Scratch directory for indexes and files (wiped at start)")
+    parser.add_argument("--corpus-docs", type=int, nargs="+", default=[25, 100, 400],
+                        help="Common knowledge sizes (documents) to ingest and search at")
+    parser.add_argument("--doc-chars", type=int, default=6000, help="Characters per generated document")
+    parser.add_argument("--upload-batch", type=int, default=25, help="Documents per upload call")
+    parser.add_argument("--queries", type=int, default=24, help="Distinct search queries")
+    parser.add_argument("--search-rounds", type=int, default=2, help="Times each query is repeated")
+    parser.add_argument("--chat-turns", type=int, default=20)
+    parser.add_argument("--turns-per-conversation", type=int, default=5)
+    parser.add_argument("--personal-docs", type=int, default=20)
+    parser.add_argument("--users", type=int, default=300, help="Seeded whitelist/users rows")
+    parser.add_argument("--departments", type=int, default=12)
+    parser.add_argument("--page-rounds", type=int, default=20, help="Repetitions for list/page timings")
+    parser.add_argument("--chat-latency-ms", type=float, default=0.0, help="Canned chat model delay")
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0, help="Delay per embedding call")
+    parser.add_argument("--supabase-latency-ms", type=float, default=2.0, help="Delay per Supabase query")
+    parser.add_argument("--s3-latency-ms", type=float, default=2.0, help="Delay per S3 request")
+    parser.add_argument("--s3", action="store_true", help="Run with USE_S3_STORAGE=true against the local S3 stand-in")
+    parser.add_argument("--metadata", choices=["supabase", "sqlite"], default="supabase",
+                        help="Supabase stand-in, or the real local SQLite metadata store")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Report path (default: benchmarks/results/<run_id>.json)")
+    parser.add_argument("--compare", help="Earlier report to diff against")
+    args = parser.parse_args()
+
+    db = install_fakes(
+        Path(args.workdir), use_s3=args.s3,
+        chat_latency=args.chat_latency_ms / 1000,
+        embedding_latency=args.embedding_latency_ms / 1000,
+        supabase_latency=args.supabase_latency_ms / 1000,
+        s3_latency=args.s3_latency_ms / 1000,
+        metadata_backend=args.metadata
+    )
+    seed_directory(db, args.users, args.departments)
+
+    import config
+    from tracing import get_stage_percentiles
+    rng = random.Random(args.seed)
+    vocabulary = topic_vocabulary(rng)
+    run_id = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    results = {}
+    for name, scenario in (
+        ("ingestion_and_search", bench_ingestion_and_search),
+        ("chat_turn", bench_chat_turns),
+        ("file_lists", bench_file_lists),
+        ("admin_page", bench_admin_page),
+    ):
+        print(f"\n▶ {name}")
+        started = time.perf_counter()
+        results[name] = scenario(args, rng, vocabulary, db)
+        print(f"  done in {time.perf_counter() - started:.1f}s")
+
+    report = {
+        "report_version": REPORT_VERSION,
+        "run_id": run_id,
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "arguments": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "config": {
+            "chat_model": config.CHAT_MODEL,
+            "embedding_model": config.EMBEDDING_MODEL,
+            "embedding_dimensions": config.EMBEDDING_DIMENSIONS,
+            "chunk_size": config.CHUNK_SIZE,
+            "chunk_overlap": config.CHUNK_OVERLAP,
+            "top_k": config.TOP_K,
+            "retrieval_mode": config.RETRIEVAL_MODE,
+            "common_index_backend": config.COMMON_INDEX_BACKEND,
+            "vector_store_mode": config.VECTOR_STORE_MODE,
+            "metadata_backend": config.METADATA_BACKEND,
+            "context_token_budget": config.CONTEXT_TOKEN_BUDGET
+        },
+        "results": results,
+        "stages": get_stage_percentiles()
+    }
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{run_id}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\n✅ Report written to {output}")
+
+    if args.compare:
+        compare_reports(json.loads(Path(args.compare).read_text(encoding="utf-8")), report)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,11 @@
 # chat_service.py - Clean chat service with common knowledge repository and SPOC access control
+import re
+import asyncio
 import warnings
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -10,21 +15,38 @@ from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 
 from config import (
-    SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, 
-    OPENAI_API_KEY, CHAT_MODEL, TEMPERATURE, TOP_K
+    OPENAI_API_KEY, CHAT_MODEL, TEMPERATURE, TOP_K, EMBEDDING_MODEL,
+    SUMMARY_MODEL, SUMMARY_RECENT_TURNS, SUMMARY_BATCH_TURNS,
+    USAGE_FLUSH_BATCH_SIZE, USAGE_FLUSH_INTERVAL_SECONDS
 )
 from constants import (
-    SYSTEM_PROMPT, MAX_HISTORY_TURNS, MAX_SESSIONS_PER_USER,
+    MAX_SESSIONS_PER_USER, CONVERSATION_SUMMARY_PROMPT, SUMMARY_MAX_WORDS,
+    MODEL_PRICING, EMBEDDING_PRICING, CONVERSATION_CACHE_TTL_SECONDS,
     ERROR_MESSAGES, USER_ROLES
 )
-from supabase import create_client
+from local_store import create_metadata_client, create_async_metadata_client
 from rag_service import rag_service
+from context_packer import pack_context, count_embedding_tokens
+from tracing import span
+from metrics import record_llm_usage
+from write_behind import WriteBehindBuffer
 
 class ChatService:
-    """Manages chat conversations with common knowledge repository and SPOC access control"""
+    """Manages chat conversations with common knowledge repository and SPOC access control
+    
+    Methods prefixed with "a" are async variants for event-loop callers: they await the
+    async metadata client and the chat model's ainvoke(), so a turn waiting on the database
+    or OpenAI holds no worker thread. Both variants build their queries with the same
+    _*_query helpers.
+    
+    Each user's conversation list is cached in-process and kept current by this service's
+    own writes (create, delete, new messages, summaries), so the sidebar refresh after every
+    message does not query the database.
+    """
     
     def __init__(self):
-        self.supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.supabase = create_metadata_client()
+        self._async_supabase = None
         
         # Initialize chat model
         self.chat_model = ChatOpenAI(
@@ -32,24 +54,238 @@ class ChatService:
             model=CHAT_MODEL,
             temperature=TEMPERATURE
         )
+        
+        # Rolling summaries and usage rows are written off the request path
+        self.summary_model = ChatOpenAI(
+            api_key=OPENAI_API_KEY,
+            model=SUMMARY_MODEL,
+            temperature=0
+        )
+        self._background_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-background")
+        self._summaries_in_flight = set()
+        self._summary_lock = threading.Lock()
+        self._usage_buffer = WriteBehindBuffer(
+            self.supabase, "message_usage", USAGE_FLUSH_BATCH_SIZE, USAGE_FLUSH_INTERVAL_SECONDS
+        )
+        
+        self._usage_lock = threading.Lock()
+        self._usage_totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        
+        # user_email -> {"conversations": [...], "loaded_at": ...}, newest first like the query
+        self._conversation_cache: Dict[str, Dict] = {}
+        self._conversation_cache_version = 0
+        self._conversation_cache_lock = threading.Lock()
+    
+    async def _async_client(self):
+        """Async metadata client, created on first use inside the running event loop"""
+        if self._async_supabase is None:
+            client = await create_async_metadata_client()
+            if self._async_supabase is None:
+                self._async_supabase = client
+        return self._async_supabase
+    
+    # ========== QUERIES (shared by the sync and async methods) ==========
+    
+    @staticmethod
+    def _user_conversations_query(db, user_email: str):
+        return db.table("conversations")\
+            .select("*")\
+            .eq("user_id", user_email)\
+            .order("updated_at", desc=True)\
+            .limit(MAX_SESSIONS_PER_USER)
+    
+    @staticmethod
+    def _count_conversations_query(db, user_email: str):
+        return db.table("conversations")\
+            .select("id", count="exact")\
+            .eq("user_id", user_email)\
+            .limit(1)
+    
+    @staticmethod
+    def _insert_conversation_query(db, user_email: str, title: str):
+        conv_data = {
+            "user_id": user_email,
+            "title": title,
+            "created_at": datetime.utcnow().isoformat(),
+            "updated_at": datetime.utcnow().isoformat()
+        }
+        return db.table("conversations").insert(conv_data)
+    
+    @staticmethod
+    def _delete_conversation_queries(db, conversation_id: str, user_email: str):
+        # Messages first (CASCADE in schema would delete them too, but explicit is clearer)
+        return (
+            db.table("messages")
+                .delete()
+                .eq("conversation_id", conversation_id),
+            db.table("conversations")
+                .delete()
+                .eq("id", conversation_id)
+                .eq("user_id", user_email)
+        )
+    
+    @staticmethod
+    def _messages_query(db, conversation_id: str):
+        return db.table("messages")\
+            .select("*")\
+            .eq("conversation_id", conversation_id)\
+            .order("created_at")
+    
+    @staticmethod
+    def _insert_message_query(db, conversation_id: str, role: str, content: str):
+        msg_data = {
+            "conversation_id": conversation_id,
+            "role": role,
+            "content": content,
+            "created_at": datetime.utcnow().isoformat()
+        }
+        return db.table("messages").insert(msg_data)
+    
+    @staticmethod
+    def _insert_turn_query(db, conversation_id: str, user_message: str, assistant_message: str,
+                           user_created_at: str):
+        # The messages_touch_conversation trigger moves conversations.updated_at along
+        rows = [
+            {"conversation_id": conversation_id, "role": "user", "content": user_message,
+             "created_at": user_created_at},
+            {"conversation_id": conversation_id, "role": "assistant", "content": assistant_message,
+             "created_at": datetime.utcnow().isoformat()}
+        ]
+        return db.table("messages").insert(rows)
+    
+    @staticmethod
+    def _assistant_message(rows: Optional[List[Dict]]) -> Optional[Dict]:
+        return next((row for row in rows or [] if row["role"] == "assistant"), None)
+    
+    @staticmethod
+    def _summary_query(db, conversation_id: str):
+        return db.table("conversations")\
+            .select("summary, summarized_turns")\
+            .eq("id", conversation_id)
+    
+    @staticmethod
+    def _touch_conversation_query(db, conversation_id: str):
+        return db.table("conversations")\
+            .update({"updated_at": datetime.utcnow().isoformat()})\
+            .eq("id", conversation_id)
+    
+    @staticmethod
+    def _feedback_query(db, message_id: str, feedback: str):
+        return db.table("messages")\
+            .update({"feedback": feedback})\
+            .eq("id", message_id)
+    
+    @staticmethod
+    def _insert_assignment_query(db, spoc_email: str, assigned_user_email: str):
+        assignment_data = {
+            "spoc_email": spoc_email,
+            "assigned_user_email": assigned_user_email,
+            "created_at": datetime.utcnow().isoformat()
+        }
+        return db.table("spoc_assignments").insert(assignment_data)
+    
+    @staticmethod
+    def _delete_assignment_query(db, spoc_email: str, assigned_user_email: str):
+        return db.table("spoc_assignments")\
+            .delete()\
+            .eq("spoc_email", spoc_email)\
+            .eq("assigned_user_email", assigned_user_email)
+    
+    @staticmethod
+    def _spoc_assignments_query(db, spoc_email: str):
+        return db.table("spoc_assignments")\
+            .select("assigned_user_email")\
+            .eq("spoc_email", spoc_email)
+    
+    @staticmethod
+    def _history_from_messages(messages: List[Dict]) -> List[Tuple[str, str]]:
+        """Pair stored messages into (user_msg, assistant_msg) turns"""
+        history = []
+        user_msg = None
+        
+        for msg in messages:
+            if msg["role"] == "user":
+                user_msg = msg["content"]
+            elif msg["role"] == "assistant" and user_msg:
+                history.append((user_msg, msg["content"]))
+                user_msg = None
+        
+        return history
+    
+    # ========== CONVERSATION LIST CACHE ==========
+    
+    def _cached_conversations(self, user_email: str) -> Optional[List[Dict]]:
+        """Copy of the user's cached conversation list, or None on a miss or after the TTL"""
+        with self._conversation_cache_lock:
+            entry = self._conversation_cache.get(user_email)
+            if entry is None or time.time() - entry["loaded_at"] >= CONVERSATION_CACHE_TTL_SECONDS:
+                return None
+            return [dict(conv) for conv in entry["conversations"]]
+    
+    def _cache_conversations(self, user_email: str, conversations: List[Dict], version: int):
+        """Store a freshly queried list unless a conversation write happened while it was loading"""
+        with self._conversation_cache_lock:
+            if version != self._conversation_cache_version:
+                return
+            self._conversation_cache[user_email] = {
+                "conversations": [dict(conv) for conv in conversations],
+                "loaded_at": time.time()
+            }
+    
+    def _cache_write(self, update):
+        """Apply a write-through update to the cached lists"""
+        with self._conversation_cache_lock:
+            self._conversation_cache_version += 1
+            update()
+    
+    def _cache_add_conversation(self, user_email: str, conversation: Dict):
+        def _add():
+            entry = self._conversation_cache.get(user_email)
+            if entry is not None:
+                entry["conversations"] = ([dict(conversation)] + entry["conversations"])[:MAX_SESSIONS_PER_USER]
+        self._cache_write(_add)
+    
+    def _cache_remove_conversation(self, user_email: str, conversation_id: str):
+        def _remove():
+            entry = self._conversation_cache.get(user_email)
+            if entry is not None:
+                entry["conversations"] = [conv for conv in entry["conversations"] if conv["id"] != conversation_id]
+        self._cache_write(_remove)
+    
+    def _cache_update_conversation(self, conversation_id: str, fields: Dict, touched: bool = False):
+        """Patch a cached conversation; touched moves it to the top, as its updated_at is now the newest"""
+        def _update():
+            for entry in self._conversation_cache.values():
+                conversations = entry["conversations"]
+                for i, conv in enumerate(conversations):
+                    if conv["id"] == conversation_id:
+                        conv.update(fields)
+                        if touched:
+                            conversations.insert(0, conversations.pop(i))
+                        break
+        self._cache_write(_update)
+    
+    def invalidate_conversation_cache(self, user_email: Optional[str] = None):
+        """Drop one user's cached list (or all of them) after writes made outside this service"""
+        def _invalidate():
+            if user_email is None:
+                self._conversation_cache.clear()
+            else:
+                self._conversation_cache.pop(user_email, None)
+        self._cache_write(_invalidate)
+    
+    # ========== CONVERSATIONS AND MESSAGES ==========
     
     def create_conversation(self, user_email: str, title: str) -> Optional[str]:
         """Create new conversation"""
         try:
-            sessions = self.get_user_conversations(user_email)
-            if len(sessions) >= MAX_SESSIONS_PER_USER:
+            if self.count_user_conversations(user_email) >= MAX_SESSIONS_PER_USER:
                 return None
             
-            conv_data = {
-                "user_id": user_email,
-                "title": title,
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
-            }
-            
-            result = self.supabase.table("conversations").insert(conv_data).execute()
+            result = self._insert_conversation_query(self.supabase, user_email, title).execute()
             
             if result.data:
+                self._cache_add_conversation(user_email, result.data[0])
                 return result.data[0]["id"]
             return None
             
@@ -58,29 +294,42 @@ class ChatService:
             return None
     
     def get_user_conversations(self, user_email: str) -> List[Dict]:
-        """Get user conversations ordered by most recent"""
+        """Get user conversations ordered by most recent (from the cache when it is warm)"""
+        cached = self._cached_conversations(user_email)
+        if cached is not None:
+            return cached
+        
         try:
-            result = self.supabase.table("conversations")\
-                .select("*")\
-                .eq("user_id", user_email)\
-                .order("updated_at", desc=True)\
-                .limit(MAX_SESSIONS_PER_USER)\
-                .execute()
-            
-            return result.data if result.data else []
+            version = self._conversation_cache_version
+            result = self._user_conversations_query(self.supabase, user_email).execute()
+            conversations = result.data if result.data else []
+            self._cache_conversations(user_email, conversations, version)
+            return conversations
             
         except Exception as e:
             print(f"Error getting conversations: {e}")
             return []
     
+    def count_user_conversations(self, user_email: str) -> int:
+        """Number of conversations the user has (for the MAX_SESSIONS_PER_USER check)"""
+        cached = self._cached_conversations(user_email)
+        # The cached list is capped at MAX_SESSIONS_PER_USER, so it is exact only below the cap
+        if cached is not None and len(cached) < MAX_SESSIONS_PER_USER:
+            return len(cached)
+        
+        try:
+            result = self._count_conversations_query(self.supabase, user_email).execute()
+            return result.count or 0
+            
+        except Exception as e:
+            print(f"Error counting conversations: {e}")
+            return 0
+    
     def get_conversations_for_spoc(self, spoc_email: str) -> List[Dict]:
         """Get conversations for users assigned to a SPOC"""
         try:
             # Get users assigned to this SPOC
-            assigned_users_result = self.supabase.table("spoc_assignments")\
-                .select("assigned_user_email")\
-                .eq("spoc_email", spoc_email)\
-                .execute()
+            assigned_users_result = self._spoc_assignments_query(self.supabase, spoc_email).execute()
             
             if not assigned_users_result.data:
                 return []
@@ -145,18 +394,10 @@ class ChatService:
             else:
                 print("⚠️  S3 archival disabled - deleting without backup")
 
-            # Delete messages (note: CASCADE in schema will auto-delete, but explicit is clearer)
-            self.supabase.table("messages")\
-                .delete()\
-                .eq("conversation_id", conversation_id)\
-                .execute()
-
-            # Delete conversation
-            result = self.supabase.table("conversations")\
-                .delete()\
-                .eq("id", conversation_id)\
-                .eq("user_id", user_email)\
-                .execute()
+            # Delete messages, then the conversation
+            for query in self._delete_conversation_queries(self.supabase, conversation_id, user_email):
+                query.execute()
+            self._cache_remove_conversation(user_email, conversation_id)
 
             print(f"✅ Deleted conversation {conversation_id} from Supabase")
             return True
@@ -168,26 +409,9 @@ class ChatService:
     def get_conversation_history(self, conversation_id: str) -> List[Tuple[str, str]]:
         """Get conversation history as list of (user_msg, assistant_msg) tuples"""
         try:
-            result = self.supabase.table("messages")\
-                .select("*")\
-                .eq("conversation_id", conversation_id)\
-                .order("created_at")\
-                .execute()
-            
-            if not result.data:
-                return []
+            result = self._messages_query(self.supabase, conversation_id).execute()
             
-            history = []
-            user_msg = None
-            
-            for msg in result.data:
-                if msg["role"] == "user":
-                    user_msg = msg["content"]
-                elif msg["role"] == "assistant" and user_msg:
-                    history.append((user_msg, msg["content"]))
-                    user_msg = None
-            
-            return history
+            return self._history_from_messages(result.data or [])
             
         except Exception as e:
             print(f"Error getting conversation history: {e}")
@@ -196,14 +420,7 @@ class ChatService:
     def store_message(self, conversation_id: str, role: str, content: str) -> Optional[str]:
         """Store message and return message ID"""
         try:
-            msg_data = {
-                "conversation_id": conversation_id,
-                "role": role,
-                "content": content,
-                "created_at": datetime.utcnow().isoformat()
-            }
-            
-            result = self.supabase.table("messages").insert(msg_data).execute()
+            result = self._insert_message_query(self.supabase, conversation_id, role, content).execute()
             
             if result.data:
                 return result.data[0]["id"]
@@ -213,13 +430,97 @@ class ChatService:
             print(f"Error storing message: {e}")
             return None
     
-    def update_conversation_timestamp(self, conversation_id: str):
-        """Update conversation's updated_at timestamp"""
+    def commit_turn(self, conversation_id: str, user_message: str, assistant_message: str,
+                    user_created_at: str) -> Optional[str]:
+        """Store a turn's user and assistant messages in one insert; returns the assistant message ID
+        
+        Replaces store_message (twice) and update_conversation_timestamp on the chat path.
+        user_created_at is when the user sent the message, so it sorts before the answer.
+        """
+        try:
+            result = self._insert_turn_query(
+                self.supabase, conversation_id, user_message, assistant_message, user_created_at
+            ).execute()
+            return self._turn_committed(conversation_id, result.data)
+            
+        except Exception as e:
+            print(f"Error storing chat turn: {e}")
+            return None
+    
+    def _turn_committed(self, conversation_id: str, rows: Optional[List[Dict]]) -> Optional[str]:
+        """Mirror the trigger's updated_at bump in the cache; returns the assistant message ID"""
+        assistant = self._assistant_message(rows)
+        if assistant is None:
+            return None
+        self._cache_update_conversation(conversation_id, {"updated_at": assistant["created_at"]}, touched=True)
+        return assistant["id"]
+    
+    def get_conversation_summary(self, conversation_id: str) -> Tuple[str, int]:
+        """Get (rolling summary, number of leading turns it covers) for a conversation"""
         try:
+            result = self._summary_query(self.supabase, conversation_id).execute()
+            
+            if not result.data:
+                return "", 0
+            
+            row = result.data[0]
+            return row.get("summary") or "", row.get("summarized_turns") or 0
+            
+        except Exception as e:
+            print(f"Error getting conversation summary: {e}")
+            return "", 0
+    
+    def schedule_summary_update(self, conversation_id: str):
+        """Fold older turns into the rolling summary in the background"""
+        with self._summary_lock:
+            if conversation_id in self._summaries_in_flight:
+                return
+            self._summaries_in_flight.add(conversation_id)
+        self._background_executor.submit(self._update_summary, conversation_id)
+    
+    def _update_summary(self, conversation_id: str):
+        try:
+            history = self.get_conversation_history(conversation_id)
+            summary, summarized_turns = self.get_conversation_summary(conversation_id)
+            summarized_turns = min(summarized_turns, len(history))
+            
+            # Everything except the last SUMMARY_RECENT_TURNS is eligible; wait for a batch
+            older_turns = history[summarized_turns:max(0, len(history) - SUMMARY_RECENT_TURNS)]
+            if len(older_turns) < SUMMARY_BATCH_TURNS:
+                return
+            
+            turns_text = "\n".join(
+                f"User: {user_msg}\nAssistant: {assistant_msg}" for user_msg, assistant_msg in older_turns
+            )
+            prompt = CONVERSATION_SUMMARY_PROMPT.format(
+                max_words=SUMMARY_MAX_WORDS,
+                summary=summary or "(none yet)",
+                turns=turns_text
+            )
+            response = self.summary_model.invoke([HumanMessage(content=prompt)])
+            
+            fields = {
+                "summary": response.content.strip(),
+                "summarized_turns": summarized_turns + len(older_turns)
+            }
             self.supabase.table("conversations")\
-                .update({"updated_at": datetime.utcnow().isoformat()})\
+                .update(fields)\
                 .eq("id", conversation_id)\
                 .execute()
+            self._cache_update_conversation(conversation_id, fields)
+            
+        except Exception as e:
+            print(f"Error updating conversation summary: {e}")
+        finally:
+            with self._summary_lock:
+                self._summaries_in_flight.discard(conversation_id)
+    
+    def update_conversation_timestamp(self, conversation_id: str):
+        """Update conversation's updated_at timestamp"""
+        try:
+            result = self._touch_conversation_query(self.supabase, conversation_id).execute()
+            if result.data:
+                self._cache_update_conversation(conversation_id, {"updated_at": result.data[0]["updated_at"]}, touched=True)
         except Exception as e:
             print(f"Error updating conversation timestamp: {e}")
     
@@ -229,96 +530,238 @@ class ChatService:
             return "New Chat"
         
         try:
-            title_model = ChatOpenAI(
-                api_key=OPENAI_API_KEY,
-                model="gpt-4o-mini",
-                temperature=0.3
-            )
-            
-            system_msg = SystemMessage(content="Generate a concise 2-4 word title for this conversation. Focus on the main topic. Examples: 'Document Analysis', 'Project Planning', 'Research Query'. No quotes or punctuation.")
-            human_msg = HumanMessage(content=f"Create a title for: {message[:100]}")
-            
-            response = title_model.invoke([system_msg, human_msg])
-            
-            title = response.content.strip()
-            import re
-            title = re.sub(r'[^\w\s]', '', title)
-            words = title.split()[:4]
-            
-            if len(words) >= 2:
-                return ' '.join(words).title()
+            response = self._title_model().invoke(self._title_messages(message))
+            title = self._clean_title(response.content)
+            if title:
+                return title
             
         except Exception as e:
             print(f"Error generating title: {e}")
         
+        return self._fallback_title(message)
+    
+    @staticmethod
+    def _title_model() -> ChatOpenAI:
+        return ChatOpenAI(
+            api_key=OPENAI_API_KEY,
+            model="gpt-4o-mini",
+            temperature=0.3
+        )
+    
+    @staticmethod
+    def _title_messages(message: str) -> List:
+        system_msg = SystemMessage(content="Generate a concise 2-4 word title for this conversation. Focus on the main topic. Examples: 'Document Analysis', 'Project Planning', 'Research Query'. No quotes or punctuation.")
+        human_msg = HumanMessage(content=f"Create a title for: {message[:100]}")
+        return [system_msg, human_msg]
+    
+    @staticmethod
+    def _clean_title(content: str) -> Optional[str]:
+        """2-4 word title from the model output, or None if it is too short to use"""
+        title = re.sub(r'[^\w\s]', '', content.strip())
+        words = title.split()[:4]
+        return ' '.join(words).title() if len(words) >= 2 else None
+    
+    @staticmethod
+    def _fallback_title(message: str) -> str:
         words = message.split()[:3]
         return ' '.join(words).title() if words else "New Chat"
     
-    def create_rag_response(self, query: str, conversation_history: List[Tuple[str, str]]) -> str:
+    def create_rag_response(self, query: str, conversation_history: List[Tuple[str, str]],
+                            summary: str = "") -> str:
         """Create RAG response using common knowledge repository"""
+        response, _ = self.create_rag_response_with_usage(query, conversation_history, summary)
+        return response
+    
+    def create_rag_response_with_usage(self, query: str, conversation_history: List[Tuple[str, str]],
+                                       summary: str = "") -> Tuple[str, Dict]:
+        """Create RAG response and return it with the API token usage (including cached prompt tokens)
+        
+        conversation_history should hold only the turns not already covered by summary.
+        """
         try:
+            started = time.perf_counter()
             search_results = rag_service.search_common_knowledge(query, TOP_K)
+            retrieved = time.perf_counter()
             
             if not search_results:
-                return self._no_documents_response()
-            
-            # Prepare context with CLEAR DOCUMENT NAMES for citation
-            context_parts = []
-            document_names = []
-            
-            for chunk, source, similarity, metadata in search_results:
-                document_name = source if source != 'Unknown' else metadata.get('file_name', 'Unknown Document')
-                context_part = f"[Document: {document_name}]\n{chunk}"
-                context_parts.append(context_part)
-                if document_name not in document_names:
-                    document_names.append(document_name)
-            
-            full_context = "\n\n".join(context_parts)
-            
-            # Prepare conversation context
-            recent_history = conversation_history[-MAX_HISTORY_TURNS:] if conversation_history else []
-            history_context = ""
-            
-            if recent_history:
-                history_parts = []
-                for user_msg, assistant_msg in recent_history:
-                    history_parts.append(f"User: {user_msg}")
-                    history_parts.append(f"Assistant: {assistant_msg}")
-                history_context = "\n".join(history_parts)
-            
-            # Enhanced system message with stronger citation requirements
-            system_content = f"""{SYSTEM_PROMPT}
-
-CONVERSATION HISTORY:
-{history_context}
-
-AVAILABLE DOCUMENTS FOR CITATION: {', '.join(document_names)}
-
-CONTEXT FROM DOCUMENTS:
-{full_context}
-
-REMEMBER: You MUST start your response with source citations like "Based on [Document Name] and [Document Name]..." and continue citing sources throughout your response."""
-            
-            # Generate response
-            messages = [
-                SystemMessage(content=system_content),
-                HumanMessage(content=query)
-            ]
+                return self._no_documents_response(), {}
             
-            response = self.chat_model.invoke(messages)
+            messages = self._rag_messages(search_results, conversation_history, query, summary)
+            packed_at = time.perf_counter()
             
-            # Clean up response
-            clean_response = response.content.replace('|', '').replace('```', '').strip()
-            import re
-            clean_response = re.sub(r'\|.*?\|', '', clean_response)
-            clean_response = re.sub(r'-+\|', '', clean_response)
-            clean_response = re.sub(r'\n\s*\n', '\n\n', clean_response).strip()
+            with span("openai.chat", model=CHAT_MODEL):
+                response = self.chat_model.invoke(messages)
+            finished = time.perf_counter()
             
-            return clean_response
+            return self._finish_rag_response(response, query, (started, retrieved, packed_at, finished))
             
         except Exception as e:
             print(f"Error creating RAG response: {e}")
-            return ERROR_MESSAGES["embedding_error"]
+            return ERROR_MESSAGES["embedding_error"], {}
+    
+    def _rag_messages(self, search_results: List[Tuple[str, str, float, Dict]], conversation_history: List[Tuple[str, str]],
+                      query: str, summary: str) -> List:
+        # Fit chunks (relevance order) and recent history into CONTEXT_TOKEN_BUDGET,
+        # keeping CLEAR DOCUMENT NAMES for citation
+        with span("rag.pack_context"):
+            packed = pack_context(search_results, conversation_history, query, summary=summary)
+        
+        # Static system message first so it is a cacheable prefix; everything per-request follows
+        return [
+            SystemMessage(content=packed["system_prompt"]),
+            HumanMessage(content=packed["user_prompt"])
+        ]
+    
+    def _finish_rag_response(self, response, query: str, timestamps: Tuple[float, float, float, float]) -> Tuple[str, Dict]:
+        """Record usage and stage timings for a chat completion and clean up its text"""
+        started, retrieved, packed_at, finished = timestamps
+        usage = self._usage_from_response(response)
+        usage["embedding_tokens"] = count_embedding_tokens(query)
+        usage["cost_usd"] = self._estimate_cost(usage)
+        usage["retrieval_ms"] = int((retrieved - started) * 1000)
+        usage["packing_ms"] = int((packed_at - retrieved) * 1000)
+        usage["llm_ms"] = int((finished - packed_at) * 1000)
+        usage["total_ms"] = int((finished - started) * 1000)
+        self._record_usage(usage)
+        
+        # Clean up response
+        clean_response = response.content.replace('|', '').replace('```', '').strip()
+        clean_response = re.sub(r'\|.*?\|', '', clean_response)
+        clean_response = re.sub(r'-+\|', '', clean_response)
+        clean_response = re.sub(r'\n\s*\n', '\n\n', clean_response).strip()
+        
+        return clean_response, usage
+    
+    def _usage_from_response(self, response) -> Dict:
+        """Token counts from the API response, whichever langchain-openai shape it uses"""
+        usage = getattr(response, "usage_metadata", None) or {}
+        token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        
+        cached_tokens = (usage.get("input_token_details") or {}).get("cache_read")
+        if cached_tokens is None:
+            cached_tokens = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        
+        return {
+            "model": CHAT_MODEL,
+            "prompt_tokens": usage.get("input_tokens", token_usage.get("prompt_tokens", 0)),
+            "completion_tokens": usage.get("output_tokens", token_usage.get("completion_tokens", 0)),
+            "cached_tokens": cached_tokens or 0
+        }
+    
+    def _estimate_cost(self, usage: Dict) -> float:
+        """USD cost of one call from real token counts (cached prompt tokens at the cached rate)"""
+        pricing = MODEL_PRICING.get(usage["model"], MODEL_PRICING["gpt-4o"])
+        uncached = usage["prompt_tokens"] - usage["cached_tokens"]
+        cost = (
+            uncached * pricing["input"]
+            + usage["cached_tokens"] * pricing["cached_input"]
+            + usage["completion_tokens"] * pricing["output"]
+            + usage.get("embedding_tokens", 0) * EMBEDDING_PRICING.get(EMBEDDING_MODEL, 0.02)
+        ) / 1_000_000
+        return round(cost, 8)
+    
+    def store_message_usage(self, message_id: str, conversation_id: str, user_email: str, usage: Dict):
+        """Queue usage for an assistant message; message_usage rows are bulk-inserted in the background"""
+        if not message_id or not usage:
+            return
+        
+        row = {
+            "message_id": message_id,
+            "conversation_id": conversation_id,
+            "user_email": user_email,
+            **{key: usage.get(key) for key in (
+                "model", "prompt_tokens", "cached_tokens", "completion_tokens", "embedding_tokens",
+                "cost_usd", "retrieval_ms", "packing_ms", "llm_ms", "total_ms"
+            )}
+        }
+        self._usage_buffer.add(row)
+    
+    def flush_usage_writes(self) -> int:
+        """Write queued message_usage rows now (report queries and shutdown)"""
+        return self._usage_buffer.flush()
+    
+    def get_usage_report(self, days: int = 30) -> Dict:
+        """Token, cost and latency totals per user, department and conversation over the last N days"""
+        from user_management import user_management
+        
+        self.flush_usage_writes()
+        since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+        rows = []
+        page_size = 1000
+        while True:
+            result = self.supabase.table("message_usage")\
+                .select("conversation_id, user_email, prompt_tokens, cached_tokens, completion_tokens, "
+                        "embedding_tokens, cost_usd, total_ms, llm_ms, retrieval_ms")\
+                .gte("created_at", since)\
+                .range(len(rows), len(rows) + page_size - 1)\
+                .execute()
+            rows.extend(result.data or [])
+            if not result.data or len(result.data) < page_size:
+                break
+        
+        def _bucket():
+            return {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0,
+                    "embedding_tokens": 0, "cost_usd": 0.0, "total_ms": 0, "llm_ms": 0, "retrieval_ms": 0}
+        
+        totals = _bucket()
+        by_user, by_department, by_conversation = {}, {}, {}
+        departments = {}
+        
+        for row in rows:
+            email = row["user_email"]
+            if email not in departments:
+                user = user_management.get_user_by_email(email) or {}
+                departments[email] = user.get("department") or "Unassigned"
+            
+            for bucket in (
+                totals,
+                by_user.setdefault(email, _bucket()),
+                by_department.setdefault(departments[email], _bucket()),
+                by_conversation.setdefault(row["conversation_id"], _bucket())
+            ):
+                bucket["calls"] += 1
+                for key in ("prompt_tokens", "cached_tokens", "completion_tokens", "embedding_tokens",
+                            "total_ms", "llm_ms", "retrieval_ms"):
+                    bucket[key] += row.get(key) or 0
+                bucket["cost_usd"] += float(row.get("cost_usd") or 0)
+        
+        def _finish(bucket):
+            calls = bucket["calls"] or 1
+            return {
+                "calls": bucket["calls"],
+                "prompt_tokens": bucket["prompt_tokens"],
+                "cached_tokens": bucket["cached_tokens"],
+                "completion_tokens": bucket["completion_tokens"],
+                "embedding_tokens": bucket["embedding_tokens"],
+                "cost_usd": round(bucket["cost_usd"], 4),
+                "avg_total_ms": round(bucket["total_ms"] / calls),
+                "avg_llm_ms": round(bucket["llm_ms"] / calls),
+                "avg_retrieval_ms": round(bucket["retrieval_ms"] / calls)
+            }
+        
+        top_conversations = sorted(by_conversation.items(), key=lambda item: -item[1]["cost_usd"])[:50]
+        return {
+            "days": days,
+            "totals": _finish(totals),
+            "by_user": {email: _finish(b) for email, b in by_user.items()},
+            "by_department": {dept: _finish(b) for dept, b in by_department.items()},
+            "top_conversations": {conv_id: _finish(b) for conv_id, b in top_conversations}
+        }
+    
+    def _record_usage(self, usage: Dict):
+        with self._usage_lock:
+            self._usage_totals["calls"] += 1
+            for key in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+                self._usage_totals[key] += usage.get(key) or 0
+        record_llm_usage(usage)
+    
+    def get_prompt_cache_stats(self) -> Dict:
+        """Token totals since start and the share of prompt tokens served from the provider cache"""
+        with self._usage_lock:
+            totals = dict(self._usage_totals)
+        totals["cache_hit_ratio"] = round(totals["cached_tokens"] / totals["prompt_tokens"], 4) \
+            if totals["prompt_tokens"] else 0.0
+        return totals
     
     def _no_documents_response(self) -> str:
         """Response when no documents are available"""
@@ -327,10 +770,7 @@ REMEMBER: You MUST start your response with source citations like "Based on [Doc
     def update_message_feedback(self, message_id: str, feedback: str) -> bool:
         """Update message feedback"""
         try:
-            self.supabase.table("messages")\
-                .update({"feedback": feedback})\
-                .eq("id", message_id)\
-                .execute()
+            self._feedback_query(self.supabase, message_id, feedback).execute()
             
             return True
             
@@ -342,13 +782,7 @@ REMEMBER: You MUST start your response with source citations like "Based on [Doc
     def add_spoc_assignment(self, spoc_email: str, assigned_user_email: str) -> bool:
         """Add user assignment to SPOC"""
         try:
-            assignment_data = {
-                "spoc_email": spoc_email,
-                "assigned_user_email": assigned_user_email,
-                "created_at": datetime.utcnow().isoformat()
-            }
-            
-            result = self.supabase.table("spoc_assignments").insert(assignment_data).execute()
+            result = self._insert_assignment_query(self.supabase, spoc_email, assigned_user_email).execute()
             return bool(result.data)
             
         except Exception as e:
@@ -358,11 +792,7 @@ REMEMBER: You MUST start your response with source citations like "Based on [Doc
     def remove_spoc_assignment(self, spoc_email: str, assigned_user_email: str) -> bool:
         """Remove user assignment from SPOC"""
         try:
-            result = self.supabase.table("spoc_assignments")\
-                .delete()\
-                .eq("spoc_email", spoc_email)\
-                .eq("assigned_user_email", assigned_user_email)\
-                .execute()
+            self._delete_assignment_query(self.supabase, spoc_email, assigned_user_email).execute()
             
             return True
             
@@ -373,10 +803,7 @@ REMEMBER: You MUST start your response with source citations like "Based on [Doc
     def get_spoc_assignments(self, spoc_email: str) -> List[str]:
         """Get list of users assigned to a SPOC"""
         try:
-            result = self.supabase.table("spoc_assignments")\
-                .select("assigned_user_email")\
-                .eq("spoc_email", spoc_email)\
-                .execute()
+            result = self._spoc_assignments_query(self.supabase, spoc_email).execute()
             
             if result.data:
                 return [item["assigned_user_email"] for item in result.data]
@@ -409,5 +836,266 @@ REMEMBER: You MUST start your response with source citations like "Based on [Doc
             print(f"Error getting all SPOC assignments: {e}")
             return {}
 
+    # ========== ASYNC API ==========
+    
+    async def acreate_conversation(self, user_email: str, title: str) -> Optional[str]:
+        """Create new conversation (async)"""
+        try:
+            if await self.acount_user_conversations(user_email) >= MAX_SESSIONS_PER_USER:
+                return None
+            
+            db = await self._async_client()
+            result = await self._insert_conversation_query(db, user_email, title).execute()
+            
+            if result.data:
+                self._cache_add_conversation(user_email, result.data[0])
+                return result.data[0]["id"]
+            return None
+            
+        except Exception as e:
+            print(f"Error creating conversation: {e}")
+            return None
+    
+    async def aget_user_conversations(self, user_email: str) -> List[Dict]:
+        """Get user conversations ordered by most recent (async, from the cache when it is warm)"""
+        cached = self._cached_conversations(user_email)
+        if cached is not None:
+            return cached
+        
+        try:
+            db = await self._async_client()
+            version = self._conversation_cache_version
+            result = await self._user_conversations_query(db, user_email).execute()
+            conversations = result.data if result.data else []
+            self._cache_conversations(user_email, conversations, version)
+            return conversations
+            
+        except Exception as e:
+            print(f"Error getting conversations: {e}")
+            return []
+    
+    async def acount_user_conversations(self, user_email: str) -> int:
+        """Number of conversations the user has (async)"""
+        cached = self._cached_conversations(user_email)
+        if cached is not None and len(cached) < MAX_SESSIONS_PER_USER:
+            return len(cached)
+        
+        try:
+            db = await self._async_client()
+            result = await self._count_conversations_query(db, user_email).execute()
+            return result.count or 0
+            
+        except Exception as e:
+            print(f"Error counting conversations: {e}")
+            return 0
+    
+    async def aget_conversations_for_spoc(self, spoc_email: str) -> List[Dict]:
+        """Get conversations for users assigned to a SPOC (async, users fetched concurrently)"""
+        try:
+            assigned_user_emails = await self.aget_spoc_assignments(spoc_email)
+            if not assigned_user_emails:
+                return []
+            
+            per_user = await asyncio.gather(*(
+                self.aget_user_conversations(user_email) for user_email in assigned_user_emails
+            ))
+            
+            conversations = []
+            for user_email, user_conversations in zip(assigned_user_emails, per_user):
+                for conv in user_conversations:
+                    conv["owner_email"] = user_email
+                conversations.extend(user_conversations)
+            
+            conversations.sort(key=lambda x: x.get("updated_at", ""), reverse=True)
+            return conversations
+            
+        except Exception as e:
+            print(f"Error getting SPOC conversations: {e}")
+            return []
+    
+    async def adelete_conversation(self, conversation_id: str, user_email: str) -> bool:
+        """Delete conversation and all its messages, archiving to S3 first when enabled (async)"""
+        try:
+            from s3_archive_service import s3_archive_service
+            
+            if s3_archive_service.is_enabled():
+                # The archive export reads through the sync clients and boto3
+                success, message = await asyncio.to_thread(s3_archive_service.archive_to_s3, conversation_id, user_email)
+                if success:
+                    print(f"✅ {message}")
+                else:
+                    print(f"⚠️  Archive failed but continuing with deletion: {message}")
+            else:
+                print("⚠️  S3 archival disabled - deleting without backup")
+            
+            db = await self._async_client()
+            for query in self._delete_conversation_queries(db, conversation_id, user_email):
+                await query.execute()
+            self._cache_remove_conversation(user_email, conversation_id)
+            
+            print(f"✅ Deleted conversation {conversation_id} from Supabase")
+            return True
+            
+        except Exception as e:
+            print(f"Error deleting conversation: {e}")
+            return False
+    
+    async def aget_conversation_history(self, conversation_id: str) -> List[Tuple[str, str]]:
+        """Get conversation history as list of (user_msg, assistant_msg) tuples (async)"""
+        try:
+            db = await self._async_client()
+            result = await self._messages_query(db, conversation_id).execute()
+            
+            return self._history_from_messages(result.data or [])
+            
+        except Exception as e:
+            print(f"Error getting conversation history: {e}")
+            return []
+    
+    async def astore_message(self, conversation_id: str, role: str, content: str) -> Optional[str]:
+        """Store message and return message ID (async)"""
+        try:
+            db = await self._async_client()
+            result = await self._insert_message_query(db, conversation_id, role, content).execute()
+            
+            if result.data:
+                return result.data[0]["id"]
+            return None
+            
+        except Exception as e:
+            print(f"Error storing message: {e}")
+            return None
+    
+    async def acommit_turn(self, conversation_id: str, user_message: str, assistant_message: str,
+                           user_created_at: str) -> Optional[str]:
+        """Store a turn's user and assistant messages in one insert (async)"""
+        try:
+            db = await self._async_client()
+            result = await self._insert_turn_query(
+                db, conversation_id, user_message, assistant_message, user_created_at
+            ).execute()
+            return self._turn_committed(conversation_id, result.data)
+            
+        except Exception as e:
+            print(f"Error storing chat turn: {e}")
+            return None
+    
+    async def aget_conversation_summary(self, conversation_id: str) -> Tuple[str, int]:
+        """Get (rolling summary, number of leading turns it covers) for a conversation (async)"""
+        try:
+            db = await self._async_client()
+            result = await self._summary_query(db, conversation_id).execute()
+            
+            if not result.data:
+                return "", 0
+            
+            row = result.data[0]
+            return row.get("summary") or "", row.get("summarized_turns") or 0
+            
+        except Exception as e:
+            print(f"Error getting conversation summary: {e}")
+            return "", 0
+    
+    async def aupdate_conversation_timestamp(self, conversation_id: str):
+        """Update conversation's updated_at timestamp (async)"""
+        try:
+            db = await self._async_client()
+            result = await self._touch_conversation_query(db, conversation_id).execute()
+            if result.data:
+                self._cache_update_conversation(conversation_id, {"updated_at": result.data[0]["updated_at"]}, touched=True)
+        except Exception as e:
+            print(f"Error updating conversation timestamp: {e}")
+    
+    async def agenerate_title(self, message: str) -> str:
+        """Generate conversation title from first message (async)"""
+        if not message or len(message.strip()) < 5:
+            return "New Chat"
+        
+        try:
+            response = await self._title_model().ainvoke(self._title_messages(message))
+            title = self._clean_title(response.content)
+            if title:
+                return title
+            
+        except Exception as e:
+            print(f"Error generating title: {e}")
+        
+        return self._fallback_title(message)
+    
+    async def acreate_rag_response_with_usage(self, query: str, conversation_history: List[Tuple[str, str]],
+                                              summary: str = "") -> Tuple[str, Dict]:
+        """Create RAG response and return it with the API token usage (async)
+        
+        Retrieval (query embedding plus the Chroma search) runs on a worker thread; the
+        chat completion is awaited on the event loop.
+        """
+        try:
+            started = time.perf_counter()
+            search_results = await asyncio.to_thread(rag_service.search_common_knowledge, query, TOP_K)
+            retrieved = time.perf_counter()
+            
+            if not search_results:
+                return self._no_documents_response(), {}
+            
+            messages = self._rag_messages(search_results, conversation_history, query, summary)
+            packed_at = time.perf_counter()
+            
+            with span("openai.chat", model=CHAT_MODEL):
+                response = await self.chat_model.ainvoke(messages)
+            finished = time.perf_counter()
+            
+            return self._finish_rag_response(response, query, (started, retrieved, packed_at, finished))
+            
+        except Exception as e:
+            print(f"Error creating RAG response: {e}")
+            return ERROR_MESSAGES["embedding_error"], {}
+    
+    async def aupdate_message_feedback(self, message_id: str, feedback: str) -> bool:
+        """Update message feedback (async)"""
+        try:
+            db = await self._async_client()
+            await self._feedback_query(db, message_id, feedback).execute()
+            return True
+            
+        except Exception as e:
+            print(f"Error updating message feedback: {e}")
+            return False
+    
+    async def aadd_spoc_assignment(self, spoc_email: str, assigned_user_email: str) -> bool:
+        """Add user assignment to SPOC (async)"""
+        try:
+            db = await self._async_client()
+            result = await self._insert_assignment_query(db, spoc_email, assigned_user_email).execute()
+            return bool(result.data)
+            
+        except Exception as e:
+            print(f"Error adding SPOC assignment: {e}")
+            return False
+    
+    async def aremove_spoc_assignment(self, spoc_email: str, assigned_user_email: str) -> bool:
+        """Remove user assignment from SPOC (async)"""
+        try:
+            db = await self._async_client()
+            await self._delete_assignment_query(db, spoc_email, assigned_user_email).execute()
+            return True
+            
+        except Exception as e:
+            print(f"Error removing SPOC assignment: {e}")
+            return False
+    
+    async def aget_spoc_assignments(self, spoc_email: str) -> List[str]:
+        """Get list of users assigned to a SPOC (async)"""
+        try:
+            db = await self._async_client()
+            result = await self._spoc_assignments_query(db, spoc_email).execute()
+            
+            if result.data:
+                return [item["assigned_user_email"] for item in result.data]
+            return []
+            
+        except Exception as e:
+            print(f"Error getting SPOC assignments: {e}")
+            return []
+
 # Global chat service instance
 chat_service = ChatService()
\ No newline at end of file
@@ -68,13 +68,107 @@ else:
     RAG_INDEX_PATH = os.getenv("RAG_INDEX_PATH", DEFAULT_RAG_INDEX_PATH).strip()
 
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL).strip()
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", str(DEFAULT_EMBEDDING_DIMENSIONS)))
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", str(DEFAULT_CHUNK_SIZE)))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", str(DEFAULT_CHUNK_OVERLAP)))
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(DEFAULT_PDF_EXTRACTION_WORKERS)))
 TOP_K = int(os.getenv("TOP_K", str(DEFAULT_TOP_K)))
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", DEFAULT_RETRIEVAL_MODE).strip().lower()
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", str(DEFAULT_MMR_FETCH_K)))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", str(DEFAULT_MMR_LAMBDA)))
+
+if RETRIEVAL_MODE not in ("similarity", "mmr"):
+    raise ValueError(f"RETRIEVAL_MODE must be 'similarity' or 'mmr', got '{RETRIEVAL_MODE}'")
+if not 0.0 <= MMR_LAMBDA <= 1.0:
+    raise ValueError(f"MMR_LAMBDA must be between 0 and 1, got {MMR_LAMBDA}")
+
+# Vector Store Configuration
+VECTOR_STORE_MODE = os.getenv("VECTOR_STORE_MODE", DEFAULT_VECTOR_STORE_MODE).strip().lower()
+CHROMA_SERVER_HOST = os.getenv("CHROMA_SERVER_HOST", DEFAULT_CHROMA_SERVER_HOST).strip()
+CHROMA_SERVER_PORT = int(os.getenv("CHROMA_SERVER_PORT", str(DEFAULT_CHROMA_SERVER_PORT)))
+
+COMMON_INDEX_BACKEND = os.getenv("COMMON_INDEX_BACKEND", DEFAULT_COMMON_INDEX_BACKEND).strip().lower()
+COMMON_INDEX_QUANTIZATION = os.getenv("COMMON_INDEX_QUANTIZATION", DEFAULT_COMMON_INDEX_QUANTIZATION).strip().lower()
+QUANTIZED_RESCORE_FACTOR = int(os.getenv("QUANTIZED_RESCORE_FACTOR", str(DEFAULT_QUANTIZED_RESCORE_FACTOR)))
+
+USER_VECTOR_LAYOUT = os.getenv("USER_VECTOR_LAYOUT", DEFAULT_USER_VECTOR_LAYOUT).strip().lower()
+USER_VECTOR_BACKEND = os.getenv("USER_VECTOR_BACKEND", DEFAULT_USER_VECTOR_BACKEND).strip().lower()
+NUMPY_BACKEND_MAX_VECTORS = int(os.getenv("NUMPY_BACKEND_MAX_VECTORS", str(DEFAULT_NUMPY_BACKEND_MAX_VECTORS)))
+NUMPY_VECTOR_DTYPE = os.getenv("NUMPY_VECTOR_DTYPE", DEFAULT_NUMPY_VECTOR_DTYPE).strip().lower()
+USER_VECTORSTORE_POOL_SIZE = int(os.getenv("USER_VECTORSTORE_POOL_SIZE", str(DEFAULT_USER_VECTORSTORE_POOL_SIZE)))
+USER_VECTORSTORE_IDLE_SECONDS = int(os.getenv("USER_VECTORSTORE_IDLE_SECONDS", str(DEFAULT_USER_VECTORSTORE_IDLE_SECONDS)))
+
+if PDF_EXTRACTION_WORKERS < 0:
+    raise ValueError(f"PDF_EXTRACTION_WORKERS must be 0 (in-process) or a positive count, got {PDF_EXTRACTION_WORKERS}")
+if EMBEDDING_DIMENSIONS < 0:
+    raise ValueError(f"EMBEDDING_DIMENSIONS must be 0 (model default) or a positive size, got {EMBEDDING_DIMENSIONS}")
+if EMBEDDING_DIMENSIONS and not EMBEDDING_MODEL.startswith("text-embedding-3"):
+    raise ValueError(f"EMBEDDING_DIMENSIONS is only supported by text-embedding-3 models, not '{EMBEDDING_MODEL}'")
+if VECTOR_STORE_MODE not in ("embedded", "server"):
+    raise ValueError(f"VECTOR_STORE_MODE must be 'embedded' or 'server', got '{VECTOR_STORE_MODE}'")
+if COMMON_INDEX_BACKEND not in ("chroma", "quantized"):
+    raise ValueError(f"COMMON_INDEX_BACKEND must be 'chroma' or 'quantized', got '{COMMON_INDEX_BACKEND}'")
+if COMMON_INDEX_BACKEND == "quantized" and VECTOR_STORE_MODE == "server":
+    raise ValueError("COMMON_INDEX_BACKEND=quantized is a local index and cannot be used with VECTOR_STORE_MODE=server")
+if COMMON_INDEX_QUANTIZATION not in ("int8", "float16"):
+    raise ValueError(f"COMMON_INDEX_QUANTIZATION must be 'int8' or 'float16', got '{COMMON_INDEX_QUANTIZATION}'")
+if USER_VECTOR_LAYOUT not in ("per_user", "shared"):
+    raise ValueError(f"USER_VECTOR_LAYOUT must be 'per_user' or 'shared', got '{USER_VECTOR_LAYOUT}'")
+if USER_VECTOR_BACKEND not in ("auto", "chroma", "numpy"):
+    raise ValueError(f"USER_VECTOR_BACKEND must be 'auto', 'chroma' or 'numpy', got '{USER_VECTOR_BACKEND}'")
+if NUMPY_VECTOR_DTYPE not in ("float32", "float16"):
+    raise ValueError(f"NUMPY_VECTOR_DTYPE must be 'float32' or 'float16', got '{NUMPY_VECTOR_DTYPE}'")
 
 # Chat Configuration
 CHAT_MODEL = os.getenv("CHAT_MODEL", DEFAULT_CHAT_MODEL).strip()
 TEMPERATURE = float(os.getenv("TEMPERATURE", str(DEFAULT_TEMPERATURE)))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", str(DEFAULT_CONTEXT_TOKEN_BUDGET)))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", DEFAULT_SUMMARY_MODEL).strip()
+SUMMARY_RECENT_TURNS = int(os.getenv("SUMMARY_RECENT_TURNS", str(DEFAULT_SUMMARY_RECENT_TURNS)))
+SUMMARY_BATCH_TURNS = int(os.getenv("SUMMARY_BATCH_TURNS", str(DEFAULT_SUMMARY_BATCH_TURNS)))
+CONTEXT_HISTORY_SHARE = float(os.getenv("CONTEXT_HISTORY_SHARE", str(DEFAULT_CONTEXT_HISTORY_SHARE)))
+USAGE_FLUSH_INTERVAL_SECONDS = float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", str(DEFAULT_USAGE_FLUSH_INTERVAL_SECONDS)))
+USAGE_FLUSH_BATCH_SIZE = int(os.getenv("USAGE_FLUSH_BATCH_SIZE", str(DEFAULT_USAGE_FLUSH_BATCH_SIZE)))
+
+if CONTEXT_TOKEN_BUDGET <= 0:
+    raise ValueError(f"CONTEXT_TOKEN_BUDGET must be positive, got {CONTEXT_TOKEN_BUDGET}")
+if not 0.0 <= CONTEXT_HISTORY_SHARE <= 1.0:
+    raise ValueError(f"CONTEXT_HISTORY_SHARE must be between 0 and 1, got {CONTEXT_HISTORY_SHARE}")
+if USAGE_FLUSH_INTERVAL_SECONDS <= 0 or USAGE_FLUSH_BATCH_SIZE <= 0:
+    raise ValueError(f"USAGE_FLUSH_INTERVAL_SECONDS and USAGE_FLUSH_BATCH_SIZE must be positive, "
+                     f"got {USAGE_FLUSH_INTERVAL_SECONDS} and {USAGE_FLUSH_BATCH_SIZE}")
+
+# Tracing Configuration (OTLP export is optional and uses the standard OpenTelemetry variable)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", str(DEFAULT_TRACING_ENABLED)).lower() == "true"
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", DEFAULT_TRACE_LOG_PATH).strip()
+TRACE_LOG_MAX_BYTES = int(os.getenv("TRACE_LOG_MAX_BYTES", str(DEFAULT_TRACE_LOG_MAX_BYTES)))
+TRACE_LOG_BACKUPS = int(os.getenv("TRACE_LOG_BACKUPS", str(DEFAULT_TRACE_LOG_BACKUPS)))
+TRACE_STATS_WINDOW = int(os.getenv("TRACE_STATS_WINDOW", str(DEFAULT_TRACE_STATS_WINDOW)))
+TRACE_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "").strip()
+
+# Metrics Configuration (set PROMETHEUS_MULTIPROC_DIR when UVICORN_WORKERS > 1)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", str(DEFAULT_METRICS_ENABLED)).lower() == "true"
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "").strip()
+
+# Metadata Backend (Google sign-in still goes through Supabase with either backend)
+METADATA_BACKEND = os.getenv("METADATA_BACKEND", DEFAULT_METADATA_BACKEND).strip().lower()
+METADATA_DB_PATH = os.getenv("METADATA_DB_PATH", DEFAULT_METADATA_DB_PATH).strip()
+if METADATA_BACKEND not in ("supabase", "sqlite"):
+    raise ValueError(f"METADATA_BACKEND must be 'supabase' or 'sqlite', got '{METADATA_BACKEND}'")
+
+# Serving Configuration (UI state is per session, so these can be raised safely)
+UVICORN_WORKERS = int(os.getenv("UVICORN_WORKERS", str(DEFAULT_UVICORN_WORKERS)))
+GRADIO_CONCURRENCY_LIMIT = int(os.getenv("GRADIO_CONCURRENCY_LIMIT", str(DEFAULT_GRADIO_CONCURRENCY_LIMIT)))
+
+# NumPy stores are cached in memory and written in place by one process, with no
+# cross-process locking; several workers would overwrite each other's rows
+if UVICORN_WORKERS > 1:
+    if USER_VECTOR_BACKEND == "numpy":
+        raise ValueError("USER_VECTOR_BACKEND=numpy is single-process only; use 'chroma' (or 'auto') with UVICORN_WORKERS > 1")
+    if COMMON_INDEX_BACKEND == "quantized":
+        raise ValueError("COMMON_INDEX_BACKEND=quantized is single-process only; use 'chroma' with UVICORN_WORKERS > 1")
+    if USER_VECTOR_BACKEND == "auto":
+        USER_VECTOR_BACKEND = "chroma"
 
 # Validation
 required_vars = {
@@ -113,8 +207,18 @@ else:
     print(f"   📚 User Documents Path: {RAG_DOCUMENTS_PATH}")
     print(f"   📖 Common Knowledge Path: {COMMON_KNOWLEDGE_PATH}")
 print(f"   📊 Chunk Size: {CHUNK_SIZE}, Overlap: {CHUNK_OVERLAP}")
+if EMBEDDING_DIMENSIONS:
+    print(f"   📐 Embedding Dimensions: {EMBEDDING_DIMENSIONS}")
 print(f"   🔍 Top K Retrieval: {TOP_K}")
+if VECTOR_STORE_MODE == "server":
+    print(f"   🗄️ Vector Store: Chroma server at {CHROMA_SERVER_HOST}:{CHROMA_SERVER_PORT}")
+else:
+    print(f"   🗄️ Vector Store: embedded Chroma ({RAG_INDEX_PATH})")
+print(f"   🧮 Personal Vector Backend: {USER_VECTOR_BACKEND}")
+if METADATA_BACKEND == "sqlite":
+    print(f"   🗃️ Metadata: SQLite ({METADATA_DB_PATH})")
 print(f"   🧠 Model: {CHAT_MODEL}, Temperature: {TEMPERATURE}")
 print(f"   👥 Max Sessions: {MAX_SESSIONS_PER_USER}, Max History: {MAX_HISTORY_TURNS}")
 print(f"   📧 Allowed Domain: {ALLOWED_DOMAIN}")
+print(f"   ⚙️ Workers: {UVICORN_WORKERS}, Gradio Concurrency: {GRADIO_CONCURRENCY_LIMIT}")
 print(f"   🔧 Ready for multi-user operation with {'S3' if USE_S3_STORAGE else 'local'} storage")
\ No newline at end of file
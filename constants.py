@@ -31,13 +31,82 @@ DEFAULT_RAG_DOCUMENTS_PATH = "./user_documents"
 DEFAULT_COMMON_KNOWLEDGE_PATH = "./common_knowledge"  # New common repository
 DEFAULT_RAG_INDEX_PATH = "./rag_index"
 DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+DEFAULT_EMBEDDING_DIMENSIONS = 0  # 0 = model default; e.g. 512 or 768 to shrink text-embedding-3 indexes
+EMBEDDING_MODEL_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+RECALL_PROBE_SAMPLES = 50  # Stored chunks used as probe queries in recall reports
+EMBEDDING_MIGRATION_LOCK_FILE = "embedding_migration.lock"  # In RAG_INDEX_PATH from migration start until cutover; pauses indexing
 DEFAULT_CHUNK_SIZE = 1000
 DEFAULT_CHUNK_OVERLAP = 200
+DEFAULT_PDF_EXTRACTION_WORKERS = 4  # Processes for page-parallel PDF text extraction (0 = in-process only)
+PDF_PARALLEL_MIN_PAGES = 48  # Smaller PDFs are extracted in-process; the pool does not pay off
+PDF_PAGES_PER_TASK = 16  # Page range handed to one extraction process at a time
 DEFAULT_TOP_K = 8
+DEFAULT_RETRIEVAL_MODE = "similarity"  # or "mmr" to diversify near-duplicate chunks
+DEFAULT_MMR_FETCH_K = 24  # Candidates fetched (with their vectors) before MMR picks TOP_K
+DEFAULT_MMR_LAMBDA = 0.7  # 1.0 = pure relevance, 0.0 = pure diversity
 
 # Chat Configuration
 DEFAULT_CHAT_MODEL = "gpt-4o"
 DEFAULT_TEMPERATURE = 0.7
+DEFAULT_CONTEXT_TOKEN_BUDGET = 4000  # Max input tokens per call: system prompt + history + chunks + question
+DEFAULT_CONTEXT_HISTORY_SHARE = 0.3  # Max share of the remaining budget given to conversation history
+DEFAULT_SUMMARY_MODEL = "gpt-4o-mini"  # Cheap model for rolling conversation summaries
+DEFAULT_SUMMARY_RECENT_TURNS = 3  # Turns always sent verbatim; older ones are summarized
+DEFAULT_SUMMARY_BATCH_TURNS = 2  # Fold older turns into the summary once this many have piled up
+DEFAULT_USAGE_FLUSH_INTERVAL_SECONDS = 5.0  # message_usage rows are buffered and bulk-inserted this often
+DEFAULT_USAGE_FLUSH_BATCH_SIZE = 100  # ...or as soon as this many are waiting
+SUMMARY_MAX_WORDS = 200
+
+# OpenAI pricing per 1M tokens (cached_input applies to the cached part of the prompt)
+MODEL_PRICING = {
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4o-latest": {"input": 5.00, "cached_input": 5.00, "output": 15.00},
+    "gpt-4-turbo-2024-04-09": {"input": 10.00, "cached_input": 10.00, "output": 30.00},
+    "gpt-3.5-turbo": {"input": 0.50, "cached_input": 0.50, "output": 1.50},
+}
+EMBEDDING_PRICING = {
+    "text-embedding-3-small": 0.02,
+    "text-embedding-3-large": 0.13,
+    "text-embedding-ada-002": 0.10,
+}
+
+# Vector Store Configuration
+DEFAULT_VECTOR_STORE_MODE = "embedded"  # "embedded" (in-process Chroma) or "server" (shared Chroma HTTP server)
+DEFAULT_CHROMA_SERVER_HOST = "127.0.0.1"
+DEFAULT_CHROMA_SERVER_PORT = 8100
+DEFAULT_COMMON_INDEX_BACKEND = "chroma"  # or "quantized" (compact in-memory codes + exact re-scoring)
+DEFAULT_COMMON_INDEX_QUANTIZATION = "int8"  # or "float16"
+DEFAULT_QUANTIZED_RESCORE_FACTOR = 4  # Candidates re-scored at full precision = top_k * factor
+DEFAULT_USER_VECTOR_LAYOUT = "per_user"  # "per_user" (one store per user) or "shared" (one collection filtered by user_email)
+SHARED_USER_COLLECTION_NAME = "user_documents"
+DEFAULT_USER_VECTOR_BACKEND = "auto"  # "auto", "chroma" or "numpy" for personal collections
+DEFAULT_NUMPY_BACKEND_MAX_VECTORS = 5000  # auto: brute-force NumPy below this, Chroma HNSW above
+DEFAULT_NUMPY_VECTOR_DTYPE = "float32"  # or "float16" to halve memory
+DEFAULT_USER_VECTORSTORE_POOL_SIZE = 64  # Max personal stores kept open per worker
+DEFAULT_USER_VECTORSTORE_IDLE_SECONDS = 900  # Close personal stores unused this long
+
+# Tracing Configuration
+DEFAULT_TRACING_ENABLED = True
+DEFAULT_TRACE_LOG_PATH = "./logs/traces.jsonl"
+DEFAULT_TRACE_LOG_MAX_BYTES = 20 * 1024 * 1024  # Rotate the span log at 20MB
+DEFAULT_TRACE_LOG_BACKUPS = 5
+DEFAULT_TRACE_STATS_WINDOW = 2000  # Recent spans per stage kept for percentiles
+
+# Metrics Configuration
+DEFAULT_METRICS_ENABLED = True
+
+# Metadata Backend ("supabase", or "sqlite" for an in-process database on single-node deployments)
+DEFAULT_METADATA_BACKEND = "supabase"
+DEFAULT_METADATA_DB_PATH = "./metadata/sevabot.db"
+
+# Serving Configuration
+DEFAULT_UVICORN_WORKERS = 1
+DEFAULT_GRADIO_CONCURRENCY_LIMIT = 16  # Concurrent Gradio events per worker
 MAX_HISTORY_TURNS = 10
 MAX_SESSIONS_PER_USER = 10
 
@@ -45,6 +114,16 @@ MAX_SESSIONS_PER_USER = 10
 SESSION_MAX_AGE = 86400  # 24 hours
 SESSION_SALT = "sevabot-auth"
 
+# User Directory Cache (whitelist + users snapshot shared by admin views)
+USER_DIRECTORY_TTL_SECONDS = 60
+
+# Conversation List Cache (per-user sidebar lists, updated write-through by ChatService)
+CONVERSATION_CACHE_TTL_SECONDS = 60  # Bounds staleness from writes made by other workers
+
+# Admin Dashboard Loading (independent sources fetched concurrently)
+ADMIN_LOAD_MAX_WORKERS = 8
+ADMIN_LOAD_TIMEOUT_SECONDS = 10  # Per source; slow sources are left unrendered
+
 # File Configuration with Document Guidelines
 SUPPORTED_EXTENSIONS = ['.txt', '.md', '.pdf', '.docx']
 MAX_FILE_SIZE_MB = 10
@@ -113,6 +192,18 @@ MANDATORY CITATION EXAMPLES:
 
 Remember: ALWAYS start with source citation and maintain citations throughout. It's better to humbly say "I don't know" than to provide inaccurate information."""
 
+CONVERSATION_SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and an assistant that answers from a document repository.
+
+Update the existing summary with the new turns. Keep the user's goals, the questions asked, key facts given in answers and the documents they were attributed to, and anything the user said they still need. Drop greetings and pleasantries. Write plain prose, at most {max_words} words.
+
+EXISTING SUMMARY:
+{summary}
+
+NEW TURNS:
+{turns}
+
+UPDATED SUMMARY:"""
+
 # Error Messages with Document Guidelines
 ERROR_MESSAGES = {
     "no_documents": "I don't have any documents in the knowledge repository to search through yet. Please contact an administrator to upload documents.",
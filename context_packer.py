@@ -0,0 +1,174 @@
+# context_packer.py - Fit retrieved chunks and chat history into a fixed prompt token budget
+from typing import List, Dict, Tuple
+
+import tiktoken
+
+from config import CHAT_MODEL, CONTEXT_TOKEN_BUDGET, CONTEXT_HISTORY_SHARE
+from constants import SYSTEM_PROMPT, MAX_HISTORY_TURNS
+
+# Partial chunks/turns shorter than this are dropped rather than truncated
+MIN_PARTIAL_TOKENS = 64
+
+# Everything static lives in the system message so it is a byte-identical prefix on every
+# call (provider prompt caching); per-request parts follow in the user message, ordered from
+# most to least stable across turns of a conversation.
+STATIC_SYSTEM_PROMPT = f"""{SYSTEM_PROMPT}
+
+Each user message contains the CONVERSATION HISTORY, the AVAILABLE DOCUMENTS FOR CITATION, the CONTEXT FROM DOCUMENTS and finally the QUESTION to answer.
+
+REMEMBER: You MUST start your response with source citations like "Based on [Document Name] and [Document Name]..." and continue citing sources throughout your response."""
+
+RAG_USER_TEMPLATE = """CONVERSATION HISTORY:
+{history}
+
+AVAILABLE DOCUMENTS FOR CITATION: {document_names}
+
+CONTEXT FROM DOCUMENTS:
+{context}
+
+QUESTION:
+{query}"""
+
+_encoding = None
+_embedding_encoding = None
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.encoding_for_model(CHAT_MODEL)
+        except KeyError:
+            # Newer model names not yet known to tiktoken share the gpt-4o tokenizer
+            _encoding = tiktoken.get_encoding("o200k_base")
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """Exact token count for the configured chat model"""
+    if not text:
+        return 0
+    return len(_get_encoding().encode(text, disallowed_special=()))
+
+def count_embedding_tokens(text: str) -> int:
+    """Token count as billed by the OpenAI embedding models (cl100k_base)"""
+    global _embedding_encoding
+    if not text:
+        return 0
+    if _embedding_encoding is None:
+        _embedding_encoding = tiktoken.get_encoding("cl100k_base")
+    return len(_embedding_encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens]).rstrip() + " ..."
+
+def build_user_prompt(history: str, document_names: List[str], context: str, query: str) -> str:
+    return RAG_USER_TEMPLATE.format(
+        history=history,
+        document_names=', '.join(document_names),
+        context=context,
+        query=query
+    )
+
+def _pack_history(conversation_history: List[Tuple[str, str]], budget: int,
+                  summary: str = "") -> Tuple[str, int, int]:
+    """Rolling summary (up to half the budget), then newest turns first; the oldest turn
+    that fits only partly has its answer trimmed"""
+    recent_history = conversation_history[-MAX_HISTORY_TURNS:] if conversation_history else []
+    packed_turns = []
+    used = 0
+    summary_part = ""
+
+    if summary:
+        summary_part = "Summary of earlier conversation: " + truncate_to_tokens(summary, budget // 2)
+        used = count_tokens(summary_part) + 1
+
+    for user_msg, assistant_msg in reversed(recent_history):
+        turn = f"User: {user_msg}\nAssistant: {assistant_msg}"
+        turn_tokens = count_tokens(turn) + 1
+        if used + turn_tokens <= budget:
+            packed_turns.append(turn)
+            used += turn_tokens
+            continue
+
+        question = f"User: {user_msg}\nAssistant: "
+        room = budget - used - count_tokens(question) - 1
+        if room >= MIN_PARTIAL_TOKENS:
+            turn = question + truncate_to_tokens(assistant_msg, room)
+            packed_turns.append(turn)
+            used += count_tokens(turn) + 1
+        break
+
+    packed_turns.reverse()
+    if summary_part:
+        packed_turns.insert(0, summary_part)
+        return "\n".join(packed_turns), len(packed_turns) - 1, used
+    return "\n".join(packed_turns), len(packed_turns), used
+
+def _pack_chunks(search_results: List[Tuple[str, str, float, Dict]], budget: int) -> Tuple[List[str], List[str], int]:
+    """Chunks in relevance order until the budget is spent; the first that overflows is trimmed"""
+    context_parts = []
+    document_names = []
+    used = 0
+
+    for chunk, source, similarity, metadata in search_results:
+        document_name = source if source != 'Unknown' else metadata.get('file_name', 'Unknown Document')
+        header = f"[Document: {document_name}]\n"
+        part = header + chunk
+        # +2 for the blank line joining parts, + the name in the citation list
+        part_tokens = count_tokens(part) + 2 + (0 if document_name in document_names else count_tokens(document_name) + 1)
+
+        if used + part_tokens > budget:
+            room = budget - used - count_tokens(header) - 2 - count_tokens(document_name) - 1
+            if room < MIN_PARTIAL_TOKENS:
+                break
+            part = header + truncate_to_tokens(chunk, room)
+            part_tokens = budget - used
+
+        context_parts.append(part)
+        if document_name not in document_names:
+            document_names.append(document_name)
+        used += part_tokens
+
+        if used >= budget:
+            break
+
+    return context_parts, document_names, used
+
+def pack_context(search_results: List[Tuple[str, str, float, Dict]],
+                 conversation_history: List[Tuple[str, str]], query: str,
+                 summary: str = "",
+                 budget: int = CONTEXT_TOKEN_BUDGET,
+                 history_share: float = CONTEXT_HISTORY_SHARE) -> Dict:
+    """Build the prompts so system prompt + history + chunks + query stay within budget tokens.
+
+    History (rolling summary of older turns, then the turns after it) gets at most
+    history_share of what is left after the fixed parts; whatever
+    it does not use goes to document chunks, which are taken in search (relevance) order.
+    """
+    fixed_tokens = count_tokens(STATIC_SYSTEM_PROMPT) + count_tokens(build_user_prompt("", [], "", query))
+    available = max(0, budget - fixed_tokens)
+
+    history, history_turns, history_tokens = _pack_history(
+        conversation_history, int(available * history_share), summary
+    )
+    context_parts, document_names, context_tokens = _pack_chunks(
+        search_results, available - history_tokens
+    )
+
+    user_prompt = build_user_prompt(history, document_names, "\n\n".join(context_parts), query)
+
+    return {
+        "system_prompt": STATIC_SYSTEM_PROMPT,
+        "user_prompt": user_prompt,
+        "document_names": document_names,
+        "chunks_used": len(context_parts),
+        "chunks_available": len(search_results),
+        "history_turns_used": history_turns,
+        "prompt_tokens": count_tokens(STATIC_SYSTEM_PROMPT) + count_tokens(user_prompt)
+    }
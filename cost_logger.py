@@ -15,19 +15,14 @@ from chat_service import chat_service
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 
-# OpenAI pricing per 1M tokens
-OPENAI_PRICING = {
-    "gpt-4o": {"input": 5.00, "output": 15.00},
-    "gpt-4o-latest": {"input": 5.00, "output": 15.00},
-    "gpt-4-turbo-2024-04-09": {"input": 10.00, "output": 30.00},
-    "gpt-3.5-turbo": {"input": 0.50, "output": 1.50},
-}
+from constants import MODEL_PRICING as OPENAI_PRICING, EMBEDDING_PRICING
+from context_packer import count_tokens as count_chat_tokens, count_embedding_tokens
 
 call_logs = []
 
 def count_tokens(text):
-    """Rough token estimation: ~4 chars per token"""
-    return max(1, len(text) // 4)
+    """Token count with the chat model's tokenizer"""
+    return max(1, count_chat_tokens(text))
 
 def calculate_costs(system_content, rag_context, question, gpt_response):
     """Calculate API costs using actual final prompt structure"""
@@ -36,7 +31,7 @@ def calculate_costs(system_content, rag_context, question, gpt_response):
     
     input_tokens = count_tokens(full_input)
     output_tokens = count_tokens(gpt_response)
-    embedding_tokens = count_tokens(rag_context)
+    embedding_tokens = count_embedding_tokens(question)
     
     model = CHAT_MODEL
     if model not in OPENAI_PRICING:
@@ -44,7 +39,7 @@ def calculate_costs(system_content, rag_context, question, gpt_response):
     
     input_cost = (input_tokens / 1_000_000) * OPENAI_PRICING[model]["input"]
     output_cost = (output_tokens / 1_000_000) * OPENAI_PRICING[model]["output"]
-    embed_cost = (embedding_tokens / 1_000_000) * 0.02
+    embed_cost = (embedding_tokens / 1_000_000) * EMBEDDING_PRICING.get(EMBEDDING_MODEL, 0.02)
     
     total = input_cost + output_cost + embed_cost
     
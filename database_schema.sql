@@ -42,10 +42,16 @@ CREATE TABLE IF NOT EXISTS conversations (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
     user_id TEXT NOT NULL,
     title TEXT NOT NULL,
+    summary TEXT,                      -- rolling summary of older turns
+    summarized_turns INTEGER DEFAULT 0, -- number of leading turns folded into summary
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Existing deployments: add rolling summary columns
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary TEXT;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summarized_turns INTEGER DEFAULT 0;
+
 -- 5. Messages table
 CREATE TABLE IF NOT EXISTS messages (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
@@ -59,6 +65,37 @@ CREATE TABLE IF NOT EXISTS messages (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- 5a. Message inserts keep conversations.updated_at current, so a chat turn (user and
+--     assistant message) is persisted with a single bulk insert
+CREATE OR REPLACE FUNCTION touch_conversation_on_message() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE conversations SET updated_at = NEW.created_at WHERE id = NEW.conversation_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS messages_touch_conversation ON messages;
+CREATE TRIGGER messages_touch_conversation AFTER INSERT ON messages
+    FOR EACH ROW EXECUTE FUNCTION touch_conversation_on_message();
+
+-- 5b. Per-call token usage, cost and stage timings for each assistant message
+CREATE TABLE IF NOT EXISTS message_usage (
+    message_id UUID PRIMARY KEY REFERENCES messages(id) ON DELETE CASCADE,
+    conversation_id UUID NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    user_email TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_tokens INTEGER DEFAULT 0,
+    cached_tokens INTEGER DEFAULT 0,
+    completion_tokens INTEGER DEFAULT 0,
+    embedding_tokens INTEGER DEFAULT 0,
+    cost_usd NUMERIC(12, 8) DEFAULT 0,
+    retrieval_ms INTEGER,
+    packing_ms INTEGER,
+    llm_ms INTEGER,
+    total_ms INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
 -- 6. Common knowledge documents (updated with S3 support)
 CREATE TABLE IF NOT EXISTS common_knowledge_documents (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
@@ -106,6 +143,8 @@ CREATE INDEX IF NOT EXISTS idx_spoc_assignments_spoc ON spoc_assignments(spoc_em
 CREATE INDEX IF NOT EXISTS idx_spoc_assignments_user ON spoc_assignments(assigned_user_email);
 CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations(user_id);
 CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id);
+CREATE INDEX IF NOT EXISTS idx_message_usage_user ON message_usage(user_email, created_at);
+CREATE INDEX IF NOT EXISTS idx_message_usage_conversation ON message_usage(conversation_id);
 CREATE INDEX IF NOT EXISTS idx_email_whitelist_email ON email_whitelist(email);
 CREATE INDEX IF NOT EXISTS idx_email_whitelist_active ON email_whitelist(is_active);
 CREATE INDEX IF NOT EXISTS idx_email_whitelist_role ON email_whitelist(role);
@@ -126,6 +165,7 @@ ALTER TABLE users ENABLE ROW LEVEL SECURITY;
 ALTER TABLE spoc_assignments ENABLE ROW LEVEL SECURITY;
 ALTER TABLE conversations ENABLE ROW LEVEL SECURITY;
 ALTER TABLE messages ENABLE ROW LEVEL SECURITY;
+ALTER TABLE message_usage ENABLE ROW LEVEL SECURITY;
 ALTER TABLE common_knowledge_documents ENABLE ROW LEVEL SECURITY;
 ALTER TABLE user_documents ENABLE ROW LEVEL SECURITY;
 ALTER TABLE departments ENABLE ROW LEVEL SECURITY;
@@ -138,6 +178,7 @@ BEGIN
     DROP POLICY IF EXISTS "Service role can do everything" ON spoc_assignments;
     DROP POLICY IF EXISTS "Service role can do everything" ON conversations;
     DROP POLICY IF EXISTS "Service role can do everything" ON messages;
+    DROP POLICY IF EXISTS "Service role can do everything" ON message_usage;
     DROP POLICY IF EXISTS "Service role can do everything" ON common_knowledge_documents;
     DROP POLICY IF EXISTS "Service role can do everything" ON user_documents;
     DROP POLICY IF EXISTS "Service role can do everything" ON departments;
@@ -151,6 +192,7 @@ CREATE POLICY "Service role can do everything" ON users FOR ALL USING (true);
 CREATE POLICY "Service role can do everything" ON spoc_assignments FOR ALL USING (true);
 CREATE POLICY "Service role can do everything" ON conversations FOR ALL USING (true);
 CREATE POLICY "Service role can do everything" ON messages FOR ALL USING (true);
+CREATE POLICY "Service role can do everything" ON message_usage FOR ALL USING (true);
 CREATE POLICY "Service role can do everything" ON common_knowledge_documents FOR ALL USING (true);
 CREATE POLICY "Service role can do everything" ON user_documents FOR ALL USING (true);
 CREATE POLICY "Service role can do everything" ON departments FOR ALL USING (true);
\ No newline at end of file
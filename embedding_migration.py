@@ -0,0 +1,458 @@
+# embedding_migration.py - Rebuild vector indexes at a different embedding dimensionality
+#
+# text-embedding-3 models are trained so that a vector's leading components are
+# themselves a usable embedding. Shrinking the index therefore reuses the stored
+# vectors (truncate + re-normalize) instead of calling the API again; growing it,
+# or leaving a non-Matryoshka model, re-embeds the stored chunk text.
+#
+# The new index is written beside the live one (rag_index/dim_<n>, or <name>_d<n>
+# collections in server mode), so search keeps working until EMBEDDING_DIMENSIONS
+# is switched and the app restarted.
+#
+# From start until that restart a lock file in RAG_INDEX_PATH pauses indexing in
+# every worker, and a final pass re-syncs each target with its source so chunks
+# deleted (or written just before the lock) during the copy are not lost.
+import os
+import re
+import json
+import socket
+import random
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple, Optional
+
+from config import (
+    RAG_INDEX_PATH, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, EMBEDDING_MODEL_DIMENSIONS,
+    RECALL_PROBE_SAMPLES, SHARED_USER_COLLECTION_NAME,
+    NUMPY_VECTOR_DTYPE, TOP_K, EMBEDDING_MIGRATION_LOCK_FILE
+)
+from vector_backends import (
+    NumpyCollection, copy_collection, truncate_embeddings,
+    dimension_index_path, remove_numpy_store
+)
+from rag_service import rag_service
+
+MIGRATION_BATCH_SIZE = 500
+LOCK_PATH = Path(RAG_INDEX_PATH) / EMBEDDING_MIGRATION_LOCK_FILE
+
+def _read_lock() -> Optional[Dict]:
+    try:
+        return json.loads(LOCK_PATH.read_text())
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        return {"state": "unknown"}
+
+def _create_lock(fields: Dict) -> bool:
+    """Take the lock; False if another migration (any worker) holds it"""
+    try:
+        fd = os.open(LOCK_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        json.dump(fields, f)
+    return True
+
+def _update_lock(**fields):
+    lock = _read_lock() or {}
+    lock.update(fields)
+    temp_path = LOCK_PATH.with_suffix(".tmp")
+    temp_path.write_text(json.dumps(lock))
+    os.replace(temp_path, LOCK_PATH)
+
+def _remove_lock():
+    LOCK_PATH.unlink(missing_ok=True)
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def release_after_cutover():
+    """Resume indexing at startup once the app runs on the migrated index.
+
+    Also clears a lock left by a migration whose process died on this host.
+    """
+    lock = _read_lock()
+    if not lock:
+        return
+    if lock.get("target_dimensions") == EMBEDDING_DIMENSIONS:
+        _remove_lock()
+        print(f"Embedding migration cutover to {EMBEDDING_DIMENSIONS}d complete; indexing resumed")
+    elif (lock.get("state") == "running" and lock.get("host") == socket.gethostname()
+            and not _process_alive(lock.get("pid", 0))):
+        _remove_lock()
+        print("Embedding migration was interrupted; indexing resumed on the current index")
+    else:
+        print(f"⚠️ Embedding migration to {lock.get('target_dimensions')}d pending; indexing paused "
+              f"until EMBEDDING_DIMENSIONS is switched or the migration is discarded")
+
+def _top_ids(collection, vector: List[float], k: int) -> List[str]:
+    """Nearest chunk ids for a raw vector from either backend"""
+    if isinstance(collection, NumpyCollection):
+        return [collection.record(position)[0] for position, _ in collection.query_vector(vector, k)]
+    result = collection.query(query_embeddings=[vector], n_results=k, include=["distances"])
+    return result["ids"][0]
+
+def _directory_size(path: Path) -> int:
+    if not path.exists():
+        return 0
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+def _clear_collection(collection):
+    """Empty a target left over from an earlier, interrupted run"""
+    while collection.count() > 0:
+        ids = collection.get(limit=MIGRATION_BATCH_SIZE, include=[])["ids"]
+        if not ids:
+            break
+        collection.delete(ids=ids)
+
+def _all_ids(collection) -> List[str]:
+    ids = []
+    while True:
+        batch = collection.get(limit=MIGRATION_BATCH_SIZE, offset=len(ids), include=[])["ids"]
+        if not batch:
+            return ids
+        ids.extend(batch)
+
+def _resync(source, target, transform) -> Tuple[int, int]:
+    """Copy chunks the target is missing and drop ones since deleted from the source"""
+    source_ids = _all_ids(source)
+    target_ids = set(_all_ids(target))
+    live = set(source_ids)
+
+    missing = [chunk_id for chunk_id in source_ids if chunk_id not in target_ids]
+    for i in range(0, len(missing), MIGRATION_BATCH_SIZE):
+        batch = source.get(
+            ids=missing[i:i + MIGRATION_BATCH_SIZE],
+            include=["embeddings", "documents", "metadatas"]
+        )
+        if batch["ids"]:
+            target.upsert(
+                ids=batch["ids"],
+                embeddings=transform(batch),
+                documents=batch["documents"],
+                metadatas=batch["metadatas"]
+            )
+
+    stale = [chunk_id for chunk_id in target_ids if chunk_id not in live]
+    for i in range(0, len(stale), MIGRATION_BATCH_SIZE):
+        target.delete(ids=stale[i:i + MIGRATION_BATCH_SIZE])
+
+    return len(missing), len(stale)
+
+
+class EmbeddingMigration:
+    """Background rebuild of every collection at a new embedding size, with a recall report"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = {"state": "idle"}
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            status = dict(self._status)
+        if status["state"] == "idle":
+            # Started by another worker or before a restart
+            lock = _read_lock()
+            if lock:
+                status = dict(lock, indexing_paused=True)
+        return status
+
+    def _update(self, **fields):
+        with self._lock:
+            self._status.update(fields)
+
+    def _source_dimensions(self) -> Optional[int]:
+        return EMBEDDING_DIMENSIONS or EMBEDDING_MODEL_DIMENSIONS.get(EMBEDDING_MODEL)
+
+    def _method(self, target_dimensions: int) -> str:
+        source_dimensions = self._source_dimensions()
+        if (EMBEDDING_MODEL.startswith("text-embedding-3") and source_dimensions
+                and target_dimensions < source_dimensions):
+            return "truncate"
+        return "reembed"
+
+    def start(self, target_dimensions: int) -> Tuple[bool, str]:
+        """Kick off the rebuild; only one migration runs per process"""
+        if target_dimensions <= 0:
+            return False, "Target dimensions must be positive"
+        if not EMBEDDING_MODEL.startswith("text-embedding-3"):
+            return False, f"{EMBEDDING_MODEL} does not support reduced dimensions"
+        if target_dimensions == self._source_dimensions():
+            return False, f"Index is already at {target_dimensions} dimensions"
+
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return False, "A migration is already running"
+
+            started_at = datetime.now().isoformat()
+            if not _create_lock({
+                "state": "running",
+                "pid": os.getpid(),
+                "host": socket.gethostname(),
+                "source_dimensions": self._source_dimensions(),
+                "target_dimensions": target_dimensions,
+                "started_at": started_at
+            }):
+                lock = _read_lock() or {}
+                return False, (f"A migration to {lock.get('target_dimensions')} dimensions is "
+                               f"{lock.get('state', 'pending')}; switch to it or discard it first")
+
+            self._status = {
+                "state": "running",
+                "source_dimensions": self._source_dimensions(),
+                "target_dimensions": target_dimensions,
+                "method": self._method(target_dimensions),
+                "started_at": started_at,
+                "collections_total": 0,
+                "collections_done": 0,
+                "current_collection": None,
+                "vectors_copied": 0,
+                "errors": []
+            }
+            self._thread = threading.Thread(
+                target=self._run, args=(target_dimensions,),
+                name="embedding-migration", daemon=True
+            )
+            self._thread.start()
+
+        return True, (f"Migrating to {target_dimensions} dimensions in the background; "
+                      f"indexing is paused until the switch")
+
+    def discard(self) -> Tuple[bool, str]:
+        """Drop a pending migration so indexing resumes on the current index"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return False, "The migration is still running"
+            lock = _read_lock()
+            if not lock:
+                return False, "No migration is pending"
+            if lock.get("state") == "running" and lock.get("pid") != os.getpid():
+                return False, "The migration is still running in another worker"
+            _remove_lock()
+            self._status = {"state": "idle"}
+        return True, f"Discarded the migration to {lock.get('target_dimensions')} dimensions; indexing resumed"
+
+    # ========== COLLECTION DISCOVERY ==========
+
+    def _collections(self) -> List[Tuple[str, Path]]:
+        """(collection_name, path relative to the index root) for every live collection"""
+        if rag_service.is_server_mode():
+            return self._server_collections()
+
+        index_path = rag_service.index_path
+        collections = [("common_knowledge", Path("common_knowledge"))]
+
+        if (index_path / SHARED_USER_COLLECTION_NAME).exists():
+            collections.append((SHARED_USER_COLLECTION_NAME, Path(SHARED_USER_COLLECTION_NAME)))
+
+        users_path = index_path / "users"
+        if users_path.exists():
+            for user_dir in sorted(users_path.iterdir()):
+                if user_dir.is_dir():
+                    collections.append((user_dir.name, Path("users") / user_dir.name))
+
+        return collections
+
+    def _server_collections(self) -> List[Tuple[str, Path]]:
+        suffix = re.compile(r"_d\d+$")
+        collections = []
+        for collection in rag_service._get_chroma_client().list_collections():
+            name = getattr(collection, "name", collection)
+            if EMBEDDING_DIMENSIONS:
+                if not name.endswith(f"_d{EMBEDDING_DIMENSIONS}"):
+                    continue
+                name = name[:-len(f"_d{EMBEDDING_DIMENSIONS}")]
+            elif suffix.search(name):
+                continue
+
+            if name.startswith("user_"):
+                collections.append((name, Path("users") / name))
+            else:
+                collections.append((name, Path(name)))
+        return sorted(collections)
+
+    def _open_source(self, name: str, relative_path: Path):
+        path = rag_service.index_path / relative_path
+        if not rag_service.is_server_mode() and NumpyCollection.exists(path):
+            return NumpyCollection(path)
+        return rag_service._create_vectorstore(name, path)._collection
+
+    def _open_target(self, name: str, relative_path: Path, source, target_dimensions: int, embeddings,
+                     fresh: bool = True):
+        path = dimension_index_path(RAG_INDEX_PATH, target_dimensions) / relative_path
+        if isinstance(source, NumpyCollection):
+            if fresh:
+                remove_numpy_store(path)
+            return NumpyCollection(path, dtype=NUMPY_VECTOR_DTYPE)
+
+        target = rag_service._create_vectorstore(
+            name, path, dimensions=target_dimensions, embeddings=embeddings
+        )._collection
+        if fresh:
+            _clear_collection(target)
+        return target
+
+    # ========== MIGRATION ==========
+
+    def _run(self, target_dimensions: int):
+        method = self._method(target_dimensions)
+        embeddings = rag_service.create_embeddings(target_dimensions)
+
+        if method == "truncate":
+            transform = lambda batch: truncate_embeddings(batch["embeddings"], target_dimensions)
+        else:
+            transform = lambda batch: embeddings.embed_documents(
+                [document or "" for document in batch["documents"]]
+            )
+
+        recall_hits = 0
+        recall_total = 0
+        source_query_seconds = 0.0
+        target_query_seconds = 0.0
+        probes = 0
+        source_bytes = 0
+        target_bytes = 0
+        errors = []
+        copied_collections = []
+
+        try:
+            collections = self._collections()
+            self._update(collections_total=len(collections))
+
+            for name, relative_path in collections:
+                self._update(current_collection=name)
+                try:
+                    source = self._open_source(name, relative_path)
+                    if source.count() == 0:
+                        self._update(collections_done=self.get_status()["collections_done"] + 1)
+                        continue
+
+                    target = self._open_target(name, relative_path, source, target_dimensions, embeddings)
+                    copied = copy_collection(
+                        source, target,
+                        batch_size=MIGRATION_BATCH_SIZE,
+                        transform_embeddings=transform
+                    )
+
+                    hits, total, source_seconds, target_seconds, count = self._measure(source, target)
+                    recall_hits += hits
+                    recall_total += total
+                    source_query_seconds += source_seconds
+                    target_query_seconds += target_seconds
+                    probes += count
+
+                    if not rag_service.is_server_mode():
+                        source_bytes += _directory_size(rag_service.index_path / relative_path)
+                        target_bytes += _directory_size(
+                            dimension_index_path(RAG_INDEX_PATH, target_dimensions) / relative_path
+                        )
+
+                    if isinstance(target, NumpyCollection):
+                        target.close()
+                    copied_collections.append((name, relative_path))
+
+                    status = self.get_status()
+                    self._update(
+                        collections_done=status["collections_done"] + 1,
+                        vectors_copied=status["vectors_copied"] + copied
+                    )
+                    print(f"Embedding migration: {name} -> {copied} vectors at {target_dimensions}d")
+                except Exception as e:
+                    errors.append(f"{name}: {str(e)}")
+                    self._update(errors=list(errors))
+
+            # Indexing was paused for the whole copy; pick up deletions made meanwhile
+            # and any chunk written by a request that passed the check before the lock
+            self._update(current_collection=None, state="resyncing")
+            for name, relative_path in copied_collections:
+                try:
+                    source = self._open_source(name, relative_path)
+                    target = self._open_target(
+                        name, relative_path, source, target_dimensions, embeddings, fresh=False
+                    )
+                    added, dropped = _resync(source, target, transform)
+                    if isinstance(target, NumpyCollection):
+                        target.close()
+                    if added or dropped:
+                        print(f"Embedding migration: {name} re-synced (+{added} / -{dropped})")
+                except Exception as e:
+                    errors.append(f"{name}: re-sync failed: {str(e)}")
+                    self._update(errors=list(errors))
+
+            report = {
+                "recall_at_k": round(recall_hits / recall_total, 4) if recall_total else None,
+                "recall_k": TOP_K,
+                "recall_probes": probes,
+                "mean_query_ms_source": round(source_query_seconds * 1000 / probes, 3) if probes else None,
+                "mean_query_ms_target": round(target_query_seconds * 1000 / probes, 3) if probes else None,
+            }
+            if not rag_service.is_server_mode():
+                report["index_bytes_source"] = source_bytes
+                report["index_bytes_target"] = target_bytes
+
+            state = "completed" if not errors else "completed_with_errors"
+            finished_at = datetime.now().isoformat()
+            self._update(
+                state=state,
+                current_collection=None,
+                finished_at=finished_at,
+                message=(f"Set EMBEDDING_DIMENSIONS={target_dimensions} and restart to switch indexes; "
+                         f"indexing stays paused until then"),
+                **report
+            )
+            _update_lock(state=state, finished_at=finished_at, errors=errors, **report)
+            print(f"Embedding migration finished: {report}")
+        except Exception as e:
+            _remove_lock()
+            self._update(state="failed", finished_at=datetime.now().isoformat(), message=str(e))
+            print(f"Embedding migration failed: {e}")
+
+    def _measure(self, source, target) -> Tuple[int, int, float, float, int]:
+        """Overlap of top-k neighbours before and after, using stored chunks as probe queries"""
+        count = source.count()
+        if count < 2:
+            return 0, 0, 0.0, 0.0, 0
+
+        k = min(TOP_K, count - 1)
+        samples = min(RECALL_PROBE_SAMPLES, count)
+        offset = random.randint(0, count - samples)
+        probe = source.get(limit=samples, offset=offset, include=["embeddings"])
+        target_vectors = target.get(ids=probe["ids"], include=["embeddings"])
+        target_by_id = dict(zip(target_vectors["ids"], target_vectors["embeddings"]))
+
+        hits = 0
+        total = 0
+        source_seconds = 0.0
+        target_seconds = 0.0
+        measured = 0
+
+        for chunk_id, source_vector in zip(probe["ids"], probe["embeddings"]):
+            target_vector = target_by_id.get(chunk_id)
+            if target_vector is None:
+                continue
+
+            started = time.perf_counter()
+            expected = [i for i in _top_ids(source, list(source_vector), k + 1) if i != chunk_id][:k]
+            source_seconds += time.perf_counter() - started
+
+            started = time.perf_counter()
+            found = [i for i in _top_ids(target, list(target_vector), k + 1) if i != chunk_id][:k]
+            target_seconds += time.perf_counter() - started
+
+            hits += len(set(expected) & set(found))
+            total += len(expected)
+            measured += 1
+
+        return hits, total, source_seconds, target_seconds, measured
+
+# Global migration instance
+embedding_migration = EmbeddingMigration()
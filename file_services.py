@@ -9,17 +9,17 @@ from datetime import datetime
 
 from config import (
     COMMON_KNOWLEDGE_PATH, RAG_DOCUMENTS_PATH, 
-    SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, IS_PRODUCTION, USE_S3_STORAGE
+    IS_PRODUCTION, USE_S3_STORAGE
 )
 from constants import SUPPORTED_EXTENSIONS, MAX_FILE_SIZE_MB, ERROR_MESSAGES
-from supabase import create_client
+from local_store import create_metadata_client
 from s3_storage import s3_storage
 
 class EnhancedFileService:
     """Unified file management service with S3 storage support"""
     
     def __init__(self):
-        self.supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.supabase = create_metadata_client()
         
         # Create local directories for temp processing (always needed)
         self.common_knowledge_path = Path(COMMON_KNOWLEDGE_PATH)
@@ -528,11 +528,11 @@ class EnhancedFileService:
             # Remove from vector store first (if exists)
             try:
                 from rag_service import rag_service
-                vectorstore = rag_service.get_user_vectorstore(user_email)
-                collection = vectorstore._collection
-                results = collection.get(where={"file_name": file_name})
-                if results['ids']:
-                    collection.delete(ids=results['ids'])
+                with rag_service.lease_user_vectorstore(user_email) as vectorstore:
+                    collection = vectorstore._collection
+                    results = collection.get(where={"file_name": file_name})
+                    if results['ids']:
+                        collection.delete(ids=results['ids'])
             except Exception as e:
                 print(f"Warning: Could not remove from vector store: {e}")
             
@@ -793,9 +793,8 @@ class EnhancedFileService:
         """Get chunks count for user file"""
         try:
             from rag_service import rag_service
-            vectorstore = rag_service.get_user_vectorstore(user_email)
-            collection = vectorstore._collection
-            existing_results = collection.get(where={"file_name": file_name})
+            with rag_service.lease_user_vectorstore(user_email) as vectorstore:
+                existing_results = vectorstore._collection.get(where={"file_name": file_name})
             return len(existing_results['ids']) if existing_results and existing_results['ids'] else 0
         except Exception:
             return 0
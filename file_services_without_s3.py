@@ -8,16 +8,16 @@ from datetime import datetime
 
 from config import (
     COMMON_KNOWLEDGE_PATH, RAG_DOCUMENTS_PATH, 
-    SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, IS_PRODUCTION
+    IS_PRODUCTION
 )
 from constants import SUPPORTED_EXTENSIONS, MAX_FILE_SIZE_MB, ERROR_MESSAGES
-from supabase import create_client
+from local_store import create_metadata_client
 
 class EnhancedFileService:
     """Unified file management service for both common knowledge and user files"""
     
     def __init__(self):
-        self.supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.supabase = create_metadata_client()
         self.common_knowledge_path = Path(COMMON_KNOWLEDGE_PATH)
         self.documents_path = Path(RAG_DOCUMENTS_PATH)
         self.common_knowledge_path.mkdir(parents=True, exist_ok=True)
@@ -663,9 +663,8 @@ class EnhancedFileService:
             
             # Get chunks count from user vector store
             try:
-                vectorstore = rag_service.get_user_vectorstore(user_email)
-                collection = vectorstore._collection
-                existing_results = collection.get(where={"file_name": file_path.name})
+                with rag_service.lease_user_vectorstore(user_email) as vectorstore:
+                    existing_results = vectorstore._collection.get(where={"file_name": file_path.name})
                 chunks_count = len(existing_results['ids']) if existing_results and existing_results['ids'] else 0
             except Exception as e:
                 chunks_count = 0
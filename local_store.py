@@ -0,0 +1,519 @@
+# local_store.py - In-process SQLite metadata store (METADATA_BACKEND=sqlite)
+#
+# Implements the tables of database_schema.sql behind the subset of the Supabase/PostgREST
+# query builder the services use (select/insert/upsert/update/delete, eq/neq/gt/gte/lt/lte/
+# in_/is_/like/ilike filters, order, limit/range, count="exact" and embedded parents such
+# as "conversations!inner(user_id, title)"), so ChatService, UserManagement, the file
+# services and ReviewClarificationService run unchanged on either backend.
+#
+# The database runs in WAL mode: readers never block the writer, and several uvicorn
+# workers on one host can share the file. Each thread keeps its own connection.
+# Supabase is still used for Google sign-in; only table data moves in-process.
+#
+# create_async_metadata_client() is the awaitable counterpart for async callers: Supabase's
+# AsyncClient, or the local store with each execute() run on a worker thread.
+import re
+import asyncio
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import METADATA_BACKEND, METADATA_DB_PATH, SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
+from tracing import span
+
+_UUID = ("(lower(hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-4' || substr(hex(randomblob(2)), 2) || '-' "
+         "|| substr('89ab', 1 + (abs(random()) % 4), 1) || substr(hex(randomblob(2)), 2) || '-' || hex(randomblob(6))))")
+_NOW = "(strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))"
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS email_whitelist (
+    id TEXT PRIMARY KEY DEFAULT {_UUID},
+    email TEXT NOT NULL UNIQUE,
+    role TEXT DEFAULT 'user' CHECK (role IN ('admin', 'spoc', 'user')),
+    added_by TEXT NOT NULL,
+    added_at TEXT DEFAULT {_NOW},
+    is_active INTEGER DEFAULT 1,
+    department TEXT
+);
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT NOT NULL PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    role TEXT DEFAULT 'user' CHECK (role IN ('admin', 'spoc', 'user')),
+    avatar_url TEXT,
+    provider TEXT DEFAULT 'google',
+    last_login TEXT,
+    created_at TEXT DEFAULT {_NOW},
+    metadata TEXT
+);
+CREATE TABLE IF NOT EXISTS spoc_assignments (
+    id TEXT PRIMARY KEY DEFAULT {_UUID},
+    spoc_email TEXT NOT NULL,
+    assigned_user_email TEXT NOT NULL,
+    created_at TEXT DEFAULT {_NOW},
+    UNIQUE(spoc_email, assigned_user_email)
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY DEFAULT {_UUID},
+    user_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    summary TEXT,
+    summarized_turns INTEGER DEFAULT 0,
+    created_at TEXT DEFAULT {_NOW},
+    updated_at TEXT DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY DEFAULT {_UUID},
+    conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    role TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
+    content TEXT NOT NULL,
+    feedback TEXT,
+    clarification_text TEXT,
+    clarified_by TEXT,
+    clarified_at TEXT,
+    created_at TEXT DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS message_usage (
+    message_id TEXT PRIMARY KEY REFERENCES messages(id) ON DELETE CASCADE,
+    conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    user_email TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_tokens INTEGER DEFAULT 0,
+    cached_tokens INTEGER DEFAULT 0,
+    completion_tokens INTEGER DEFAULT 0,
+    embedding_tokens INTEGER DEFAULT 0,
+    cost_usd REAL DEFAULT 0,
+    retrieval_ms INTEGER,
+    packing_ms INTEGER,
+    llm_ms INTEGER,
+    total_ms INTEGER,
+    created_at TEXT DEFAULT {_NOW}
+);
+CREATE TABLE IF NOT EXISTS common_knowledge_documents (
+    id TEXT PRIMARY KEY DEFAULT {_UUID},
+    file_name TEXT NOT NULL UNIQUE,
+    file_path TEXT NOT NULL,
+    file_size INTEGER NOT NULL,
+    file_hash TEXT,
+    chunks_count INTEGER DEFAULT 0,
+    uploaded_at TEXT DEFAULT {_NOW},
+    uploaded_by TEXT NOT NULL,
+    indexed_at TEXT,
+    is_common_knowledge INTEGER DEFAULT 1,
+    storage_type TEXT DEFAULT 'local' CHECK (storage_type IN ('local', 's3'))
+);
+CREATE TABLE IF NOT EXISTS user_documents (
+    id TEXT PRIMARY KEY DEFAULT {_UUID},
+    user_email TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    file_size INTEGER NOT NULL,
+    file_hash TEXT,
+    chunks_count INTEGER DEFAULT 0,
+    uploaded_at TEXT DEFAULT {_NOW},
+    uploaded_by TEXT NOT NULL,
+    indexed_at TEXT,
+    storage_type TEXT DEFAULT 'local' CHECK (storage_type IN ('local', 's3')),
+    created_at TEXT DEFAULT {_NOW},
+    UNIQUE(user_email, file_name)
+);
+CREATE TABLE IF NOT EXISTS departments (
+    id TEXT PRIMARY KEY DEFAULT {_UUID},
+    name TEXT NOT NULL UNIQUE,
+    created_by TEXT NOT NULL,
+    created_at TEXT DEFAULT {_NOW}
+);
+
+CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
+CREATE INDEX IF NOT EXISTS idx_spoc_assignments_user ON spoc_assignments(assigned_user_email);
+CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations(user_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_message_usage_user ON message_usage(user_email, created_at);
+CREATE INDEX IF NOT EXISTS idx_message_usage_conversation ON message_usage(conversation_id);
+CREATE INDEX IF NOT EXISTS idx_email_whitelist_active ON email_whitelist(is_active);
+
+CREATE TRIGGER IF NOT EXISTS messages_touch_conversation AFTER INSERT ON messages
+BEGIN
+    UPDATE conversations SET updated_at = NEW.created_at WHERE id = NEW.conversation_id;
+END;
+"""
+
+# Columns SQLite cannot type natively, converted on the way in and out
+BOOLEAN_COLUMNS = {"email_whitelist": {"is_active"}, "common_knowledge_documents": {"is_common_knowledge"}}
+JSON_COLUMNS = {"users": {"metadata"}}
+
+# Default upsert conflict target when on_conflict is not given
+PRIMARY_KEYS = {"message_usage": "message_id"}
+
+_EMBED = re.compile(r"(\w+)(!inner)?\(([^)]*)\)")
+_METHODS = {"select": "GET", "insert": "POST", "upsert": "POST", "update": "PATCH", "delete": "DELETE"}
+
+
+class LocalResponse:
+    """Same shape as postgrest's APIResponse (data, count)"""
+
+    def __init__(self, data: List[Dict], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class LocalQuery:
+    """Chainable query on one table, compiled to a single SQL statement on execute()"""
+
+    def __init__(self, store: "LocalMetadataStore", table: str):
+        if table not in store.columns:
+            raise ValueError(f"Unknown table: {table}")
+        self.store = store
+        self.table = table
+        self.operation = "select"
+        self.columns = "*"
+        self.count_mode = None
+        self.payload = None
+        self.on_conflict = None
+        self.ignore_duplicates = False
+        self.filters: List[Tuple[str, str, Any]] = []
+        self.ordering: List[Tuple[str, bool]] = []
+        self.limit_count = None
+        self.offset = 0
+
+    # ---- operations ----
+
+    def select(self, columns: str = "*", count: Optional[str] = None):
+        if self.operation == "select":
+            self.columns = columns
+        self.count_mode = count
+        return self
+
+    def insert(self, values, **kwargs):
+        self.operation, self.payload = "insert", values
+        return self
+
+    def upsert(self, values, on_conflict: Optional[str] = None, ignore_duplicates: bool = False, **kwargs):
+        self.operation, self.payload = "upsert", values
+        self.on_conflict, self.ignore_duplicates = on_conflict, ignore_duplicates
+        return self
+
+    def update(self, values: Dict, **kwargs):
+        self.operation, self.payload = "update", values
+        return self
+
+    def delete(self, **kwargs):
+        self.operation = "delete"
+        return self
+
+    # ---- filters ----
+
+    def _filter(self, column: str, operator: str, value):
+        self.filters.append((column, operator, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, "=", value)
+
+    def neq(self, column, value):
+        return self._filter(column, "!=", value)
+
+    def gt(self, column, value):
+        return self._filter(column, ">", value)
+
+    def gte(self, column, value):
+        return self._filter(column, ">=", value)
+
+    def lt(self, column, value):
+        return self._filter(column, "<", value)
+
+    def lte(self, column, value):
+        return self._filter(column, "<=", value)
+
+    def in_(self, column, values):
+        return self._filter(column, "IN", list(values))
+
+    def is_(self, column, value):
+        return self._filter(column, "IS", None if value in (None, "null") else value)
+
+    def like(self, column, pattern):
+        return self._filter(column, "GLOB", pattern.replace("%", "*").replace("_", "?"))
+
+    def ilike(self, column, pattern):
+        return self._filter(column, "LIKE", pattern)
+
+    def order(self, column, desc: bool = False, **kwargs):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, count: int, **kwargs):
+        self.limit_count = count
+        return self
+
+    def range(self, start: int, end: int, **kwargs):
+        self.offset, self.limit_count = start, end - start + 1
+        return self
+
+    # ---- SQL ----
+
+    def _column(self, name: str, table: Optional[str] = None) -> str:
+        table = table or self.table
+        if name not in self.store.columns[table]:
+            raise ValueError(f"Unknown column {table}.{name}")
+        return f'"{table}"."{name}"'
+
+    def _embeds(self) -> List[Tuple[str, List[str], bool]]:
+        return [
+            (name, [c.strip() for c in columns.split(",") if c.strip()], bool(inner))
+            for name, inner, columns in _EMBED.findall(self.columns)
+        ]
+
+    def _where(self) -> Tuple[str, List]:
+        clauses, params = [], []
+        for column, operator, value in self.filters:
+            if "." in column:
+                table, _, column = column.partition(".")
+                sql_column = self._column(column, table)
+            else:
+                sql_column = self._column(column)
+
+            if operator == "IN":
+                if not value:
+                    clauses.append("0")
+                    continue
+                clauses.append(f"{sql_column} IN ({', '.join('?' * len(value))})")
+                params.extend(self.store.encode(self.table, column, v) for v in value)
+            elif operator == "IS":
+                clauses.append(f"{sql_column} IS ?")
+                params.append(value)
+            else:
+                clauses.append(f"{sql_column} {operator} ?")
+                params.append(self.store.encode(self.table, column, value))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _from(self) -> str:
+        joins = [f'"{self.table}"']
+        for name, _, inner in self._embeds():
+            foreign_key = self._column(name.rstrip("s") + "_id")
+            joins.append(f'{"INNER" if inner else "LEFT"} JOIN "{name}" ON "{name}"."id" = {foreign_key}')
+        return " ".join(joins)
+
+    def _select(self, connection) -> LocalResponse:
+        plain = [c.strip() for c in _EMBED.sub("", self.columns).split(",") if c.strip()]
+        selected = [f'"{self.table}".*'] if "*" in plain else [self._column(c) for c in plain]
+        embeds = self._embeds()
+        for name, columns, _ in embeds:
+            selected += [f'{self._column(c, name)} AS "{name}.{c}"' for c in columns]
+
+        where, params = self._where()
+        sql = f"SELECT {', '.join(selected)} FROM {self._from()}{where}"
+        ordering = []
+        for column, desc in self.ordering:
+            sql_column = self._column(column)
+            # PostgreSQL sorts NULLs last ascending and first descending
+            ordering.append(f"{sql_column} IS NULL DESC, {sql_column} DESC" if desc
+                            else f"{sql_column} IS NULL, {sql_column}")
+        if ordering:
+            sql += " ORDER BY " + ", ".join(ordering)
+        if self.limit_count is not None or self.offset:
+            sql += " LIMIT ? OFFSET ?"
+            params = params + [-1 if self.limit_count is None else self.limit_count, self.offset]
+
+        rows = []
+        for row in connection.execute(sql, params).fetchall():
+            record = {}
+            for key in row.keys():
+                if "." in key:
+                    name, _, column = key.partition(".")
+                    record.setdefault(name, {})[column] = self.store.decode(name, column, row[key])
+                else:
+                    record[key] = self.store.decode(self.table, key, row[key])
+            for name, _, _ in embeds:
+                # A LEFT JOIN without a parent row comes back as all-NULL columns
+                if name in record and all(v is None for v in record[name].values()):
+                    record[name] = None
+            rows.append(record)
+
+        count = None
+        if self.count_mode:
+            where, params = self._where()
+            count = connection.execute(f"SELECT COUNT(*) FROM {self._from()}{where}", params).fetchone()[0]
+        return LocalResponse(rows, count)
+
+    def _write(self, connection) -> LocalResponse:
+        if self.operation in ("insert", "upsert"):
+            values = self.payload if isinstance(self.payload, list) else [self.payload]
+            written = []
+            for value in values:
+                columns = list(value.keys())
+                for column in columns:
+                    self._column(column)
+                names = ", ".join(f'"{c}"' for c in columns)
+                sql = f'INSERT INTO "{self.table}" ({names}) VALUES ({", ".join("?" * len(columns))})'
+                if self.operation == "upsert":
+                    target = self.on_conflict or PRIMARY_KEYS.get(self.table, "id")
+                    conflict = ", ".join(f'"{c.strip()}"' for c in target.split(","))
+                    updates = ", ".join(f'"{c}" = excluded."{c}"' for c in columns)
+                    if self.ignore_duplicates or not updates:
+                        sql += f" ON CONFLICT ({conflict}) DO NOTHING"
+                    else:
+                        sql += f" ON CONFLICT ({conflict}) DO UPDATE SET {updates}"
+                params = [self.store.encode(self.table, c, value[c]) for c in columns]
+                written += [self.store.decode_row(self.table, r)
+                            for r in connection.execute(sql + " RETURNING *", params).fetchall()]
+            return LocalResponse(written)
+
+        where, params = self._where()
+        if self.operation == "update":
+            for column in self.payload:
+                self._column(column)
+            assignments = ", ".join(f'"{c}" = ?' for c in self.payload)
+            params = [self.store.encode(self.table, c, v) for c, v in self.payload.items()] + params
+            sql = f'UPDATE "{self.table}" SET {assignments}{where} RETURNING *'
+        else:
+            sql = f'DELETE FROM "{self.table}"{where} RETURNING *'
+        return LocalResponse([self.store.decode_row(self.table, r) for r in connection.execute(sql, params).fetchall()])
+
+    def execute(self) -> LocalResponse:
+        with span(f"sqlite.{_METHODS[self.operation]} {self.table}"):
+            connection = self.store.connection()
+            self.store.queries += 1
+            if self.operation == "select":
+                return self._select(connection)
+            with connection:
+                return self._write(connection)
+
+
+class LocalMetadataStore:
+    """SQLite file holding the Supabase tables; exposes table() like a Supabase client"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self.queries = 0
+
+        connection = self.connection()
+        connection.executescript(SCHEMA)
+        self.columns: Dict[str, set] = {
+            table: {row["name"] for row in connection.execute(f'PRAGMA table_info("{table}")')}
+            for (table,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self._local.connection = connection
+        return connection
+
+    def table(self, name: str) -> LocalQuery:
+        return LocalQuery(self, name)
+
+    from_ = table
+
+    def encode(self, table: str, column: str, value):
+        if column in JSON_COLUMNS.get(table, ()) and value is not None:
+            return json.dumps(value)
+        if isinstance(value, (dict, list)):
+            return json.dumps(value)
+        return value
+
+    def decode(self, table: str, column: str, value):
+        if value is None:
+            return None
+        if column in BOOLEAN_COLUMNS.get(table, ()):
+            return bool(value)
+        if column in JSON_COLUMNS.get(table, ()):
+            return json.loads(value)
+        return value
+
+    def decode_row(self, table: str, row: sqlite3.Row) -> Dict:
+        return {key: self.decode(table, key, row[key]) for key in row.keys()}
+
+    def import_from(self, client, batch_size: int = 1000) -> Dict[str, int]:
+        """Copy every table from a Supabase client (parents before children), replacing local rows"""
+        order = ["email_whitelist", "users", "spoc_assignments", "departments", "conversations",
+                 "messages", "message_usage", "common_knowledge_documents", "user_documents"]
+        copied = {}
+        for table in reversed(order):
+            self.table(table).delete().execute()
+        for table in order:
+            copied[table] = 0
+            while True:
+                rows = client.table(table).select("*").range(copied[table], copied[table] + batch_size - 1).execute().data
+                if not rows:
+                    break
+                known = self.columns[table]
+                self.table(table).insert([{k: v for k, v in row.items() if k in known} for row in rows]).execute()
+                copied[table] += len(rows)
+                if len(rows) < batch_size:
+                    break
+        return copied
+
+
+class AsyncQuery:
+    """Wraps a synchronous query builder so execute() can be awaited; the query runs on a worker thread"""
+
+    def __init__(self, query):
+        self._query = query
+
+    def __getattr__(self, name):
+        attr = getattr(self._query, name)
+        if not callable(attr):
+            return attr
+
+        def chained(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return AsyncQuery(result) if hasattr(result, "execute") else result
+        return chained
+
+    async def execute(self):
+        # to_thread copies the context, so the query's span nests under the caller's
+        return await asyncio.to_thread(self._query.execute)
+
+
+class AsyncMetadataClient:
+    """Async table() over a synchronous client (the local store, or a Supabase stand-in)"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str) -> AsyncQuery:
+        return AsyncQuery(self._client.table(name))
+
+    from_ = table
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_local_store() -> LocalMetadataStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LocalMetadataStore(METADATA_DB_PATH)
+        return _store
+
+def create_metadata_client(supabase_key: Optional[str] = None):
+    """Client for the metadata tables: Supabase, or the local SQLite store when METADATA_BACKEND=sqlite"""
+    if METADATA_BACKEND == "sqlite":
+        return get_local_store()
+    from supabase import create_client
+    return create_client(SUPABASE_URL, supabase_key or SUPABASE_SERVICE_ROLE_KEY)
+
+async def create_async_metadata_client(supabase_key: Optional[str] = None):
+    """Async client for the metadata tables; queries are built the same way and end in await execute()"""
+    if METADATA_BACKEND == "sqlite":
+        return AsyncMetadataClient(get_local_store())
+    from supabase import acreate_client
+    return await acreate_client(SUPABASE_URL, supabase_key or SUPABASE_SERVICE_ROLE_KEY)
+
+if __name__ == "__main__":
+    # One-off switch of a single-node deployment: python local_store.py
+    from supabase import create_client
+    print(f"Copying Supabase tables into {METADATA_DB_PATH}...")
+    counts = get_local_store().import_from(create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY))
+    for table, count in counts.items():
+        print(f"  {table}: {count} rows")
@@ -1,20 +1,37 @@
 # main.py - FastAPI application with S3 storage support
 import warnings
 import os
+import sys
+
+if __name__ == "__main__":
+    # Hand over to uvicorn's own entry point before building the app: process pools (PDF
+    # extraction) re-import the __main__ script in every worker, and this file would
+    # rebuild the whole app there
+    from config import UVICORN_WORKERS
+    os.execv(sys.executable, [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "0.0.0.0", "--port", "8001",
+        "--workers", str(UVICORN_WORKERS), "--log-level", "info"
+    ])
+
 from typing import Optional
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import RedirectResponse, StreamingResponse
+from fastapi.responses import RedirectResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
-import uvicorn
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 warnings.filterwarnings("ignore", category=UserWarning, module="langchain")
 
+# Patch Supabase query execution for tracing before any service starts issuing queries
+from tracing import instrument_supabase, get_stage_percentiles
+instrument_supabase()
+from metrics import render_metrics, watch_sessions, watch_vectorstore_pool
+
 # Import modules
 try:
-    from auth import router as auth_router
+    from auth import router as auth_router, require_admin
     print(f"✅ Auth router imported with {len(auth_router.routes)} routes")
 except Exception as e:
     print(f"❌ Error importing auth router: {e}")
@@ -22,7 +39,7 @@ except Exception as e:
 
 from ui import create_ui
 from chat_service import chat_service
-from config import USE_S3_STORAGE, COMMON_KNOWLEDGE_PATH, RAG_DOCUMENTS_PATH
+from config import USE_S3_STORAGE, COMMON_KNOWLEDGE_PATH, RAG_DOCUMENTS_PATH, METRICS_ENABLED
 from s3_storage import s3_storage
 
 # Import enhanced RAG service with router
@@ -33,6 +50,10 @@ except Exception as e:
     print(f"❌ Error importing RAG service: {e}")
     exit(1)
 
+from ui_service import ui_service
+watch_sessions(ui_service.active_session_count)
+watch_vectorstore_pool(rag_service.get_user_vectorstore_pool_stats)
+
 # API router for health checks and basic endpoints
 api_router = APIRouter(tags=["API"])
 
@@ -47,6 +68,14 @@ async def health_check():
         "storage": storage_type
     }
 
+@api_router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint (chat turns, retrieval/LLM/Supabase/S3 latency, tokens, caches)"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
 @api_router.get("/api/user-stats/{user_email}")
 async def get_user_stats(user_email: str):
     """Get user statistics"""
@@ -60,8 +89,8 @@ async def get_user_stats(user_email: str):
         
         # Get document count from vector store
         try:
-            user_vectorstore = rag_service.get_user_vectorstore(user_email)
-            doc_count = user_vectorstore._collection.count()
+            with rag_service.lease_user_vectorstore(user_email) as user_vectorstore:
+                doc_count = user_vectorstore._collection.count()
         except Exception:
             doc_count = 0
 
@@ -75,6 +104,33 @@ async def get_user_stats(user_email: str):
     except Exception as e:
         return {"error": str(e)}
 
+@api_router.get("/api/prompt-cache-stats")
+async def get_prompt_cache_stats(request: Request):
+    """Chat token usage and provider prompt-cache hit ratio for this worker"""
+    require_admin(request)
+    try:
+        return chat_service.get_prompt_cache_stats()
+    except Exception as e:
+        return {"error": str(e)}
+
+@api_router.get("/api/trace-stats")
+async def get_trace_stats(request: Request):
+    """p50/p95/p99 latency per traced stage (retrieval, embeddings, LLM, Supabase, S3)"""
+    require_admin(request)
+    try:
+        return get_stage_percentiles()
+    except Exception as e:
+        return {"error": str(e)}
+
+@api_router.get("/api/usage-report")
+async def get_usage_report(request: Request, days: int = 30):
+    """Token, cost and latency per user, department and conversation (from message_usage; admin only)"""
+    require_admin(request)
+    try:
+        return chat_service.get_usage_report(days)
+    except Exception as e:
+        return {"error": str(e)}
+
 from typing import Optional
 
 @api_router.get("/docs/{file_name}")
@@ -254,20 +310,12 @@ async def startup_event():
     print("✅ Conversation management ready")
     print("✅ Authentication system ready")
     print("✅ Vector database cleanup endpoints ready")
+    from embedding_migration import release_after_cutover
+    release_after_cutover()
     print("🌐 Application ready for traffic")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     print("🛑 Shutting down SEVABOT RAG Assistant...")
+    chat_service.flush_usage_writes()
     print("✅ Shutdown complete")
-
-if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8001,
-        workers=1,
-        reload=False,
-        access_log=True,
-        log_level="info"
-    )
\ No newline at end of file
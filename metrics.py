@@ -0,0 +1,156 @@
+# metrics.py - Prometheus metrics for the FastAPI app (/metrics)
+#
+# Latencies come from the tracing spans (chat turn, retrieval, OpenAI, Supabase/SQLite, S3, indexing)
+# through a span listener, so each stage is timed once. Token usage is pushed by ChatService;
+# session and vector store pool gauges are read from their owners at scrape time.
+#
+# With UVICORN_WORKERS > 1 set PROMETHEUS_MULTIPROC_DIR to an empty, writable directory so
+# counters and histograms are summed across workers. Scrape-time gauges then describe only
+# the worker that answered the scrape.
+from typing import Callable, Dict, Any
+
+from config import METRICS_ENABLED, PROMETHEUS_MULTIPROC_DIR
+
+from prometheus_client import (
+    Counter, Histogram, Gauge, CollectorRegistry, REGISTRY,
+    generate_latest, CONTENT_TYPE_LATEST
+)
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+
+from tracing import add_span_listener
+
+# Seconds; chat turns and LLM calls run long, Supabase/S3 calls short
+FAST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+CHAT_TURNS = Counter("sevabot_chat_turns_total", "Chat turns handled", ["status"])
+CHAT_TURN_SECONDS = Histogram("sevabot_chat_turn_seconds", "End-to-end chat turn latency",
+                              buckets=SLOW_BUCKETS)
+
+RETRIEVAL_SECONDS = Histogram("sevabot_retrieval_seconds", "Vector search latency",
+                              ["collection"], buckets=FAST_BUCKETS)
+
+LLM_SECONDS = Histogram("sevabot_llm_seconds", "Chat completion latency", ["model"],
+                        buckets=SLOW_BUCKETS)
+LLM_TOKENS = Counter("sevabot_llm_tokens_total", "Chat completion tokens", ["model", "kind"])
+
+EMBEDDING_CALLS = Counter("sevabot_embedding_calls_total", "Embedding API calls", ["operation"])
+EMBEDDING_INPUTS = Counter("sevabot_embedding_inputs_total", "Texts sent to the embedding API",
+                           ["operation"])
+EMBEDDING_SECONDS = Histogram("sevabot_embedding_seconds", "Embedding API latency", ["operation"],
+                              buckets=FAST_BUCKETS)
+
+INDEXED_CHUNKS = Counter("sevabot_indexed_chunks_total", "Chunks written to vector stores")
+INDEXING_SECONDS = Histogram("sevabot_indexing_seconds", "Time to embed and store one document's chunks",
+                             buckets=SLOW_BUCKETS)
+INDEXING_THROUGHPUT = Gauge("sevabot_indexing_chunks_per_second",
+                            "Chunks per second of the most recent indexing run",
+                            multiprocess_mode="max")
+
+S3_REQUEST_SECONDS = Histogram("sevabot_s3_request_seconds", "S3 API call latency", ["operation"],
+                               buckets=FAST_BUCKETS)
+S3_BYTES = Counter("sevabot_s3_transfer_bytes_total", "S3 payload bytes", ["direction"])
+
+SUPABASE_QUERY_SECONDS = Histogram("sevabot_supabase_query_seconds", "Supabase (PostgREST) query latency",
+                                   ["method", "table"], buckets=FAST_BUCKETS)
+SQLITE_QUERY_SECONDS = Histogram("sevabot_sqlite_query_seconds", "Local SQLite metadata query latency",
+                                 ["method", "table"], buckets=FAST_BUCKETS)
+
+SPAN_ERRORS = Counter("sevabot_stage_errors_total", "Stages that raised", ["stage"])
+
+def _observe_span(record: Dict[str, Any]):
+    """Map finished tracing spans onto the metrics above"""
+    name = record["name"]
+    seconds = record["duration_ms"] / 1000
+    attributes = record.get("attributes") or {}
+
+    if record.get("error"):
+        SPAN_ERRORS.labels(stage=name.split(" ", 1)[0]).inc()
+
+    if name == "chat.turn":
+        CHAT_TURNS.labels(status="error" if record.get("error") else "ok").inc()
+        CHAT_TURN_SECONDS.observe(seconds)
+    elif name.startswith("rag.search_"):
+        RETRIEVAL_SECONDS.labels(collection=name[len("rag.search_"):]).observe(seconds)
+    elif name == "openai.chat":
+        LLM_SECONDS.labels(model=attributes.get("model", "unknown")).observe(seconds)
+    elif name.startswith("openai.embed_"):
+        operation = name[len("openai.embed_"):]
+        EMBEDDING_CALLS.labels(operation=operation).inc()
+        EMBEDDING_INPUTS.labels(operation=operation).inc(attributes.get("texts", 1))
+        EMBEDDING_SECONDS.labels(operation=operation).observe(seconds)
+    elif name == "rag.index_chunks":
+        chunks = attributes.get("chunks", 0)
+        INDEXED_CHUNKS.inc(chunks)
+        INDEXING_SECONDS.observe(seconds)
+        if seconds > 0 and chunks:
+            INDEXING_THROUGHPUT.set(chunks / seconds)
+    elif name.startswith("s3."):
+        S3_REQUEST_SECONDS.labels(operation=name[3:]).observe(seconds)
+        if attributes.get("bytes_sent"):
+            S3_BYTES.labels(direction="upload").inc(attributes["bytes_sent"])
+        if attributes.get("bytes_received"):
+            S3_BYTES.labels(direction="download").inc(attributes["bytes_received"])
+    elif name.startswith("supabase."):
+        method, _, table = name[len("supabase."):].partition(" ")
+        SUPABASE_QUERY_SECONDS.labels(method=method, table=table).observe(seconds)
+    elif name.startswith("sqlite."):
+        method, _, table = name[len("sqlite."):].partition(" ")
+        SQLITE_QUERY_SECONDS.labels(method=method, table=table).observe(seconds)
+
+def record_llm_usage(usage: Dict):
+    """Count prompt/cached/completion tokens of one chat completion"""
+    if not METRICS_ENABLED:
+        return
+    model = usage.get("model") or "unknown"
+    for kind in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+        LLM_TOKENS.labels(model=model, kind=kind[:-len("_tokens")]).inc(usage.get(kind) or 0)
+
+
+class _ScrapeTimeCollector:
+    """Gauges and counters read from live objects when /metrics is scraped"""
+
+    def __init__(self):
+        self.session_count: Callable[[], int] = None
+        self.pool_stats: Callable[[], Dict] = None
+
+    def collect(self):
+        if self.session_count is not None:
+            yield GaugeMetricFamily("sevabot_active_sessions", "Signed-in UI sessions held by this worker",
+                                    value=self.session_count())
+
+        if self.pool_stats is not None:
+            stats = self.pool_stats()
+            yield GaugeMetricFamily("sevabot_user_vectorstore_open", "Open personal vector store handles",
+                                    value=stats["open_handles"])
+            lookups = CounterMetricFamily("sevabot_user_vectorstore_lookups",
+                                          "Personal vector store pool lookups", labels=["result"])
+            lookups.add_metric(["hit"], stats["hits"])
+            lookups.add_metric(["miss"], stats["misses"])
+            yield lookups
+            yield GaugeMetricFamily("sevabot_user_vectorstore_hit_ratio",
+                                    "Personal vector store pool hit ratio", value=stats["hit_rate"])
+
+_scrape_time = _ScrapeTimeCollector()
+
+def watch_sessions(session_count: Callable[[], int]):
+    _scrape_time.session_count = session_count
+
+def watch_vectorstore_pool(pool_stats: Callable[[], Dict]):
+    _scrape_time.pool_stats = pool_stats
+
+def render_metrics():
+    """(payload, content type) in the Prometheus text format"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_scrape_time)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+if METRICS_ENABLED:
+    add_span_listener(_observe_span)
+    if not PROMETHEUS_MULTIPROC_DIR:
+        REGISTRY.register(_scrape_time)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# migrate_user_vectors.py - Move personal vector collections between storage layouts
+#
+# Usage:
+#   python migrate_user_vectors.py --to-numpy [--remove-chroma]
+#       Convert small per-user Chroma stores (<= NUMPY_BACKEND_MAX_VECTORS) to the NumPy engine.
+#   python migrate_user_vectors.py --to-chroma
+#       Convert NumPy stores back to Chroma (required before running UVICORN_WORKERS > 1,
+#       since NumPy stores are single-process).
+#   python migrate_user_vectors.py --to-shared
+#       Copy every per-user store into the consolidated user collection
+#       (USER_VECTOR_LAYOUT=shared), tagging each chunk with user_email.
+#
+# Vectors are copied as-is; nothing is re-embedded.
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+from config import (
+    RAG_INDEX_PATH, EMBEDDING_DIMENSIONS, NUMPY_BACKEND_MAX_VECTORS, NUMPY_VECTOR_DTYPE, USER_VECTOR_BACKEND
+)
+from vector_backends import (
+    NumpyCollection, copy_collection, dimension_index_path, remove_numpy_store, VECTORS_FILE, RECORDS_FILE
+)
+
+def user_store_dirs():
+    """All per-user store directories under rag_index/users"""
+    users_path = dimension_index_path(RAG_INDEX_PATH, EMBEDDING_DIMENSIONS) / "users"
+    if not users_path.exists():
+        return []
+    return [d for d in sorted(users_path.iterdir()) if d.is_dir()]
+
+def remove_chroma_files(store_path: Path):
+    """Delete Chroma's SQLite file and segment directories, keeping NumPy files"""
+    sqlite_file = store_path / "chroma.sqlite3"
+    if sqlite_file.exists():
+        sqlite_file.unlink()
+    for child in store_path.iterdir():
+        # Chroma keeps each HNSW segment in a UUID-named directory
+        if child.is_dir() and len(child.name) == 36 and child.name.count("-") == 4:
+            shutil.rmtree(child, ignore_errors=True)
+
+def migrate_to_numpy(remove_chroma: bool = False):
+    """Convert small Chroma personal stores to the NumPy engine"""
+    import chromadb
+
+    if USER_VECTOR_BACKEND == "chroma":
+        print("USER_VECTOR_BACKEND resolves to 'chroma' (set explicitly or UVICORN_WORKERS > 1); "
+              "NumPy stores would not be used")
+        sys.exit(1)
+
+    converted = 0
+    skipped = 0
+    errors = []
+
+    for store_path in user_store_dirs():
+        collection_name = store_path.name
+
+        if NumpyCollection.exists(store_path):
+            skipped += 1
+            continue
+        if not (store_path / "chroma.sqlite3").exists():
+            skipped += 1
+            continue
+
+        try:
+            client = chromadb.PersistentClient(path=str(store_path))
+            source = client.get_collection(collection_name)
+            count = source.count()
+
+            if count > NUMPY_BACKEND_MAX_VECTORS:
+                print(f"  ⏭️ {collection_name}: {count} vectors, above threshold - staying on Chroma")
+                skipped += 1
+                continue
+
+            # Build the NumPy files beside the live store and move them in only once complete:
+            # the app prefers a NumPy store over Chroma as soon as records.json exists
+            build_path = Path(tempfile.mkdtemp(prefix=".numpy-", dir=store_path))
+            try:
+                target = NumpyCollection(build_path, dtype=NUMPY_VECTOR_DTYPE)
+                copied = copy_collection(source, target)
+                target.close()
+
+                if copied != count:
+                    errors.append(f"{collection_name}: copied {copied}/{count} vectors")
+                    continue
+
+                # records.json last, so the store is never visible without its vectors
+                for name in (VECTORS_FILE, RECORDS_FILE):
+                    if (build_path / name).exists():
+                        os.replace(build_path / name, store_path / name)
+            finally:
+                shutil.rmtree(build_path, ignore_errors=True)
+
+            if remove_chroma:
+                remove_chroma_files(store_path)
+
+            print(f"✅ {collection_name}: {copied} vectors")
+            converted += 1
+        except Exception as e:
+            errors.append(f"{collection_name}: {str(e)}")
+
+    print("\nNumPy Migration:")
+    print(f"Stores converted: {converted}")
+    print(f"Stores skipped: {skipped}")
+    if errors:
+        print(f"Errors: {len(errors)}")
+        for error in errors:
+            print(f"  - {error}")
+
+def migrate_to_chroma():
+    """Convert NumPy personal stores to Chroma (run with the app stopped)"""
+    import chromadb
+
+    converted = 0
+    errors = []
+
+    for store_path in user_store_dirs():
+        if not NumpyCollection.exists(store_path):
+            continue
+
+        collection_name = store_path.name
+        try:
+            source = NumpyCollection(store_path)
+            client = chromadb.PersistentClient(path=str(store_path))
+            target = client.get_or_create_collection(collection_name)
+            copied = copy_collection(source, target)
+            count = source.count()
+            source.close()
+
+            if copied != count or target.count() != count:
+                errors.append(f"{collection_name}: copied {copied}/{count} vectors")
+                continue
+
+            # Only now does the app see the store as Chroma
+            remove_numpy_store(store_path)
+            print(f"✅ {collection_name}: {copied} vectors")
+            converted += 1
+        except Exception as e:
+            errors.append(f"{collection_name}: {str(e)}")
+
+    print("\nChroma Migration:")
+    print(f"Stores converted: {converted}")
+    if errors:
+        print(f"Errors: {len(errors)}")
+        for error in errors:
+            print(f"  - {error}")
+
+def open_user_store(store_path: Path):
+    """Open a per-user store as a collection, whichever backend wrote it"""
+    import chromadb
+
+    if NumpyCollection.exists(store_path):
+        return NumpyCollection(store_path)
+    if (store_path / "chroma.sqlite3").exists():
+        client = chromadb.PersistentClient(path=str(store_path))
+        return client.get_collection(store_path.name)
+    return None
+
+def infer_user_email(source) -> str:
+    """Find the owner's email from chunk metadata (written by _create_chunks)"""
+    offset = 0
+    while True:
+        batch = source.get(limit=100, offset=offset, include=["metadatas"])
+        if not batch["ids"]:
+            return ""
+        for metadata in batch["metadatas"]:
+            if metadata and metadata.get("user_email"):
+                return metadata["user_email"]
+        offset += len(batch["ids"])
+
+def migrate_to_shared():
+    """Copy per-user stores into the consolidated user collection"""
+    from rag_service import rag_service
+
+    target = rag_service.get_shared_user_vectorstore()._collection
+
+    migrated_users = 0
+    migrated_vectors = 0
+    errors = []
+
+    for store_path in user_store_dirs():
+        try:
+            source = open_user_store(store_path)
+            if source is None or source.count() == 0:
+                continue
+
+            user_email = infer_user_email(source)
+            if not user_email:
+                errors.append(f"{store_path.name}: no chunk carries user_email, cannot assign owner")
+                continue
+
+            copied = copy_collection(
+                source, target,
+                transform_metadata=lambda m, email=user_email: dict(m, user_email=email)
+            )
+            print(f"✅ {user_email}: {copied} vectors")
+            migrated_users += 1
+            migrated_vectors += copied
+        except Exception as e:
+            errors.append(f"{store_path.name}: {str(e)}")
+
+    print("\nShared Collection Migration:")
+    print(f"Users migrated: {migrated_users}")
+    print(f"Vectors copied: {migrated_vectors}")
+    if errors:
+        print(f"Errors: {len(errors)}")
+        for error in errors:
+            print(f"  - {error}")
+
+    if migrated_users:
+        print("\n⚠️  Set USER_VECTOR_LAYOUT=shared and verify search before removing rag_index/users/")
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate personal vector collections")
+    parser.add_argument("--to-numpy", action="store_true",
+                        help="Convert small per-user Chroma stores to the NumPy engine")
+    parser.add_argument("--to-chroma", action="store_true",
+                        help="Convert NumPy personal stores back to Chroma")
+    parser.add_argument("--to-shared", action="store_true",
+                        help="Copy per-user stores into the consolidated user collection")
+    parser.add_argument("--remove-chroma", action="store_true",
+                        help="Delete the Chroma files after a successful conversion")
+    args = parser.parse_args()
+
+    if args.to_numpy:
+        migrate_to_numpy(remove_chroma=args.remove_chroma)
+    elif args.to_chroma:
+        migrate_to_chroma()
+    elif args.to_shared:
+        migrate_to_shared()
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# pdf_extraction.py - PyMuPDF text extraction, page-parallel for large PDFs
+#
+# RAGService.load_document used to run PyPDFLoader and, when that found no text, parse the
+# whole file again with PyMuPDFLoader. PyMuPDF alone is several times faster than pypdf and
+# reads the files pypdf returned nothing for, so it is now the only pass (pypdf remains
+# the fallback when PyMuPDF cannot open a file at all).
+#
+# PDFs with at least PDF_PARALLEL_MIN_PAGES pages are split into PDF_PAGES_PER_TASK page
+# ranges extracted in a process pool (pdf_worker.py, started from a forkserver so workers
+# never inherit locks held by the app's threads). stream_pdf_pages() yields pages in order
+# as soon as their range is done; load_document consumes it page by page.
+import itertools
+import os
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import pymupdf
+from langchain_core.documents import Document
+
+from config import PDF_EXTRACTION_WORKERS
+from constants import PDF_PARALLEL_MIN_PAGES, PDF_PAGES_PER_TASK
+from tracing import span
+from pdf_worker import extract_range
+
+# More processes than cores only adds overhead; with one core everything stays in-process
+WORKERS = min(PDF_EXTRACTION_WORKERS, os.cpu_count() or 1)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # fork() from a threaded uvicorn/Gradio worker can copy a lock another thread holds
+            # (logging, httpx, sqlite) into the child and deadlock it. A forkserver is a fresh
+            # single-threaded process; spawn is the fallback where forkserver is unavailable.
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["pdf_worker"])
+            else:
+                context = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=context)
+        return _pool
+
+
+def _reset_pool():
+    """Drop a pool whose worker died (e.g. MuPDF crashed on a malformed file)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _page_document(file_path: str, number: int, text: str, total_pages: int) -> Document:
+    return Document(
+        page_content=text,
+        metadata={"source": file_path, "file_path": file_path, "page": number, "total_pages": total_pages}
+    )
+
+
+def _page_ranges(total_pages: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + PDF_PAGES_PER_TASK, total_pages))
+            for start in range(0, total_pages, PDF_PAGES_PER_TASK)]
+
+
+def iter_pdf_pages(file_path: str) -> Iterator[Document]:
+    """Yield one Document per page, in page order, extracting large PDFs in parallel"""
+    with pymupdf.open(file_path) as pdf:
+        total_pages = pdf.page_count
+        if WORKERS <= 1 or total_pages < PDF_PARALLEL_MIN_PAGES:
+            for number in range(total_pages):
+                yield _page_document(file_path, number, pdf[number].get_text(), total_pages)
+            return
+
+    pool = _get_pool()
+    futures = [pool.submit(extract_range, file_path, start, end) for start, end in _page_ranges(total_pages)]
+    try:
+        for future in futures:
+            for number, text in future.result():
+                yield _page_document(file_path, number, text, total_pages)
+    except BrokenProcessPool:
+        _reset_pool()
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def stream_pdf_pages(file_path: str) -> Iterator[Document]:
+    """Pages of a PDF as they are extracted: PyMuPDF (page-parallel when large), with pypdf
+    supplying the remaining pages if PyMuPDF cannot open or finish the file"""
+    extracted = 0
+    with span("pdf.extract", file_name=Path(file_path).name):
+        try:
+            for page in iter_pdf_pages(file_path):
+                extracted += 1
+                yield page
+        except Exception as e:
+            print(f"⚠️ PyMuPDF could not read {file_path}, falling back to pypdf: {e}")
+            from langchain_community.document_loaders import PyPDFLoader
+            yield from itertools.islice(PyPDFLoader(file_path).lazy_load(), extracted, None)
+
+
+def extract_pdf_pages(file_path: str) -> List[Document]:
+    """All pages of a PDF as a list (see stream_pdf_pages)"""
+    return list(stream_pdf_pages(file_path))
+
+
+if __name__ == "__main__":
+    # Extraction speed check: python pdf_extraction.py manual.pdf
+    import sys
+    for path in sys.argv[1:]:
+        started = time.perf_counter()
+        pages = extract_pdf_pages(path)
+        elapsed = time.perf_counter() - started
+        chars = sum(len(page.page_content) for page in pages)
+        print(f"{path}: {len(pages)} pages, {chars} chars in {elapsed:.2f}s ({len(pages) / elapsed:.0f} pages/s)")
@@ -0,0 +1,14 @@
+# pdf_worker.py - Page-range text extraction run in pdf_extraction's process pool
+#
+# Workers come from a forkserver, so each one imports only this module and PyMuPDF
+# instead of inheriting the app's threads and locks through fork(). Keep app
+# imports (config, services, tracing) out of this file.
+from typing import List, Tuple
+
+import pymupdf
+
+
+def extract_range(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Text of pages [start, end) - opens its own handle, since it runs in another process"""
+    with pymupdf.open(file_path) as pdf:
+        return [(number, pdf[number].get_text()) for number in range(start, end)]
@@ -5,36 +5,60 @@ from pathlib import Path
 from typing import List, Dict, Tuple, Optional
 from datetime import datetime
 import time
+from contextlib import nullcontext
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 warnings.filterwarnings("ignore", category=UserWarning, module="langchain")
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import (
-    TextLoader, PyPDFLoader, Docx2txtLoader, PyMuPDFLoader
-)
+from langchain_community.document_loaders import TextLoader, Docx2txtLoader
 from langchain_openai import OpenAIEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 
 from config import (
-    RAG_INDEX_PATH, OPENAI_API_KEY, EMBEDDING_MODEL,
+    RAG_INDEX_PATH, OPENAI_API_KEY, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS,
     CHUNK_SIZE, CHUNK_OVERLAP, TOP_K, COMMON_KNOWLEDGE_PATH,
-    RAG_DOCUMENTS_PATH, SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, IS_PRODUCTION
+    RETRIEVAL_MODE, MMR_FETCH_K, MMR_LAMBDA,
+    RAG_DOCUMENTS_PATH, IS_PRODUCTION,
+    VECTOR_STORE_MODE, CHROMA_SERVER_HOST, CHROMA_SERVER_PORT,
+    COMMON_INDEX_BACKEND, COMMON_INDEX_QUANTIZATION, QUANTIZED_RESCORE_FACTOR,
+    RECALL_PROBE_SAMPLES,
+    USER_VECTOR_LAYOUT, SHARED_USER_COLLECTION_NAME,
+    USER_VECTOR_BACKEND, NUMPY_BACKEND_MAX_VECTORS, NUMPY_VECTOR_DTYPE,
+    USER_VECTORSTORE_POOL_SIZE, USER_VECTORSTORE_IDLE_SECONDS,
+    EMBEDDING_MIGRATION_LOCK_FILE
+)
+from auth import require_admin
+from tracing import span, traced
+from pdf_extraction import stream_pdf_pages
+from vector_backends import (
+    NumpyVectorStore, NumpyCollection, VectorStorePool, UserScopedVectorStore, QuantizedVectorStore,
+    copy_collection, remove_numpy_store, close_vectorstore,
+    dimension_index_path, dimension_collection_name, maximal_marginal_relevance
 )
 
+class TracedOpenAIEmbeddings(OpenAIEmbeddings):
+    """OpenAIEmbeddings whose API calls show up as tracing spans"""
+    
+    def embed_documents(self, texts, *args, **kwargs):
+        with span("openai.embed_documents", texts=len(texts)):
+            return super().embed_documents(texts, *args, **kwargs)
+    
+    def embed_query(self, text, *args, **kwargs):
+        with span("openai.embed_query"):
+            return super().embed_query(text, *args, **kwargs)
+
 class RAGService:
     """Enhanced RAG service with comprehensive vector operations"""
     
     def __init__(self):
-        self.index_path = Path(RAG_INDEX_PATH)
-        self.index_path.mkdir(exist_ok=True)
+        # Reduced-dimension indexes live beside the default one so a migration can build them live
+        self.index_path = dimension_index_path(RAG_INDEX_PATH, EMBEDDING_DIMENSIONS)
+        self.index_path.mkdir(parents=True, exist_ok=True)
         
-        self.embeddings = OpenAIEmbeddings(
-            api_key=OPENAI_API_KEY,
-            model=EMBEDDING_MODEL
-        )
+        self.embeddings = self.create_embeddings(EMBEDDING_DIMENSIONS)
         
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=CHUNK_SIZE,
@@ -44,8 +68,84 @@ class RAGService:
         )
         
         self._common_vectorstore = None
-        self._user_vectorstores = {}
+        self._shared_user_vectorstore = None
+        self._user_vectorstores = VectorStorePool(
+            max_size=USER_VECTORSTORE_POOL_SIZE,
+            idle_seconds=USER_VECTORSTORE_IDLE_SECONDS,
+            closer=self._close_user_vectorstore
+        )
         self._dev_chunks_count = {}
+        self._chroma_client = None
+    
+    # ========== VECTOR STORE BACKEND ==========
+    
+    def is_server_mode(self) -> bool:
+        """Vector operations go to a shared Chroma server instead of local files"""
+        return VECTOR_STORE_MODE == "server"
+    
+    def indexing_paused(self) -> Optional[str]:
+        """Reason new chunks cannot be indexed right now, or None.
+
+        An embedding migration snapshots every collection; chunks written after that
+        would be missing from the rebuilt index, so indexing waits for the cutover.
+        """
+        if (Path(RAG_INDEX_PATH) / EMBEDDING_MIGRATION_LOCK_FILE).exists():
+            return ("Indexing is paused while the embedding migration is pending; "
+                    "the file is saved and can be re-indexed after the switch")
+        return None
+    
+    def _get_chroma_client(self):
+        """Get the shared Chroma HTTP client (server mode only)"""
+        if self._chroma_client is None:
+            import chromadb
+            self._chroma_client = chromadb.HttpClient(
+                host=CHROMA_SERVER_HOST,
+                port=CHROMA_SERVER_PORT
+            )
+        return self._chroma_client
+    
+    def _close_user_vectorstore(self, vectorstore):
+        """Close an evicted personal store (server-mode handles share one client, so keep it)"""
+        if self.is_server_mode() and not isinstance(vectorstore, NumpyVectorStore):
+            return
+        close_vectorstore(vectorstore)
+    
+    def get_user_vectorstore_pool_stats(self) -> Dict:
+        """Hit/miss/eviction counters and open handle count for personal stores"""
+        return self._user_vectorstores.stats()
+    
+    def create_embeddings(self, dimensions: int) -> OpenAIEmbeddings:
+        """Embedding client for a vector size (0 = model default)"""
+        if dimensions:
+            return TracedOpenAIEmbeddings(
+                api_key=OPENAI_API_KEY,
+                model=EMBEDDING_MODEL,
+                dimensions=dimensions
+            )
+        return TracedOpenAIEmbeddings(
+            api_key=OPENAI_API_KEY,
+            model=EMBEDDING_MODEL
+        )
+    
+    def _create_vectorstore(self, collection_name: str, chroma_path: Path,
+                            dimensions: int = EMBEDDING_DIMENSIONS, embeddings=None) -> Chroma:
+        """Open a collection either on the shared server or in its local directory"""
+        embeddings = embeddings or self.embeddings
+        
+        if self.is_server_mode():
+            # The server owns persistence and the HNSW index; workers are thin clients
+            return Chroma(
+                client=self._get_chroma_client(),
+                embedding_function=embeddings,
+                collection_name=dimension_collection_name(collection_name, dimensions)
+            )
+        
+        chroma_path.mkdir(parents=True, exist_ok=True)
+        return Chroma(
+            persist_directory=str(chroma_path),
+            embedding_function=embeddings,
+            collection_name=collection_name
+        )
     
     # ========== COMMON KNOWLEDGE OPERATIONS ==========
     
@@ -53,15 +153,41 @@ class RAGService:
         """Get or create common knowledge vector store"""
         if self._common_vectorstore is None:
             chroma_path = self.index_path / "common_knowledge"
-            chroma_path.mkdir(exist_ok=True)
-            
-            self._common_vectorstore = Chroma(
-                persist_directory=str(chroma_path),
-                embedding_function=self.embeddings,
-                collection_name="common_knowledge"
-            )
+            if COMMON_INDEX_BACKEND == "quantized":
+                self._common_vectorstore = self._open_quantized_common_index(chroma_path)
+            else:
+                self._common_vectorstore = self._create_vectorstore("common_knowledge", chroma_path)
         return self._common_vectorstore
     
+    def _open_quantized_common_index(self, path: Path) -> QuantizedVectorStore:
+        """Open the quantized common index, importing the Chroma index on first use"""
+        vectorstore = QuantizedVectorStore(
+            path, self.embeddings,
+            quantization=COMMON_INDEX_QUANTIZATION,
+            rescore_factor=QUANTIZED_RESCORE_FACTOR
+        )
+        
+        if vectorstore._collection.count() == 0 and (path / "chroma.sqlite3").exists():
+            chroma_store = self._create_vectorstore("common_knowledge", path)
+            # Upserts append rows in place; the records file is written once at the end
+            with vectorstore._collection.deferred_records():
+                copied = copy_collection(chroma_store._collection, vectorstore._collection)
+            print(f"Imported {copied} common knowledge vectors into the {COMMON_INDEX_QUANTIZATION} index")
+        
+        return vectorstore
+    
+    def get_common_knowledge_index_report(self) -> Dict:
+        """Recall, latency and memory of the quantized common index versus exact search"""
+        vectorstore = self.get_common_knowledge_vectorstore()
+        if not isinstance(vectorstore, QuantizedVectorStore):
+            return {
+                "status": "error",
+                "message": "Common knowledge index is not quantized (set COMMON_INDEX_BACKEND=quantized)"
+            }
+        
+        report = vectorstore._collection.evaluate(samples=RECALL_PROBE_SAMPLES, k=TOP_K)
+        return {"status": "success", **report}
+    
     def get_common_knowledge_stats(self) -> Dict:
         """Get comprehensive stats for common knowledge repository"""
         try:
@@ -91,8 +217,8 @@ class RAGService:
             db_files = 0
             if IS_PRODUCTION:
                 try:
-                    from supabase import create_client
-                    supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+                    from local_store import create_metadata_client
+                    supabase = create_metadata_client()
                     result = supabase.table("common_knowledge_documents").select("file_name").execute()
                     db_files = len(result.data) if result.data else 0
                 except Exception as e:
@@ -190,6 +316,10 @@ class RAGService:
     
     def index_common_knowledge_document(self, file_name: str) -> Tuple[bool, str, int]:
         """Index document in common knowledge repository"""
+        paused = self.indexing_paused()
+        if paused:
+            return False, paused, 0
+        
         try:
             from config import USE_S3_STORAGE, COMMON_KNOWLEDGE_PATH
             from s3_storage import s3_storage
@@ -257,6 +387,7 @@ class RAGService:
         except Exception as e:
             return False, f"Error indexing {file_name}: {str(e)}", 0
     
+    @traced("rag.search_common_knowledge")
     def search_common_knowledge(self, query: str, top_k: int = None) -> List[Tuple[str, str, float, Dict]]:
         """Search common knowledge repository"""
         if top_k is None:
@@ -269,33 +400,78 @@ class RAGService:
             if collection.count() == 0:
                 return []
             
-            results = vectorstore.similarity_search_with_score(query, k=top_k)
-            
-            formatted_results = []
-            for doc, score in results:
-                chunk = doc.page_content
-                source = doc.metadata.get('source', 'Unknown')
-                file_name = doc.metadata.get('file_name', source)
-                
-                similarity = max(0, 1 - score) if score <= 1 else 1 / (1 + score)
-                
-                metadata = {
-                    'source': source,
-                    'file_name': file_name,
-                    'chunk_index': doc.metadata.get('chunk_index', 0),
-                    'similarity_score': float(similarity),
-                    'chunk_size': doc.metadata.get('chunk_size', len(chunk)),
-                    'is_common_knowledge': True
-                }
-                
-                formatted_results.append((chunk, file_name, float(similarity), metadata))
-            
-            return formatted_results
+            return self.search_vectorstore(vectorstore, query, top_k)
             
         except Exception as e:
             print(f"Error searching common knowledge: {e}")
             return []
     
+    def search_vectorstore(self, vectorstore, query: str, top_k: int, mode: str = RETRIEVAL_MODE,
+                           query_embedding: Optional[List[float]] = None) -> List[Tuple[str, str, float, Dict]]:
+        """Similarity or MMR search over one store; a precomputed query_embedding skips the embedding call"""
+        if mode == "mmr":
+            results = self._mmr_search(vectorstore, query, top_k, query_embedding)
+        elif query_embedding is not None:
+            results = self._vector_search(vectorstore, query_embedding, top_k)
+        else:
+            results = vectorstore.similarity_search_with_score(query, k=top_k)
+        
+        formatted_results = []
+        for doc, score in results:
+            chunk = doc.page_content
+            source = doc.metadata.get('source', 'Unknown')
+            file_name = doc.metadata.get('file_name', source)
+            
+            similarity = max(0, 1 - score) if score <= 1 else 1 / (1 + score)
+            
+            metadata = {
+                'source': source,
+                'file_name': file_name,
+                'chunk_index': doc.metadata.get('chunk_index', 0),
+                'similarity_score': float(similarity),
+                'chunk_size': doc.metadata.get('chunk_size', len(chunk)),
+                'is_common_knowledge': True
+            }
+            
+            formatted_results.append((chunk, file_name, float(similarity), metadata))
+        
+        return formatted_results
+    
+    def _vector_search(self, vectorstore, query_embedding: List[float], top_k: int) -> List[Tuple[Document, float]]:
+        """Nearest chunks for an already-embedded query"""
+        result = vectorstore._collection.query(
+            query_embeddings=[query_embedding],
+            n_results=top_k,
+            include=["documents", "metadatas", "distances"]
+        )
+        return [
+            (Document(page_content=document or "", metadata=dict(metadata or {})), distance)
+            for document, metadata, distance in zip(
+                result["documents"][0], result["metadatas"][0], result["distances"][0]
+            )
+        ]
+    
+    def _mmr_search(self, vectorstore, query: str, top_k: int,
+                    query_embedding: Optional[List[float]] = None) -> List[Tuple[Document, float]]:
+        """Maximal marginal relevance over the candidates' stored vectors (still one embedding call)"""
+        if query_embedding is None:
+            query_embedding = vectorstore.embeddings.embed_query(query)
+        result = vectorstore._collection.query(
+            query_embeddings=[query_embedding],
+            n_results=max(top_k, MMR_FETCH_K),
+            include=["documents", "metadatas", "distances", "embeddings"]
+        )
+        
+        documents = result["documents"][0]
+        metadatas = result["metadatas"][0]
+        distances = result["distances"][0]
+        selected = maximal_marginal_relevance(query_embedding, result["embeddings"][0], top_k, MMR_LAMBDA)
+        
+        return [
+            (Document(page_content=documents[i] or "", metadata=dict(metadatas[i] or {})), distances[i])
+            for i in selected
+        ]
+    
     def remove_common_knowledge_document(self, file_name: str) -> bool:
         """Remove document from common knowledge vector store"""
         try:
@@ -379,8 +555,8 @@ class RAGService:
         if IS_PRODUCTION:
             try:
                 if is_common:
-                    from supabase import create_client
-                    supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+                    from local_store import create_metadata_client
+                    supabase = create_metadata_client()
                     result = supabase.table("common_knowledge_documents")\
                         .select("chunks_count")\
                         .eq("file_name", file_name)\
@@ -415,20 +591,77 @@ class RAGService:
     
     # ========== USER FILE OPERATIONS ==========
     
-    def get_user_vectorstore(self, user_email: str) -> Chroma:
-        """Get or create user-specific vector store"""
-        if user_email not in self._user_vectorstores:
-            user_collection = f"user_{user_email.replace('@', '_').replace('.', '_')}"
-            chroma_path = self.index_path / "users" / user_collection
-            chroma_path.mkdir(parents=True, exist_ok=True)
-            
-            self._user_vectorstores[user_email] = Chroma(
-                persist_directory=str(chroma_path),
-                embedding_function=self.embeddings,
-                collection_name=user_collection
-            )
+    def _user_collection_name(self, user_email: str) -> str:
+        return f"user_{user_email.replace('@', '_').replace('.', '_')}"
+    
+    def _user_store_path(self, user_email: str) -> Path:
+        return self.index_path / "users" / self._user_collection_name(user_email)
+    
+    def _user_backend(self, store_path: Path) -> str:
+        """Pick the backend for a personal collection"""
+        if self.is_server_mode() or USER_VECTOR_BACKEND == "chroma":
+            if NumpyCollection.exists(store_path):
+                # Opening Chroma here would hide the user's NumPy-stored chunks
+                raise RuntimeError(f"{store_path.name} is a NumPy store; run "
+                                   f"'python migrate_user_vectors.py --to-chroma' before using the chroma backend")
+            return "chroma"
+        if USER_VECTOR_BACKEND == "numpy":
+            return "numpy"
+        
+        # auto: existing Chroma stores stay on Chroma until converted; new ones start on NumPy
+        if NumpyCollection.exists(store_path):
+            return "numpy"
+        if (store_path / "chroma.sqlite3").exists():
+            return "chroma"
+        return "numpy"
+    
+    def get_shared_user_vectorstore(self) -> Chroma:
+        """Consolidated collection holding every user's chunks, tagged with user_email"""
+        if self._shared_user_vectorstore is None:
+            chroma_path = self.index_path / SHARED_USER_COLLECTION_NAME
+            self._shared_user_vectorstore = self._create_vectorstore(SHARED_USER_COLLECTION_NAME, chroma_path)
+        return self._shared_user_vectorstore
+    
+    def lease_user_vectorstore(self, user_email: str):
+        """Hold user-specific vector store for a with block (pooled; only evicted once no one holds it)"""
+        def _open():
+            if USER_VECTOR_LAYOUT == "shared":
+                return UserScopedVectorStore(self.get_shared_user_vectorstore(), user_email)
+            
+            user_collection = self._user_collection_name(user_email)
+            store_path = self._user_store_path(user_email)
+            
+            if self._user_backend(store_path) == "numpy":
+                return NumpyVectorStore(store_path, self.embeddings, dtype=NUMPY_VECTOR_DTYPE)
+            return self._create_vectorstore(user_collection, store_path)
+        
+        return self._user_vectorstores.lease(user_email, _open)
+    
+    def _maybe_promote_user_store(self, user_email: str, held: int = 1):
+        """In auto mode, move a personal store that outgrew brute force onto Chroma.
+
+        Runs through the pool's swap, so it only happens while the caller's own lease
+        is the only one, and other requests for the user wait for the Chroma store.
+        """
+        vectorstore = self._user_vectorstores.peek(user_email)
+        if USER_VECTOR_BACKEND != "auto" or not isinstance(vectorstore, NumpyVectorStore):
+            return
+        if vectorstore._collection.count() <= NUMPY_BACKEND_MAX_VECTORS:
+            return
+        
+        store_path = self._user_store_path(user_email)
+        
+        def _promote(numpy_store):
+            chroma_store = self._create_vectorstore(self._user_collection_name(user_email), store_path)
+            copied = copy_collection(numpy_store._collection, chroma_store._collection)
+            # The NumPy store stays mapped until its last lease is released; removing the
+            # files now keeps a fresh open from picking NumPy over the new Chroma store
+            remove_numpy_store(store_path)
+            print(f"Promoted vector store for {user_email} to Chroma ({copied} vectors)")
+            return chroma_store
         
-        return self._user_vectorstores[user_email]
+        # Refused while another request is using the NumPy store; a later indexing run promotes it
+        self._user_vectorstores.swap(user_email, _promote, held=held)
     
     def get_user_vector_stats(self, user_email: str) -> Dict:
         """Get vector database statistics for specific user"""
@@ -436,9 +669,9 @@ class RAGService:
             from config import USE_S3_STORAGE
             from s3_storage import s3_storage
             
-            vectorstore = self.get_user_vectorstore(user_email)
-            doc_count = vectorstore._collection.count()
-            
+            with self.lease_user_vectorstore(user_email) as vectorstore:
+                doc_count = vectorstore._collection.count()
+
             # Get file system stats (S3 or local)
             fs_files = 0
             
@@ -489,34 +722,34 @@ class RAGService:
                         if file_path.is_file() and file_path.suffix.lower() in ['.txt', '.md', '.pdf', '.docx']:
                             actual_files.add(file_path.name)
             
-            vectorstore = self.get_user_vectorstore(user_email)
-            collection = vectorstore._collection
-            
-            orphaned_ids = []
-            orphaned_files = set()
-            
-            try:
-                all_docs = collection.get()
-                if all_docs and all_docs.get('metadatas'):
-                    for doc_id, metadata in zip(all_docs['ids'], all_docs['metadatas']):
-                        file_name = metadata.get('file_name') or metadata.get('source', '')
-                        if file_name and file_name not in actual_files:
-                            orphaned_ids.append(doc_id)
-                            orphaned_files.add(file_name)
-            except Exception as e:
-                return {"status": "error", "message": f"Error accessing user vector store: {str(e)}"}
-            
-            # Remove orphaned entries
-            cleanup_count = 0
-            if orphaned_ids:
-                batch_size = 100
-                for i in range(0, len(orphaned_ids), batch_size):
-                    batch_ids = orphaned_ids[i:i+batch_size]
-                    try:
-                        collection.delete(ids=batch_ids)
-                        cleanup_count += len(batch_ids)
-                    except Exception as e:
-                        print(f"Error deleting batch: {e}")
+            with self.lease_user_vectorstore(user_email) as vectorstore:
+                collection = vectorstore._collection
+
+                orphaned_ids = []
+                orphaned_files = set()
+
+                try:
+                    all_docs = collection.get()
+                    if all_docs and all_docs.get('metadatas'):
+                        for doc_id, metadata in zip(all_docs['ids'], all_docs['metadatas']):
+                            file_name = metadata.get('file_name') or metadata.get('source', '')
+                            if file_name and file_name not in actual_files:
+                                orphaned_ids.append(doc_id)
+                                orphaned_files.add(file_name)
+                except Exception as e:
+                    return {"status": "error", "message": f"Error accessing user vector store: {str(e)}"}
+
+                # Remove orphaned entries
+                cleanup_count = 0
+                if orphaned_ids:
+                    batch_size = 100
+                    for i in range(0, len(orphaned_ids), batch_size):
+                        batch_ids = orphaned_ids[i:i+batch_size]
+                        try:
+                            collection.delete(ids=batch_ids)
+                            cleanup_count += len(batch_ids)
+                        except Exception as e:
+                            print(f"Error deleting batch: {e}")
             
             return {
                 "status": "success",
@@ -532,6 +765,10 @@ class RAGService:
 
     def index_user_document(self, user_email: str, file_name: str) -> Tuple[bool, str, int]:
         """Index document for specific user"""
+        paused = self.indexing_paused()
+        if paused:
+            return False, paused, 0
+        
         try:
             from config import USE_S3_STORAGE, RAG_DOCUMENTS_PATH
             from s3_storage import s3_storage
@@ -564,27 +801,29 @@ class RAGService:
                 if not docs:
                     return False, f"Could not extract content from {file_name}", 0
                 
-                vectorstore = self.get_user_vectorstore(user_email)
-                collection = vectorstore._collection
-                
-                # Check if already indexed
-                existing_results = collection.get(where={"file_name": file_name})
-                if existing_results and existing_results['ids']:
-                    existing_chunks = len(existing_results['ids'])
-                    return True, f"{file_name} already indexed ({existing_chunks} chunks)", existing_chunks
-                
-                # Split into chunks
-                chunks = self._create_chunks(docs, file_name, is_common=False, user_email=user_email)
-                
-                if not chunks:
-                    return False, f"No chunks created from {file_name}", 0
-                
-                # Index chunks
-                success = self._index_chunks_batch(vectorstore, chunks)
-                if not success:
-                    return False, f"Failed to index {file_name}", 0
-                
-                return True, f"Successfully indexed {file_name}", len(chunks)
+                with self.lease_user_vectorstore(user_email) as vectorstore:
+                    collection = vectorstore._collection
+
+                    # Check if already indexed
+                    existing_results = collection.get(where={"file_name": file_name})
+                    if existing_results and existing_results['ids']:
+                        existing_chunks = len(existing_results['ids'])
+                        return True, f"{file_name} already indexed ({existing_chunks} chunks)", existing_chunks
+
+                    # Split into chunks
+                    chunks = self._create_chunks(docs, file_name, is_common=False, user_email=user_email)
+
+                    if not chunks:
+                        return False, f"No chunks created from {file_name}", 0
+
+                    # Index chunks
+                    success = self._index_chunks_batch(vectorstore, chunks)
+                    if not success:
+                        return False, f"Failed to index {file_name}", 0
+
+                    self._maybe_promote_user_store(user_email)
+
+                    return True, f"Successfully indexed {file_name}", len(chunks)
                 
             finally:
                 # Clean up temporary file if using S3
@@ -620,19 +859,19 @@ class RAGService:
                 return 0, 0, []
             
             # Get currently indexed files
-            vectorstore = self.get_user_vectorstore(user_email)
-            collection = vectorstore._collection
-            
-            indexed_files = set()
-            try:
-                all_docs = collection.get()
-                if all_docs and all_docs.get('metadatas'):
-                    for metadata in all_docs['metadatas']:
-                        file_name = metadata.get('file_name') or metadata.get('source', '')
-                        if file_name:
-                            indexed_files.add(file_name)
-            except Exception as e:
-                print(f"Error getting indexed files: {e}")
+            with self.lease_user_vectorstore(user_email) as vectorstore:
+                collection = vectorstore._collection
+
+                indexed_files = set()
+                try:
+                    all_docs = collection.get()
+                    if all_docs and all_docs.get('metadatas'):
+                        for metadata in all_docs['metadatas']:
+                            file_name = metadata.get('file_name') or metadata.get('source', '')
+                            if file_name:
+                                indexed_files.add(file_name)
+                except Exception as e:
+                    print(f"Error getting indexed files: {e}")
             
             # Filter to only pending files
             pending_files = [f for f in user_files if f not in indexed_files]
@@ -674,36 +913,39 @@ class RAGService:
             
             docs = []
             used_ocr = False
+            valid_docs = []
+            
+            def add_metadata(doc: Document):
+                if doc.page_content and len(doc.page_content.strip()) > 0:
+                    doc.metadata.update({
+                        'source': file_path_obj.name,
+                        'file_name': file_path_obj.name,
+                        'file_path': str(file_path_obj),
+                        'file_size': file_size,
+                        'indexed_at': datetime.utcnow().isoformat(),
+                        'content_length': len(doc.page_content)
+                    })
+                    valid_docs.append(doc)
             
             if file_path_obj.suffix.lower() in ['.txt', '.md']:
                 loader = TextLoader(str(file_path_obj), encoding='utf-8', autodetect_encoding=True)
                 docs = loader.load()
                 
             elif file_path_obj.suffix.lower() == '.pdf':
-                content_found = False
-                
-                # Try PyPDFLoader first
+                # Pages arrive in order while later page ranges are still being extracted
+                # (page-parallel for large files), see pdf_extraction.py
+                has_text = False
                 try:
-                    loader = PyPDFLoader(str(file_path_obj))
-                    docs = loader.load()
-                    if docs and any(doc.page_content.strip() and len(doc.page_content.strip()) > 50 for doc in docs):
-                        content_found = True
+                    for page in stream_pdf_pages(str(file_path_obj)):
+                        has_text = has_text or len(page.page_content.strip()) > 50
+                        add_metadata(page)
                 except Exception:
-                    pass
-                
-                # Try PyMuPDFLoader as fallback
-                if not content_found:
-                    try:
-                        loader = PyMuPDFLoader(str(file_path_obj))
-                        docs = loader.load()
-                        if docs and any(doc.page_content.strip() and len(doc.page_content.strip()) > 50 for doc in docs):
-                            content_found = True
-                    except Exception:
-                        pass
+                    has_text = False
                 
-                # If extraction fails, reject the file
-                if not content_found:
+                # No extractable text means a scanned PDF - reject the file
+                if not has_text:
                     return [], True
+                return valid_docs, used_ocr
                 
             elif file_path_obj.suffix.lower() == '.docx':
                 loader = Docx2txtLoader(str(file_path_obj))
@@ -714,19 +956,8 @@ class RAGService:
             if not docs:
                 return [], used_ocr
             
-            # Add metadata
-            valid_docs = []
             for doc in docs:
-                if doc.page_content and len(doc.page_content.strip()) > 0:
-                    doc.metadata.update({
-                        'source': file_path_obj.name,
-                        'file_name': file_path_obj.name,
-                        'file_path': str(file_path_obj),
-                        'file_size': file_size,
-                        'indexed_at': datetime.utcnow().isoformat(),
-                        'content_length': len(doc.page_content)
-                    })
-                    valid_docs.append(doc)
+                add_metadata(doc)
             
             return valid_docs, used_ocr
             
@@ -740,11 +971,13 @@ class RAGService:
         user_dir.mkdir(parents=True, exist_ok=True)
         return user_dir
     
-    def _create_chunks(self, docs: List[Document], file_name: str, is_common: bool = True, user_email: str = None) -> List[Document]:
-        """Create chunks from documents with proper metadata"""
+    def _create_chunks(self, docs: List[Document], file_name: str, is_common: bool = True, user_email: str = None,
+                       text_splitter: RecursiveCharacterTextSplitter = None) -> List[Document]:
+        """Create chunks from documents with proper metadata (text_splitter overrides CHUNK_SIZE/CHUNK_OVERLAP)"""
+        text_splitter = text_splitter or self.text_splitter
         chunks = []
         for doc in docs:
-            doc_chunks = self.text_splitter.split_documents([doc])
+            doc_chunks = text_splitter.split_documents([doc])
             chunks.extend(doc_chunks)
         
         # Add metadata to chunks
@@ -763,27 +996,31 @@ class RAGService:
         
         return chunks
     
-    def _index_chunks_batch(self, vectorstore: Chroma, chunks: List[Document]) -> bool:
+    def _index_chunks_batch(self, vectorstore, chunks: List[Document]) -> bool:
         """Index chunks in batches"""
         batch_size = 20
-        for i in range(0, len(chunks), batch_size):
-            batch = chunks[i:i+batch_size]
-            for attempt in range(3):
-                try:
-                    vectorstore.add_documents(batch)
-                    break
-                except Exception as e:
-                    if attempt == 2:
-                        return False
-                    time.sleep(1)
+        # NumPy stores append each batch's rows but write their records once per document
+        collection = getattr(vectorstore, "_collection", None)
+        deferred = collection.deferred_records() if isinstance(collection, NumpyCollection) else nullcontext()
+        with span("rag.index_chunks", chunks=len(chunks)), deferred:
+            for i in range(0, len(chunks), batch_size):
+                batch = chunks[i:i+batch_size]
+                for attempt in range(3):
+                    try:
+                        vectorstore.add_documents(batch)
+                        break
+                    except Exception as e:
+                        if attempt == 2:
+                            return False
+                        time.sleep(1)
         return True
     
     def _update_chunks_count(self, file_name: str, chunks_count: int, is_common: bool = True):
         """Update chunks count for a file"""
         if IS_PRODUCTION and is_common:
             try:
-                from supabase import create_client
-                supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+                from local_store import create_metadata_client
+                supabase = create_metadata_client()
                 supabase.table("common_knowledge_documents")\
                     .update({
                         "chunks_count": chunks_count,
@@ -826,8 +1063,8 @@ class RAGService:
         db_cleanup_count = 0
         if IS_PRODUCTION and orphaned_files:
             try:
-                from supabase import create_client
-                supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+                from local_store import create_metadata_client
+                supabase = create_metadata_client()
                 
                 for orphaned_file in orphaned_files:
                     try:
@@ -872,6 +1109,15 @@ async def get_common_knowledge_vector_stats():
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@router.get("/api/common-knowledge-index-report")
+async def get_common_knowledge_index_report(request: Request):
+    """Recall/latency/memory report for the quantized common knowledge index"""
+    require_admin(request)
+    try:
+        return rag_service.get_common_knowledge_index_report()
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
 @router.post("/api/cleanup-user-vector-db/{user_email}")
 async def cleanup_user_vector_database(user_email: str):
     """Clean up user vector database"""
@@ -890,6 +1136,15 @@ async def get_user_vector_stats(user_email: str):
     except Exception as e:
         return {"status": "error", "message": str(e), "user_email": user_email}
 
+@router.get("/api/user-vector-store-pool-stats")
+async def get_user_vector_store_pool_stats(request: Request):
+    """Get open handle, hit and eviction counters for pooled personal vector stores"""
+    require_admin(request)
+    try:
+        return rag_service.get_user_vectorstore_pool_stats()
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
 @router.post("/api/reindex-user-files/{user_email}")
 async def reindex_user_files(user_email: str):
     """Re-index pending user files"""
@@ -904,4 +1159,44 @@ async def reindex_user_files(user_email: str):
             "message": f"Re-indexed {reindexed}/{pending_count} files for user {user_email}"
         }
     except Exception as e:
-        return {"status": "error", "message": str(e), "user_email": user_email}
\ No newline at end of file
+        return {"status": "error", "message": str(e), "user_email": user_email}
+
+@router.post("/api/embedding-migration")
+async def start_embedding_migration(request: Request, dimensions: int):
+    """Rebuild all vector indexes at a new embedding size in the background (admin only).
+
+    Indexing is paused from the start until the app restarts on the new
+    EMBEDDING_DIMENSIONS, or until the migration is discarded.
+    """
+    require_admin(request)
+    try:
+        from embedding_migration import embedding_migration
+        started, message = embedding_migration.start(dimensions)
+        return {
+            "status": "started" if started else "error",
+            "message": message,
+            "migration": embedding_migration.get_status()
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@router.delete("/api/embedding-migration")
+async def discard_embedding_migration(request: Request):
+    """Abandon a finished or failed migration and resume indexing on the current index (admin only)"""
+    require_admin(request)
+    try:
+        from embedding_migration import embedding_migration
+        discarded, message = embedding_migration.discard()
+        return {"status": "success" if discarded else "error", "message": message}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@router.get("/api/embedding-migration-status")
+async def get_embedding_migration_status(request: Request):
+    """Progress of the embedding migration, with recall, latency and size comparison when done (admin only)"""
+    require_admin(request)
+    try:
+        from embedding_migration import embedding_migration
+        return embedding_migration.get_status()
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
@@ -1,8 +1,7 @@
 # review_clarification_service.py - Service for Review & Clarification feature
 from datetime import datetime
 from typing import List, Dict, Optional
-from config import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
-from supabase import create_client
+from local_store import create_metadata_client
 from chat_service import chat_service
 from user_management import user_management
 
@@ -10,7 +9,7 @@ class ReviewClarificationService:
     """Manages clarifications for chat messages"""
     
     def __init__(self):
-        self.supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.supabase = create_metadata_client()
     
     # ========== DATABASE OPERATIONS ==========
     
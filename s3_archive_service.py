@@ -7,18 +7,17 @@ import json
 import boto3
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
-from supabase import create_client
+from local_store import create_metadata_client
 import os
 
 from config import (
-    SUPABASE_URL,
-    SUPABASE_SERVICE_ROLE_KEY,
     AWS_ACCESS_KEY_ID,
     AWS_SECRET_ACCESS_KEY,
     AWS_REGION,
     S3_BUCKET_NAME,
     USE_S3_STORAGE
 )
+from tracing import instrument_boto3_client
 
 
 class S3ArchiveService:
@@ -36,6 +35,7 @@ class S3ArchiveService:
                     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
                     region_name=AWS_REGION
                 )
+                instrument_boto3_client(self.s3_client)
                 self.bucket_name = S3_BUCKET_NAME
                 self.archive_prefix = "archived_conversations/"
                 print("✅ S3 Archive Service initialized")
@@ -46,7 +46,7 @@ class S3ArchiveService:
             print("⚠️  S3 Archive Service disabled (missing credentials or USE_S3_STORAGE=false)")
 
         # Initialize Supabase client
-        self.supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        self.supabase = create_metadata_client()
 
     def is_enabled(self) -> bool:
         """Check if S3 archival is enabled"""
@@ -15,6 +15,7 @@ from config import (
     S3_USER_DOCUMENTS_PREFIX, COMMON_KNOWLEDGE_PATH, RAG_DOCUMENTS_PATH
 )
 from constants import SUPPORTED_EXTENSIONS, MAX_FILE_SIZE_MB
+from tracing import instrument_boto3_client
 
 class S3StorageService:
     """S3 storage service for handling file operations"""
@@ -28,6 +29,7 @@ class S3StorageService:
                     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
                     region_name=AWS_REGION
                 )
+                instrument_boto3_client(self.s3_client)
                 self.bucket_name = S3_BUCKET_NAME
                 self.common_prefix = S3_COMMON_KNOWLEDGE_PREFIX
                 self.user_prefix = S3_USER_DOCUMENTS_PREFIX
@@ -0,0 +1,262 @@
+# tracing.py - Lightweight request-scoped spans for chat turn stages
+#
+# Spans are written as JSON lines to a rotating local file (TRACE_LOG_PATH) and kept in a
+# bounded in-memory window per stage for percentile summaries. If OTEL_EXPORTER_OTLP_ENDPOINT
+# is set and the OpenTelemetry SDK is installed, spans are mirrored to that collector too.
+# Span listeners (metrics.py) receive every finished span even when TRACING_ENABLED is off.
+import json
+import time
+import uuid
+import inspect
+import logging
+import functools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager, ExitStack
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Callable
+
+from config import (
+    TRACING_ENABLED, TRACE_LOG_PATH, TRACE_LOG_MAX_BYTES, TRACE_LOG_BACKUPS,
+    TRACE_OTLP_ENDPOINT, TRACE_STATS_WINDOW
+)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("trace_span", default=None)
+
+_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+_durations: Dict[str, deque] = {}
+_durations_lock = threading.Lock()
+
+_logger: Optional[logging.Logger] = None
+_otel_tracer = None
+_setup_lock = threading.Lock()
+_setup_done = False
+
+def add_span_listener(listener: Callable[[Dict[str, Any]], None]):
+    """Call listener with every finished span record"""
+    _listeners.append(listener)
+
+def _active() -> bool:
+    return TRACING_ENABLED or bool(_listeners)
+
+def _setup():
+    """Open the JSONL log and the optional OTLP exporter on first use"""
+    global _logger, _otel_tracer, _setup_done
+    with _setup_lock:
+        if _setup_done:
+            return
+        _setup_done = True
+        if not TRACING_ENABLED:
+            return
+
+        Path(TRACE_LOG_PATH).parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(TRACE_LOG_PATH, maxBytes=TRACE_LOG_MAX_BYTES, backupCount=TRACE_LOG_BACKUPS)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger = logging.getLogger("sevabot.traces")
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+        _logger.addHandler(handler)
+
+        if TRACE_OTLP_ENDPOINT:
+            try:
+                from opentelemetry import trace
+                from opentelemetry.sdk.resources import Resource
+                from opentelemetry.sdk.trace import TracerProvider
+                from opentelemetry.sdk.trace.export import BatchSpanProcessor
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+                provider = TracerProvider(resource=Resource.create({"service.name": "sevabot"}))
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=TRACE_OTLP_ENDPOINT)))
+                trace.set_tracer_provider(provider)
+                _otel_tracer = trace.get_tracer("sevabot")
+                print(f"✅ Tracing: exporting spans to {TRACE_OTLP_ENDPOINT}")
+            except ImportError:
+                print("⚠️ OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk / "
+                      "opentelemetry-exporter-otlp are not installed; writing local traces only")
+
+def _record(record: Dict[str, Any]):
+    if TRACING_ENABLED:
+        with _durations_lock:
+            window = _durations.get(record["name"])
+            if window is None:
+                window = _durations[record["name"]] = deque(maxlen=TRACE_STATS_WINDOW)
+            window.append(record["duration_ms"])
+        _logger.info(json.dumps(record, default=str))
+
+    for listener in _listeners:
+        try:
+            listener(record)
+        except Exception as e:
+            print(f"⚠️ Span listener failed for {record['name']}: {e}")
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a stage; nested spans share the trace id of the enclosing chat turn"""
+    if not _active():
+        yield None
+        return
+    if not _setup_done:
+        _setup()
+
+    parent = _current_span.get()
+    current = {
+        "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "name": name,
+        "attributes": attributes
+    }
+    token = _current_span.set(current)
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    error = None
+
+    with ExitStack() as stack:
+        if _otel_tracer is not None:
+            stack.enter_context(_otel_tracer.start_as_current_span(name, attributes={
+                k: v for k, v in attributes.items() if isinstance(v, (str, int, float, bool))
+            }))
+        try:
+            yield current
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            _record({
+                **current,
+                "start": started_at.isoformat(),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "error": error
+            })
+
+def record_span(name: str, started_at: datetime, duration_ms: float, error: Optional[str] = None, **attributes):
+    """Record an already-finished stage under the current span (for callback-style hooks)"""
+    if not _active():
+        return
+    if not _setup_done:
+        _setup()
+
+    parent = _current_span.get()
+    _record({
+        "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "name": name,
+        "attributes": attributes,
+        "start": started_at.isoformat(),
+        "duration_ms": round(duration_ms, 2),
+        "error": error
+    })
+
+def traced(name: str):
+    """Decorator form of span() for sync and async functions"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def get_stage_percentiles() -> Dict[str, Dict[str, float]]:
+    """p50/p95/p99/max in ms per span name over the most recent TRACE_STATS_WINDOW spans"""
+    with _durations_lock:
+        snapshot = {name: sorted(window) for name, window in _durations.items()}
+
+    def _pct(values, p):
+        return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+    return {
+        name: {
+            "count": len(values),
+            "p50_ms": _pct(values, 50),
+            "p95_ms": _pct(values, 95),
+            "p99_ms": _pct(values, 99),
+            "max_ms": values[-1]
+        }
+        for name, values in sorted(snapshot.items()) if values
+    }
+
+# ========== LIBRARY INSTRUMENTATION ==========
+
+def _postgrest_span_name(builder) -> str:
+    path = str(getattr(builder, "path", "") or "").strip("/") or "unknown"
+    method = str(getattr(builder, "http_method", "") or "").upper() or "QUERY"
+    return f"supabase.{method} {path}"
+
+def instrument_supabase():
+    """Wrap every postgrest builder's execute() so each Supabase round trip is a span"""
+    try:
+        from postgrest._sync import request_builder as sync_builders
+        from postgrest._async import request_builder as async_builders
+    except ImportError:
+        print("⚠️ Tracing: postgrest internals not found, Supabase calls are not traced")
+        return
+
+    for module in (sync_builders, async_builders):
+        for cls in vars(module).values():
+            execute = inspect.isclass(cls) and cls.__dict__.get("execute")
+            if not execute or getattr(execute, "_traced", False):
+                continue
+
+            if inspect.iscoroutinefunction(execute):
+                @functools.wraps(execute)
+                async def wrapped(self, *args, _execute=execute, **kwargs):
+                    with span(_postgrest_span_name(self)):
+                        return await _execute(self, *args, **kwargs)
+            else:
+                @functools.wraps(execute)
+                def wrapped(self, *args, _execute=execute, **kwargs):
+                    with span(_postgrest_span_name(self)):
+                        return _execute(self, *args, **kwargs)
+
+            wrapped._traced = True
+            cls.execute = wrapped
+
+def instrument_boto3_client(client):
+    """Time every API call made through a boto3 client via its event hooks, with payload sizes"""
+    if client is None:
+        return
+
+    service = client.meta.service_model.service_name
+
+    def _before(model=None, params=None, context=None, **kwargs):
+        if context is None or not _active():
+            return
+        bytes_sent = 0
+        body = (params or {}).get("body")
+        if model is not None and model.has_streaming_input and body is not None:
+            try:
+                bytes_sent = len(body)
+            except TypeError:
+                pass
+        context["_trace_started"] = (datetime.utcnow(), time.perf_counter(), bytes_sent)
+
+    def _after(model=None, context=None, parsed=None, exception=None, **kwargs):
+        if context is None or "_trace_started" not in context:
+            return
+        started_at, started, bytes_sent = context.pop("_trace_started")
+        bytes_received = 0
+        if model.has_streaming_output and isinstance(parsed, dict):
+            bytes_received = parsed.get("ContentLength") or 0
+        record_span(
+            f"{service}.{model.name}", started_at, (time.perf_counter() - started) * 1000,
+            error=f"{type(exception).__name__}: {exception}" if exception else None,
+            bytes_sent=bytes_sent, bytes_received=bytes_received
+        )
+
+    client.meta.events.register(f"before-call.{service}.*", _before)
+    client.meta.events.register(f"after-call.{service}.*", _after)
+    client.meta.events.register(f"after-call-error.{service}.*", _after)
@@ -10,6 +10,7 @@ from file_services import enhanced_file_service
 from chat_service import chat_service
 from review_clarification_service import review_clarification_service
 from constants import USER_ROLES
+from config import COOKIE_NAME, GRADIO_CONCURRENCY_LIMIT
 
 from ui_styles import (get_favicon_link, get_isha_logo_svg, get_landing_page_html, get_main_app_css)
 
@@ -35,6 +36,7 @@ def create_gradio_interface():
         selected_chat_user = gr.State(None)
         pending_feedback = gr.State(False)  # Track if feedback is pending
         pending_feedback_message_id = gr.State(None)  # Track which message needs feedback
+        loaded_tabs = gr.State([])  # Tabs whose data has been fetched this session
 
         # Header with user greeting
         with gr.Row():
@@ -1124,120 +1126,6 @@ def create_gradio_interface():
             """
         )
         
-        # Load user files for regular users
-        demo.load(fn=on_files_tab_select, outputs=[common_files_table, personal_files_table])
-
-        # Load admin data
-        def load_admin_data():
-            if ui_service.is_admin():
-                # Common knowledge files
-                files = enhanced_file_service.get_common_knowledge_file_list()
-                choices = [row[0] for row in files] if files else []
-                
-                # Users data
-                users = user_management.get_all_users()
-                spoc_users = [user for user in users if user['role'] == 'spoc']
-                all_users_for_chat = [user for user in users if user['role'] in ['user', 'spoc', 'admin']]
-                
-                # Assignable users (from whitelist, excluding already assigned)
-                assignable_users = user_management.get_assignable_users_for_spoc()
-                
-                all_user_choices = [(user_management.format_user_for_dropdown(user) + f" - {user['role'].upper()}", user['email']) for user in users]
-                spoc_choices = [("Select SPOC...", "")] + [(user_management.format_user_for_dropdown(user), user['email']) for user in spoc_users]
-                assignable_choices = [("Select User...", "")] + [(user_management.format_user_for_dropdown(user), user['email']) for user in assignable_users]
-                chat_user_choices = [(user_management.format_user_for_dropdown(user), user['email']) for user in all_users_for_chat]
-                
-                user_file_choices = [(user_management.format_user_for_dropdown(user), user['email']) for user in users]
-                admin_users_table = user_management.get_users_by_role("admin")
-                
-                # Whitelist data with roles
-                whitelist_data = user_management.get_whitelisted_emails_with_roles()
-                whitelist_table_data = []
-                whitelist_choices = []
-                for item in whitelist_data:
-                    whitelist_table_data.append([
-                        item["email"],
-                        item.get("role", "user"),
-                        item.get("department", ""), 
-                        item["added_by"], 
-                        item["added_at"][:10]
-                    ])
-                    whitelist_choices.append(item["email"])
-
-                departments_list = ["Select Department"] + user_management.get_departments()
-                spoc_list = ["Select SPOC"] + user_management.get_spoc_users()
-                assignments_data = user_management.get_assignments_with_names("ALL")
-                
-                # Get role-based choices for new SPOC management
-                regular_users = [u for u in users if u['role'] == 'user']
-                spoc_users_for_mgmt = [u for u in users if u['role'] == 'spoc']
-                admin_users_for_mgmt = [u for u in users if u['role'] == 'admin']
-                
-                user_choices_mgmt = [(user_management.format_user_for_dropdown(u), u['email']) for u in regular_users]
-                spoc_choices_mgmt = [(user_management.format_user_for_dropdown(u), u['email']) for u in spoc_users_for_mgmt]
-                admin_choices_mgmt = [(user_management.format_user_for_dropdown(u), u['email']) for u in admin_users_for_mgmt]
-                
-                # Get SPOC emails for filter dropdown
-                spoc_filter_choices = ["ALL"] + [(user_management.format_user_for_dropdown(u), u['email']) for u in spoc_users_for_mgmt]
-                
-                # Get user hierarchy data - use get_all_users_table which has proper formatting
-                users_hierarchy = user_management.get_all_users_table()
-                
-                # All users for transfer/migrate
-                all_user_choices_transfer = [(user_management.format_user_for_dropdown(u), u['email']) for u in users]
-                
-                return (
-                    gr.update(value=files), gr.update(choices=choices, value=[]),  # files_table, selected_files
-                    gr.update(choices=chat_user_choices), gr.update(choices=user_file_choices),  # chat_users_dropdown, user_file_users_dropdown
-                    gr.update(value=users_hierarchy),  # role_users_table
-                    gr.update(value=whitelist_table_data),  # whitelist_table
-                    gr.update(choices=departments_list, value="Select Department"),  # department_input
-                    gr.update(choices=departments_list, value="Select Department"),  # delete_dept_dropdown
-                    gr.update(value=assignments_data),  # assignments_table
-                    gr.update(choices=spoc_list, value="Select SPOC"),  # spoc_dropdown - FIXED
-                    gr.update(choices=whitelist_choices),  # whitelist_select
-                    gr.update(choices=spoc_filter_choices),  # spoc_filter_dropdown
-                    gr.update(choices=user_choices_mgmt, value=None),  # user_to_spoc_dropdown
-                    gr.update(choices=spoc_choices_mgmt, value=None),  # spoc_to_user_dropdown
-                    gr.update(choices=all_user_choices_transfer, value=None),  # transfer_user_dropdown
-                    gr.update(choices=spoc_choices_mgmt, value=None),  # transfer_to_spoc_dropdown
-                    gr.update(choices=spoc_choices_mgmt, value=None),  # spoc_to_admin_dropdown
-                    gr.update(choices=admin_choices_mgmt, value=None),  # admin_to_spoc_dropdown
-                    gr.update(choices=all_user_choices_transfer, value=None)  # migrate_user_dropdown
-                )
-            elif ui_service.is_spoc():
-                files = enhanced_file_service.get_common_knowledge_file_list()
-                file_choices = [row[0] for row in files] if files else []
-                assigned_users = user_management.get_spoc_assignments(ui_service.current_user["email"])
-                users = user_management.get_all_users()
-                assigned_user_details = [user for user in users if user['email'] in assigned_users]
-                chat_user_choices = [(user_management.format_user_for_dropdown(user), user['email']) for user in assigned_user_details]
-                
-                return tuple([gr.update(value=files), gr.update(choices=file_choices, value=[])] + [gr.update()] + [gr.update(choices=chat_user_choices)] + [gr.update()] * 15)
-            
-            return tuple([gr.update()] * 19)
-        
-        demo.load(
-            fn=load_admin_data,
-            outputs=[
-                files_table, selected_files,
-                chat_users_dropdown, user_file_users_dropdown, role_users_table,
-                whitelist_table, department_input, delete_dept_dropdown,
-                assignments_table, spoc_dropdown, whitelist_select,
-                spoc_filter_dropdown, user_to_spoc_dropdown, spoc_to_user_dropdown,
-                transfer_user_dropdown, transfer_to_spoc_dropdown, spoc_to_admin_dropdown,
-                admin_to_spoc_dropdown, migrate_user_dropdown
-            ]
-        )
-        
-        # Load assignments overview
-        def load_assignments_overview():
-            if ui_service.is_admin():
-                return gr.update(value=user_management.get_assignments_overview_table())
-            return gr.update(value=[])
-        
-        demo.load(fn=load_assignments_overview, outputs=[assignments_table])
-        
         # ========== CHAT HANDLERS ==========
         
         # Chat user selection with proper conversation loading
@@ -1276,8 +1164,8 @@ def create_gradio_interface():
             
             return gr.update(choices=[])
         
-        def refresh_current_user_chats():
-            conversations = chat_service.get_user_conversations(ui_service.current_user["email"])
+        async def refresh_current_user_chats():
+            conversations = await chat_service.aget_user_conversations(ui_service.current_user["email"])
             session_choices = [(conv["title"], conv["id"]) for conv in conversations]
             return gr.update(choices=session_choices, value=None)
         
@@ -1285,13 +1173,13 @@ def create_gradio_interface():
         refresh_chat_users_btn.click(fn=refresh_chat_users, outputs=[chat_users_dropdown])
         refresh_chat_btn.click(fn=refresh_current_user_chats, outputs=[sessions_radio])
 
-        def send_message_with_radio_disable(message, history, conversation_id, target_user, pending_feedback_state):
+        async def send_message_with_radio_disable(message, history, conversation_id, target_user, pending_feedback_state):
             # Block sending if feedback is pending
             if pending_feedback_state:
                 notification = '<div class="notification" style="background: #f59e0b !important;">⚠️ Please provide feedback before sending a new message</div>'
                 return history, "", conversation_id, gr.update(value=conversation_id), "", gr.update(interactive=False), gr.update(visible=True), None, True, gr.update(interactive=False, value=conversation_id), gr.update(interactive=False), notification
             
-            result = ui_service.send_message_for_user(message, history, conversation_id, target_user)
+            result = await ui_service.send_message_for_user(message, history, conversation_id, target_user)
             return result + (gr.update(interactive=False), gr.update(interactive=False), gr.update(interactive=False), gr.update(value="", visible=False))
 
         chat_input.submit(
@@ -1487,7 +1375,6 @@ def create_gradio_interface():
         # ========== FILE MANAGEMENT EVENT BINDINGS ==========
         
         # Files tab bindings (for all users)
-        files_tab.select(fn=on_files_tab_select, outputs=[common_files_table, personal_files_table])
         refresh_common_btn.click(fn=refresh_common_files, outputs=[common_files_table])
         refresh_personal_btn.click(fn=refresh_personal_files, outputs=[personal_files_table])
         common_search.change(fn=search_common_files, inputs=[common_search], outputs=[common_files_table])
@@ -2702,11 +2589,6 @@ def create_gradio_interface():
         
         
         # Review Tab Events
-        review_clarification_tab.select(
-            fn=load_review_users_new,
-            outputs=[review_user_dropdown]
-        )
-        
         # Admin/SPOC: When user selected, load their sessions
         review_user_dropdown.change(
             fn=load_review_sessions_new,
@@ -2928,6 +2810,132 @@ def create_gradio_interface():
         
         # Logout
         logout_btn.click(fn=lambda: None, js="() => { window.location.href = '/logout'; }")
+        
+        # ========== LAZY TAB LOADING ==========
+        
+        def lazy_tab_loader(tab_key, loader, output_count):
+            """Run a tab loader only the first time the tab is opened in this session.
+            
+            Later selections are no-ops; the tab's own refresh buttons fetch fresh data.
+            """
+            def _load(loaded):
+                loaded = loaded or []
+                if tab_key in loaded:
+                    return tuple([gr.update()] * output_count) + (loaded,)
+                
+                result = loader()
+                if not isinstance(result, tuple):
+                    result = (result,)
+                return result + (loaded + [tab_key],)
+            return _load
+        
+        def load_chat_users_on_start():
+            """Admin/SPOC chat user picker is on the default tab, so it loads with the page"""
+            if ui_service.is_admin_or_spoc():
+                return refresh_chat_users()
+            return gr.update()
+        
+        def load_common_files_tab():
+            """Common knowledge file list for admins/SPOCs"""
+            if not ui_service.is_admin_or_spoc():
+                return gr.update(), gr.update()
+            
+            files = enhanced_file_service.get_common_knowledge_file_list()
+            choices = [row[0] for row in files] if files else []
+            return gr.update(value=files), gr.update(choices=choices, value=[])
+        
+        def load_user_files_tab():
+            """User picker for the per-user file manager"""
+            if not ui_service.is_admin():
+                return gr.update()
+            return refresh_user_file_users()[0]
+        
+        def load_whitelist_tab():
+            """Whitelist table plus department and SPOC pickers used by the add-user form"""
+            updates = [gr.update()] * 5
+            if not ui_service.is_admin():
+                return tuple(updates)
+            
+            data = ui_service.load_concurrently({
+                "whitelist": lambda: search_whitelist_data(""),
+                "departments": user_management.get_departments,
+                "spocs": user_management.get_spoc_users,
+            })
+            
+            if "whitelist" in data:
+                updates[0], updates[1] = data["whitelist"]  # whitelist_table, whitelist_select
+            
+            if "departments" in data:
+                departments_list = ["Select Department"] + data["departments"]
+                updates[2] = gr.update(choices=departments_list, value="Select Department")  # department_input
+                updates[3] = gr.update(choices=departments_list, value="Select Department")  # delete_dept_dropdown
+            
+            if "spocs" in data:
+                updates[4] = gr.update(choices=["Select SPOC"] + data["spocs"], value="Select SPOC")  # spoc_dropdown
+            
+            return tuple(updates)
+        
+        def load_roles_tab():
+            """Role management dropdowns, assignments table and SPOC filter"""
+            if not ui_service.is_admin():
+                return tuple([gr.update()] * 12)
+            
+            role_updates = refresh_roles_handler()[:-1]  # Drop the "refreshed" notification
+            spoc_users = user_management.get_users_by_role_simple('spoc')
+            spoc_filter_choices = ["ALL"] + [(user_management.format_user_for_dropdown(u), u['email']) for u in spoc_users]
+            return tuple(role_updates) + (gr.update(choices=spoc_filter_choices),)
+        
+        def load_review_tab():
+            """Reviewable users for admins/SPOCs"""
+            if not ui_service.is_admin_or_spoc():
+                return gr.update()
+            return load_review_users_new()
+        
+        demo.load(fn=load_chat_users_on_start, outputs=[chat_users_dropdown])
+        
+        files_tab.select(
+            fn=lazy_tab_loader("files", on_files_tab_select, 2),
+            inputs=[loaded_tabs],
+            outputs=[common_files_table, personal_files_table, loaded_tabs]
+        )
+        file_manager_common_tab.select(
+            fn=lazy_tab_loader("file_manager_common", load_common_files_tab, 2),
+            inputs=[loaded_tabs],
+            outputs=[files_table, selected_files, loaded_tabs]
+        )
+        file_manager_users_tab.select(
+            fn=lazy_tab_loader("file_manager_users", load_user_files_tab, 1),
+            inputs=[loaded_tabs],
+            outputs=[user_file_users_dropdown, loaded_tabs]
+        )
+        
+        # Users tab opens on the whitelist subtab, so both events share one loader
+        whitelist_tab_outputs = [whitelist_table, whitelist_select, department_input, delete_dept_dropdown, spoc_dropdown, loaded_tabs]
+        users_tab.select(
+            fn=lazy_tab_loader("whitelist", load_whitelist_tab, 5),
+            inputs=[loaded_tabs],
+            outputs=whitelist_tab_outputs
+        )
+        whitelist_subtab.select(
+            fn=lazy_tab_loader("whitelist", load_whitelist_tab, 5),
+            inputs=[loaded_tabs],
+            outputs=whitelist_tab_outputs
+        )
+        role_subtab.select(
+            fn=lazy_tab_loader("roles", load_roles_tab, 12),
+            inputs=[loaded_tabs],
+            outputs=[user_to_spoc_dropdown, spoc_to_user_dropdown, reassign_spoc_dropdown, spoc_to_admin_dropdown, reassign_spoc_for_admin_dropdown, admin_to_spoc_dropdown, transfer_to_spoc_dropdown, transfer_user_dropdown, migrate_user_dropdown, migrate_to_dept_dropdown, assignments_table, spoc_filter_dropdown, loaded_tabs]
+        )
+        hierarchy_subtab.select(
+            fn=lazy_tab_loader("hierarchy", refresh_user_hierarchy, 1),
+            inputs=[loaded_tabs],
+            outputs=[role_users_table, loaded_tabs]
+        )
+        review_clarification_tab.select(
+            fn=lazy_tab_loader("review", load_review_tab, 1),
+            inputs=[loaded_tabs],
+            outputs=[review_user_dropdown, loaded_tabs]
+        )
     
         demo.load(fn=auto_load_latest_or_pending_feedback, outputs=[chatbot, current_conversation_id, sessions_radio, action_status, pending_feedback, pending_feedback_message_id, feedback_row])
 
@@ -2942,7 +2950,7 @@ def create_ui(app: FastAPI):
         if not user_data:
             return HTMLResponse(content=create_landing_page_html())
         
-        ui_service.set_user(user_data)
+        ui_service.set_user(user_data, request.cookies.get(COOKIE_NAME))
         return RedirectResponse("/gradio/")
 
     @app.get("/chat")
@@ -2955,11 +2963,13 @@ def create_ui(app: FastAPI):
             user_data = get_logged_in_user(request)
             if not user_data:
                 return RedirectResponse("/")
-            ui_service.set_user(user_data)
+            # Session state is keyed by the signed cookie, not shared across users
+            ui_service.set_user(user_data, request.cookies.get(COOKIE_NAME))
         
         response = await call_next(request)
         return response
     
     # Mount Gradio interface
     demo = create_gradio_interface()
+    demo.queue(default_concurrency_limit=GRADIO_CONCURRENCY_LIMIT)
     mount_gradio_app(app, demo, path="/gradio")
\ No newline at end of file
@@ -1,33 +1,208 @@
 # ui_service.py - Enhanced UI service with comprehensive functionality
+import asyncio
 import threading
-from typing import List, Dict, Optional, Tuple, Any
+import contextvars
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, List, Dict, Optional, Tuple, Any
 import gradio as gr
-from constants import MAX_SESSIONS_PER_USER, ERROR_MESSAGES, USER_ROLES
+from gradio.context import LocalContext
+from constants import (
+    MAX_SESSIONS_PER_USER, ERROR_MESSAGES, USER_ROLES,
+    ADMIN_LOAD_MAX_WORKERS, ADMIN_LOAD_TIMEOUT_SECONDS, SESSION_MAX_AGE
+)
 from chat_service import chat_service
-from config import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, IS_PRODUCTION
-from supabase import create_client
+from config import IS_PRODUCTION, COOKIE_NAME
+from local_store import create_metadata_client
 from user_management import user_management
+from auth import get_logged_in_user
+from tracing import traced
+
+# Session key bound for plain FastAPI requests (landing page, auth middleware)
+_request_session_key = contextvars.ContextVar("ui_session_key", default=None)
+
+def _default_user() -> Dict:
+    return {"email": "", "name": "User", "user_id": "", "role": "user"}
+
+def _new_session_state(user: Optional[Dict] = None) -> Dict:
+    return {
+        "user": user or _default_user(),
+        "conversation_id": None,
+        "last_assistant_message_id": None,
+        "last_seen": time.time()
+    }
 
 class EnhancedUIService:
-    """Enhanced UI service with comprehensive file and vector operations"""
+    """Enhanced UI service with comprehensive file and vector operations
+    
+    Per-user state (current user, conversation, last assistant message) lives in a
+    session store keyed by the signed session cookie, so concurrent Gradio events
+    and multiple worker processes never see each other's user.
+    """
     
     def __init__(self):
-        self.current_user = {"email": "", "name": "User", "user_id": "", "role": "user"}
-        self.current_conversation_id = None
-        self.last_assistant_message_id = None
+        self._sessions: Dict[str, Dict] = {}
+        self._last_prune = time.time()
         self._lock = threading.Lock()
+        self._load_executor = ThreadPoolExecutor(
+            max_workers=ADMIN_LOAD_MAX_WORKERS, thread_name_prefix="ui-load"
+        )
     
-    # ========== USER MANAGEMENT ==========
+    # ========== CONCURRENT LOADING ==========
+    
+    def load_concurrently(self, loaders: Dict[str, Callable[[], Any]], timeout: float = ADMIN_LOAD_TIMEOUT_SECONDS) -> Dict[str, Any]:
+        """Run independent loaders in parallel and collect whatever finishes in time.
+        
+        Returns a dict of loader name -> result. Each loader gets ``timeout`` seconds from
+        when it starts running (one still queued after ``timeout`` is dropped as well);
+        loaders that fail or run out of time are left out so the caller can render partially.
+        """
+        submitted = time.monotonic()
+        started: Dict[str, float] = {}
+        
+        def _run(name, loader, context):
+            started[name] = time.monotonic()
+            return context.run(loader)
+        
+        futures = {
+            # Each loader gets its own context copy so request-scoped state follows it
+            self._load_executor.submit(_run, name, loader, contextvars.copy_context()): name
+            for name, loader in loaders.items()
+        }
+        
+        results = {}
+        pending = set(futures)
+        while pending:
+            now = time.monotonic()
+            deadlines = {future: started.get(futures[future], submitted) + timeout for future in pending}
+            expired = {future for future in pending if deadlines[future] <= now and not future.done()}
+            for future in expired:
+                future.cancel()
+                print(f"⚠️ Load source '{futures[future]}' exceeded {timeout}s, rendering without it")
+            pending -= expired
+            if not pending:
+                break
+            
+            done, pending = wait(pending, timeout=max(0.0, min(deadlines[f] for f in pending) - now),
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    print(f"Error loading '{futures[future]}': {e}")
+        
+        print(f"Loaded {len(results)}/{len(loaders)} sources in {time.monotonic() - submitted:.2f}s")
+        return results
+    
+    # ========== SESSION STATE ==========
+    
+    def _resolve_session_key(self) -> Optional[str]:
+        """Find the signed session cookie for the request being handled"""
+        # Gradio event handlers (including queued ones) expose their request here
+        request = LocalContext.request.get(None)
+        if request is not None:
+            try:
+                cookie = request.cookies.get(COOKIE_NAME)
+                if cookie:
+                    return cookie
+            except Exception:
+                pass
+        return _request_session_key.get()
+    
+    def _session(self, for_write: bool = False) -> Dict:
+        """Get state for the current session, restoring it from the cookie on a miss"""
+        key = self._resolve_session_key()
+        if not key:
+            # No session (e.g. background call): reads see logged-out state, but a write
+            # would be dropped, so refuse it instead of losing it silently
+            if for_write:
+                raise RuntimeError("No session key for this request; UI state cannot be saved")
+            return _new_session_state()
+        
+        with self._lock:
+            state = self._sessions.get(key)
+            if state is not None:
+                state["last_seen"] = time.time()
+                return state
+        
+        # Another worker may have handled the login; the cookie carries the user
+        user = None
+        request = LocalContext.request.get(None)
+        if request is not None:
+            user_data = get_logged_in_user(request)
+            if user_data:
+                user = self._normalize_user(user_data)
+        
+        with self._lock:
+            return self._sessions.setdefault(key, _new_session_state(user))
     
-    def set_user(self, user_data: Dict):
-        """Set current user with role"""
+    def _prune_sessions(self):
+        """Drop sessions idle for longer than the cookie lifetime (at most once a minute)"""
+        now = time.time()
+        cutoff = now - SESSION_MAX_AGE
         with self._lock:
-            self.current_user = {
-                "email": user_data.get("email", ""),
-                "name": user_data.get("name", "User"),
-                "user_id": user_data.get("user_id", ""),
-                "role": user_data.get("role", "user")
-            }
+            if now - self._last_prune < 60:
+                return
+            self._last_prune = now
+            expired = [key for key, state in self._sessions.items() if state["last_seen"] < cutoff]
+            for key in expired:
+                del self._sessions[key]
+    
+    def bind_session(self, session_key: Optional[str]):
+        """Bind a session key to the current (non-Gradio) request context"""
+        _request_session_key.set(session_key)
+    
+    @property
+    def current_user(self) -> Dict:
+        return self._session()["user"]
+    
+    @current_user.setter
+    def current_user(self, user: Dict):
+        self._session(for_write=True)["user"] = user
+    
+    @property
+    def current_conversation_id(self) -> Optional[str]:
+        return self._session()["conversation_id"]
+    
+    @current_conversation_id.setter
+    def current_conversation_id(self, conversation_id: Optional[str]):
+        self._session(for_write=True)["conversation_id"] = conversation_id
+    
+    @property
+    def last_assistant_message_id(self) -> Optional[str]:
+        return self._session()["last_assistant_message_id"]
+    
+    @last_assistant_message_id.setter
+    def last_assistant_message_id(self, message_id: Optional[str]):
+        self._session(for_write=True)["last_assistant_message_id"] = message_id
+    
+    def active_session_count(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+    
+    # ========== USER MANAGEMENT ==========
+    
+    @staticmethod
+    def _normalize_user(user_data: Dict) -> Dict:
+        return {
+            "email": user_data.get("email", ""),
+            "name": user_data.get("name", "User"),
+            "user_id": user_data.get("user_id", ""),
+            "role": user_data.get("role", "user")
+        }
+    
+    def set_user(self, user_data: Dict, session_key: Optional[str] = None):
+        """Set current user with role for the given (or current) session"""
+        if session_key:
+            self.bind_session(session_key)
+            with self._lock:
+                state = self._sessions.setdefault(session_key, _new_session_state())
+                state["user"] = self._normalize_user(user_data)
+                state["last_seen"] = time.time()
+            self._prune_sessions()
+        else:
+            self.current_user = self._normalize_user(user_data)
     
     def get_display_name(self) -> str:
         """Get user's display name"""
@@ -133,8 +308,13 @@ class EnhancedUIService:
 
     # ========== CHAT OPERATIONS ==========
     
-    def send_message_for_user(self, message: str, history: List[Dict], conversation_id: Optional[str], target_user_email: str = None) -> Tuple[List[Dict], str, Optional[str], gr.update, str, gr.update, gr.update, Optional[str]]:
-        """Send message - for specific user if admin/SPOC viewing user chats"""
+    @traced("chat.turn")
+    async def send_message_for_user(self, message: str, history: List[Dict], conversation_id: Optional[str], target_user_email: str = None) -> Tuple[List[Dict], str, Optional[str], gr.update, str, gr.update, gr.update, Optional[str]]:
+        """Send message - for specific user if admin/SPOC viewing user chats
+        
+        Async so a turn waiting on the database or OpenAI runs on the event loop instead of
+        holding one of Gradio's worker threads.
+        """
         if not message.strip():
             return history or [], "", conversation_id, gr.update(), "", gr.update(interactive=True), gr.update(visible=False), None
         
@@ -148,6 +328,7 @@ class EnhancedUIService:
         # Initialize response variable
         response = ""
         assistant_msg_id = None
+        sent_at = datetime.utcnow().isoformat()
         
         # Determine which user this message is for
         if target_user_email and self.is_admin_or_spoc():
@@ -169,16 +350,15 @@ class EnhancedUIService:
         try:
             # Create new conversation if needed (for the target user)
             if not conversation_id:
-                existing_conversations = chat_service.get_user_conversations(user_email)
-                if len(existing_conversations) >= MAX_SESSIONS_PER_USER:
+                if await chat_service.acount_user_conversations(user_email) >= MAX_SESSIONS_PER_USER:
                     error_history = (history or []) + [
                         {"role": "user", "content": message},
                         {"role": "assistant", "content": ERROR_MESSAGES["session_limit"]}
                     ]
                     return error_history, "", conversation_id, gr.update(), ERROR_MESSAGES["session_limit"], gr.update(interactive=True), gr.update(visible=False), None
                 
-                title = chat_service.generate_title(message)
-                conversation_id = chat_service.create_conversation(user_email, title)  # Create for target user
+                title = await chat_service.agenerate_title(message)
+                conversation_id = await chat_service.acreate_conversation(user_email, title)  # Create for target user
                 
                 if not conversation_id:
                     error_history = (history or []) + [
@@ -189,21 +369,23 @@ class EnhancedUIService:
                 
                 self.current_conversation_id = conversation_id
             
-            # Store user message
-            chat_service.store_message(conversation_id, "user", message)
-            
-            # Get conversation history for context
-            conv_history = chat_service.get_conversation_history(conversation_id)
+            # Get conversation history for context: rolling summary + turns after it
+            conv_history, (summary, summarized_turns) = await asyncio.gather(
+                chat_service.aget_conversation_history(conversation_id),
+                chat_service.aget_conversation_summary(conversation_id)
+            )
             
             # Generate response using common knowledge repository
-            response = chat_service.create_rag_response(message, conv_history)
+            response, usage = await chat_service.acreate_rag_response_with_usage(
+                message, conv_history[summarized_turns:], summary
+            )
             
-            # Store assistant message
-            assistant_msg_id = chat_service.store_message(conversation_id, "assistant", response)
+            # Store both messages in one write (this also bumps the conversation timestamp),
+            # then queue the token usage and timings
+            assistant_msg_id = await chat_service.acommit_turn(conversation_id, message, response, sent_at)
             self.last_assistant_message_id = assistant_msg_id
-            
-            # Update conversation timestamp
-            chat_service.update_conversation_timestamp(conversation_id)
+            chat_service.store_message_usage(assistant_msg_id, conversation_id, user_email, usage)
+            chat_service.schedule_summary_update(conversation_id)
             
             # Update history
             new_history = (history or []) + [
@@ -212,7 +394,7 @@ class EnhancedUIService:
             ]
             
             # Get updated sessions for the target user
-            conversations = chat_service.get_user_conversations(user_email)
+            conversations = await chat_service.aget_user_conversations(user_email)
             session_choices = [(conv["title"], conv["id"]) for conv in conversations]
             sessions_update = gr.update(choices=session_choices, value=conversation_id)
             
@@ -248,7 +430,7 @@ class EnhancedUIService:
         
         try:
             # Verify the conversation belongs to the target user
-            supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+            supabase = create_metadata_client()
             conv_result = supabase.table("conversations")\
                 .select("user_id")\
                 .eq("id", conversation_id)\
@@ -311,8 +493,7 @@ class EnhancedUIService:
             user_email = self.current_user["email"]
         
         # Check session limits for target user
-        existing_conversations = chat_service.get_user_conversations(user_email)
-        if len(existing_conversations) >= MAX_SESSIONS_PER_USER:
+        if chat_service.count_user_conversations(user_email) >= MAX_SESSIONS_PER_USER:
             return [], None, gr.update(), f"User {user_email} has reached session limit"
         
         self.current_conversation_id = None
@@ -357,7 +538,7 @@ class EnhancedUIService:
         
         try:
             # Verify the conversation belongs to the target user
-            supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+            supabase = create_metadata_client()
             conv_result = supabase.table("conversations")\
                 .select("user_id")\
                 .eq("id", conversation_id)\
@@ -394,7 +575,7 @@ class EnhancedUIService:
             if success and history:
                 # Find the message that corresponds to this message_id
                 # Get the message content from database to match
-                supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+                supabase = create_metadata_client()
                 msg_result = supabase.table("messages")\
                     .select("content, created_at")\
                     .eq("id", message_id)\
@@ -443,7 +624,7 @@ class EnhancedUIService:
                 return False, None, None
             
             # Get the most recent assistant message without feedback for current user
-            supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+            supabase = create_metadata_client()
             
             result = supabase.table("messages")\
                 .select("id, conversation_id, content, created_at, conversations!inner(user_id, title)")\
@@ -1,9 +1,9 @@
 # user_management.py - User management with email whitelist
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
-from constants import USER_ROLES
-from config import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
-from supabase import create_client
+from constants import USER_ROLES, USER_DIRECTORY_TTL_SECONDS
+from local_store import create_metadata_client
+import threading
 import time
 
 class UserManagement:
@@ -12,11 +12,17 @@ class UserManagement:
     def __init__(self):
         self.supabase = None
         self._init_connection()
+        
+        # In-memory user directory (whitelist ⨝ users + SPOC assignments)
+        self._directory = None
+        self._directory_version = 0
+        self._directory_lock = threading.Lock()
+        self._directory_refresh_lock = threading.Lock()
     
     def _init_connection(self):
         """Initialize Supabase connection"""
         try:
-            self.supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+            self.supabase = create_metadata_client()
         except Exception as e:
             print(f"Error initializing Supabase connection: {e}")
     
@@ -41,6 +47,107 @@ class UserManagement:
                         continue
                 raise
     
+    # ========== USER DIRECTORY SNAPSHOT ==========
+    
+    def invalidate_directory(self):
+        """Mark the cached user directory stale - call after every write"""
+        with self._directory_lock:
+            self._directory_version += 1
+    
+    def _is_directory_fresh(self, directory: Optional[Dict]) -> bool:
+        """Check snapshot against the current version and TTL"""
+        return (
+            directory is not None
+            and directory["version"] == self._directory_version
+            and time.time() - directory["loaded_at"] < USER_DIRECTORY_TTL_SECONDS
+        )
+    
+    def _get_directory(self) -> Dict:
+        """Get the user directory snapshot, rebuilding it when stale"""
+        directory = self._directory
+        if self._is_directory_fresh(directory):
+            return directory
+        
+        # Serialize rebuilds so concurrent readers reuse one refresh
+        with self._directory_refresh_lock:
+            directory = self._directory
+            if self._is_directory_fresh(directory):
+                return directory
+            
+            version = self._directory_version
+            try:
+                directory = self._build_directory(version)
+            except Exception as e:
+                print(f"Error loading user directory: {e}")
+                # Serve the last good snapshot rather than empty admin pages
+                return self._directory or self._build_directory_from_rows(version, [], [], [])
+            
+            self._directory = directory
+            return directory
+    
+    def _build_directory(self, version: int) -> Dict:
+        """Load whitelist, users and assignments and index them in memory"""
+        def _load():
+            whitelist_result = self.supabase.table("email_whitelist")\
+                .select("*")\
+                .eq("is_active", True)\
+                .order("added_at", desc=True)\
+                .execute()
+            
+            users_result = self.supabase.table("users")\
+                .select("email, name, role, last_login, created_at")\
+                .execute()
+            
+            assignments_result = self.supabase.table("spoc_assignments")\
+                .select("*")\
+                .order("created_at", desc=True)\
+                .execute()
+            
+            return whitelist_result.data or [], users_result.data or [], assignments_result.data or []
+        
+        whitelist, users, assignments = self._retry_operation(_load)
+        return self._build_directory_from_rows(version, whitelist, users, assignments)
+    
+    def _build_directory_from_rows(self, version: int, whitelist: List[Dict], users: List[Dict], assignments: List[Dict]) -> Dict:
+        """Merge raw rows into the directory indexes"""
+        users_map = {u['email']: u for u in users}
+        
+        merged_users = []
+        for w in whitelist:
+            email = w['email']
+            user_data = users_map.get(email, {})
+            
+            merged_users.append({
+                'email': email,
+                'name': user_data.get('name') or email.split('@')[0].replace('.', ' ').replace('-', ' ').title(),
+                'role': w.get('role', 'user'),
+                'last_login': user_data.get('last_login'),
+                'created_at': w.get('added_at') or user_data.get('created_at'),
+                'department': w.get('department') or "",  # Empty string instead of None
+                'added_by': w.get('added_by')
+            })
+        
+        by_role = {}
+        for user in merged_users:
+            by_role.setdefault(user['role'], []).append(user)
+        
+        assignments_by_spoc = {}
+        for item in assignments:
+            assignments_by_spoc.setdefault(item["spoc_email"], []).append(item["assigned_user_email"])
+        
+        return {
+            "version": version,
+            "loaded_at": time.time(),
+            "whitelist": whitelist,
+            "whitelist_by_email": {w['email']: w for w in whitelist},
+            "users_map": users_map,
+            "users": merged_users,
+            "by_email": {u['email']: u for u in merged_users},
+            "by_role": by_role,
+            "assignments": assignments,
+            "assignments_by_spoc": assignments_by_spoc
+        }
+    
     # ========== EMAIL WHITELIST MANAGEMENT ==========
     
     def validate_sadhguru_domain(self, email: str) -> tuple:
@@ -57,16 +164,8 @@ class UserManagement:
     
     def get_whitelisted_emails(self) -> List[Dict]:
         """Get all whitelisted emails"""
-        def _get():
-            result = self.supabase.table("email_whitelist")\
-                .select("*")\
-                .eq("is_active", True)\
-                .order("added_at", desc=True)\
-                .execute()
-            return result.data if result.data else []
-        
         try:
-            return self._retry_operation(_get)
+            return [dict(w) for w in self._get_directory()["whitelist"]]
         except Exception as e:
             print(f"Error getting whitelisted emails: {e}")
             return []
@@ -99,6 +198,7 @@ class UserManagement:
                         .update(update_data)\
                         .eq("email", email_lower)\
                         .execute()
+                    self.invalidate_directory()
                     print(f"✅ Reactivated {email_lower}")
                     return bool(result.data), f"Successfully reactivated {email_lower}"
                 else:
@@ -120,6 +220,7 @@ class UserManagement:
                 .insert(email_data)\
                 .execute()
             
+            self.invalidate_directory()
             print(f"✅ Added {email_lower} to whitelist")
             return bool(result.data), f"Successfully added {email_lower} to whitelist"
         except Exception as e:
@@ -135,6 +236,7 @@ class UserManagement:
                 .eq("email", email.lower())\
                 .execute()
             
+            self.invalidate_directory()
             return True
         except Exception as e:
             print(f"Error removing email from whitelist: {e}")
@@ -142,6 +244,8 @@ class UserManagement:
     
     def is_email_whitelisted(self, email: str) -> bool:
         """Check if email is whitelisted"""
+        # Access check: an indexed lookup rather than the snapshot, so a whitelist change made
+        # by another worker applies at once and a failed refresh can't reject every user
         try:
             result = self.supabase.table("email_whitelist")\
                 .select("id")\
@@ -158,53 +262,16 @@ class UserManagement:
     
     def get_all_users(self) -> List[Dict]:
         """Get all users from email_whitelist (whether logged in or not)"""
-        def _get():
-            # Get from whitelist with roles
-            whitelist_result = self.supabase.table("email_whitelist")\
-                .select("email, role, department, added_at, added_by")\
-                .eq("is_active", True)\
-                .order("added_at", desc=True)\
-                .execute()
-            
-            if not whitelist_result.data:
-                return []
-            
-            # Get user details for name and last_login
-            users_result = self.supabase.table("users")\
-                .select("email, name, last_login, created_at")\
-                .execute()
-            
-            users_map = {u['email']: u for u in users_result.data} if users_result.data else {}
-            
-            # Merge data
-            result = []
-            for w in whitelist_result.data:
-                email = w['email']
-                user_data = users_map.get(email, {})
-                
-                result.append({
-                    'email': email,
-                    'name': user_data.get('name') or email.split('@')[0].replace('.', ' ').replace('-', ' ').title(),
-                    'role': w.get('role', 'user'),
-                    'last_login': user_data.get('last_login'),
-                    'created_at': w.get('added_at') or user_data.get('created_at'),
-                    'department': w.get('department') or "",  # Empty string instead of None
-                    'added_by': w.get('added_by')
-                })
-            
-            return result
-        
         try:
-            return self._retry_operation(_get)
+            return [dict(u) for u in self._get_directory()["users"]]
         except Exception as e:
             print(f"Error getting users: {e}")
             return []
     
     def get_users_by_role(self, role: str) -> List[List[str]]:
-        """Get users formatted for table display by role - always fresh data"""
+        """Get users formatted for table display by role"""
         try:
-            users = self.get_all_users()  # Always get fresh data
-            filtered_users = [user for user in users if user['role'] == role]
+            filtered_users = self._get_directory()["by_role"].get(role, [])
             
             # Format for table: [Name, Email, Last Login, Date Added]
             table_data = []
@@ -224,11 +291,10 @@ class UserManagement:
     def get_users_by_role_simple(self, role: str) -> List[Dict]:
         """Get users by role as simple dict list for dropdown population"""
         try:
-            users = self.get_all_users()
             if role.lower() == 'all':
-                return users
+                return self.get_all_users()
             else:
-                return [user for user in users if user['role'] == role]
+                return [dict(u) for u in self._get_directory()["by_role"].get(role, [])]
         except Exception as e:
             print(f"Error getting users by role simple: {e}")
             return []
@@ -236,15 +302,8 @@ class UserManagement:
     def get_user_by_email(self, email: str) -> Optional[Dict]:
         """Get a single user by email"""
         try:
-            result = self.supabase.table("email_whitelist")\
-                .select("*")\
-                .eq("email", email.lower())\
-                .eq("is_active", True)\
-                .execute()
-            
-            if result.data and len(result.data) > 0:
-                return result.data[0]
-            return None
+            user = self._get_directory()["whitelist_by_email"].get(email.lower())
+            return dict(user) if user else None
         except Exception as e:
             print(f"Error getting user by email: {e}")
             return None
@@ -289,6 +348,7 @@ class UserManagement:
             except:
                 pass  # User hasn't logged in yet, that's fine
             
+            self.invalidate_directory()
             return bool(result.data)
         except Exception as e:
             print(f"ERROR promote_user_to_spoc: {e}")
@@ -329,8 +389,10 @@ class UserManagement:
             except:
                 pass
             
+            self.invalidate_directory()
             return bool(result.data)
         except Exception as e:
+            self.invalidate_directory()
             print(f"Error demoting SPOC to user: {e}")
             return False
     
@@ -352,6 +414,7 @@ class UserManagement:
             except:
                 pass
             
+            self.invalidate_directory()
             return bool(result.data)
         except Exception as e:
             print(f"Error promoting SPOC to Admin: {e}")
@@ -375,6 +438,7 @@ class UserManagement:
             except:
                 pass
             
+            self.invalidate_directory()
             return bool(result.data)
         except Exception as e:
             print(f"Error demoting Admin to SPOC: {e}")
@@ -398,6 +462,7 @@ class UserManagement:
             except:
                 pass
             
+            self.invalidate_directory()
             return bool(result.data)
         except Exception as e:
             print(f"Error demoting Admin to user: {e}")
@@ -432,21 +497,16 @@ class UserManagement:
     def get_assignments_with_names(self, spoc_filter: str = "ALL") -> List[List[str]]:
         """Get assignments with clean name/email separation"""
         try:
-            assignments_result = self.supabase.table("spoc_assignments")\
-                .select("*")\
-                .order("created_at", desc=True)\
-                .execute()
-            
-            if not assignments_result.data:
+            directory = self._get_directory()
+            if not directory["assignments"]:
                 return []
             
             # Get user details
-            users = self.get_all_users()
-            user_details = {user['email']: user['name'] for user in users}
+            user_details = {user['email']: user['name'] for user in directory["users"]}
             
             # Build assignments table
             assignments_data = []
-            for assignment in assignments_result.data:
+            for assignment in directory["assignments"]:
                 spoc_email = assignment["spoc_email"]
                 user_email = assignment["assigned_user_email"]
                 created_date = assignment["created_at"][:10]
@@ -512,9 +572,12 @@ class UserManagement:
                 .insert(assignment_data)\
                 .execute()
             
+            self.invalidate_directory()
             return bool(result.data)
             
         except Exception as e:
+            # The old assignment may already be gone
+            self.invalidate_directory()
             print(f"Error adding SPOC assignment: {e}")
             return False
     
@@ -527,6 +590,7 @@ class UserManagement:
                 .eq("assigned_user_email", user_email)\
                 .execute()
             
+            self.invalidate_directory()
             return True
         except Exception as e:
             print(f"Error removing SPOC assignment: {e}")
@@ -534,6 +598,8 @@ class UserManagement:
     
     def get_spoc_assignments(self, spoc_email: str) -> List[str]:
         """Get list of users assigned to a SPOC"""
+        # Used for access checks: query directly rather than the snapshot, so a revoked
+        # assignment stops granting access at once in every worker
         try:
             result = self.supabase.table("spoc_assignments")\
                 .select("assigned_user_email")\
@@ -550,21 +616,10 @@ class UserManagement:
     def get_all_spoc_assignments(self) -> Dict[str, List[str]]:
         """Get all SPOC assignments"""
         try:
-            result = self.supabase.table("spoc_assignments")\
-                .select("*")\
-                .execute()
-            
-            assignments = {}
-            if result.data:
-                for item in result.data:
-                    spoc_email = item["spoc_email"]
-                    user_email = item["assigned_user_email"]
-                    
-                    if spoc_email not in assignments:
-                        assignments[spoc_email] = []
-                    assignments[spoc_email].append(user_email)
-            
-            return assignments
+            return {
+                spoc_email: list(user_emails)
+                for spoc_email, user_emails in self._get_directory()["assignments_by_spoc"].items()
+            }
         except Exception as e:
             print(f"Error getting all SPOC assignments: {e}")
             return {}
@@ -572,17 +627,12 @@ class UserManagement:
     def get_assignments_overview_table(self) -> List[List[str]]:
         """Get assignments formatted for overview table"""
         try:
-            assignments_result = self.supabase.table("spoc_assignments")\
-                .select("*")\
-                .order("created_at", desc=True)\
-                .execute()
-            
-            if not assignments_result.data:
+            directory = self._get_directory()
+            if not directory["assignments"]:
                 return []
             
             # Get user details for names
-            users = self.get_all_users()
-            user_details = {user['email']: user['name'] for user in users}
+            user_details = {user['email']: user['name'] for user in directory["users"]}
             
             def get_name(email):
                 """Get name from database or extract from email"""
@@ -594,7 +644,7 @@ class UserManagement:
             
             # Build assignments table
             assignments_data = []
-            for assignment in assignments_result.data:
+            for assignment in directory["assignments"]:
                 spoc_email = assignment["spoc_email"]
                 user_email = assignment["assigned_user_email"]
                 created_date = assignment["created_at"][:10]
@@ -615,17 +665,16 @@ class UserManagement:
     def get_assignable_users_for_spoc(self) -> List[Dict]:
         """Get users that can be assigned to SPOCs (from whitelist, excluding already assigned)"""
         try:
+            directory = self._get_directory()
+            
             # Get all assignments to exclude already assigned users
-            assigned_result = self.supabase.table("spoc_assignments")\
-                .select("assigned_user_email").execute()
-            assigned_emails = {item["assigned_user_email"] for item in assigned_result.data or []}
+            assigned_emails = {item["assigned_user_email"] for item in directory["assignments"]}
             
             # Get all whitelisted emails
-            whitelist = self.get_whitelisted_emails()
+            whitelist = directory["whitelist"]
             
             # Get already registered users for name mapping
-            registered_users = self.get_all_users()
-            user_names = {user['email']: user['name'] for user in registered_users}
+            user_names = {user['email']: user['name'] for user in directory["users"]}
             
             # Build assignable users list
             assignable_users = []
@@ -649,8 +698,7 @@ class UserManagement:
     def get_spoc_users(self) -> List[str]:
         """Get list of SPOC users for dropdown"""
         try:
-            spoc_users = [user for user in self.get_all_users() if user['role'] == 'spoc']
-            return [user['email'] for user in spoc_users]
+            return [user['email'] for user in self._get_directory()["by_role"].get('spoc', [])]
         except Exception as e:
             print(f"Error getting SPOC users: {e}")
             return []
@@ -752,8 +800,10 @@ class UserManagement:
                     .eq("spoc_email", email.lower())\
                     .execute()
             
+            self.invalidate_directory()
             return bool(result.data)
         except Exception as e:
+            self.invalidate_directory()
             print(f"Error updating user role: {e}")
             return False
     
@@ -765,6 +815,7 @@ class UserManagement:
                 .eq("email", email.lower())\
                 .execute()
             
+            self.invalidate_directory()
             return bool(result.data)
         except Exception as e:
             print(f"Error updating user department: {e}")
@@ -777,6 +828,7 @@ class UserManagement:
                 .delete()\
                 .eq("assigned_user_email", user_email.lower())\
                 .execute()
+            self.invalidate_directory()
             return True
         except Exception as e:
             print(f"Error removing SPOC assignments: {e}")
@@ -816,24 +868,18 @@ class UserManagement:
     def get_all_users_table(self) -> List[List[str]]:
         """Get all users from whitelist (whether logged in or not) for hierarchy table"""
         try:
-            # Get ALL whitelist entries
-            whitelist = self.supabase.table("email_whitelist")\
-                .select("*")\
-                .eq("is_active", True)\
-                .order("added_at", desc=True)\
-                .execute()
+            directory = self._get_directory()
             
-            if not whitelist.data:
+            # Get ALL whitelist entries
+            whitelist = directory["whitelist"]
+            if not whitelist:
                 return []
             
-            # Get users table for name/role/last_login
-            users_data = self.supabase.table("users")\
-                .select("*")\
-                .execute()
-            users_map = {u['email']: u for u in users_data.data} if users_data.data else {}
+            # Users table for name/role/last_login
+            users_map = directory["users_map"]
             
             table_data = []
-            for item in whitelist.data:
+            for item in whitelist:
                 email = item['email']
                 user_record = users_map.get(email)
                 
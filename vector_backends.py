@@ -0,0 +1,1070 @@
+# vector_backends.py - Lightweight vector store backends used alongside Chroma
+import os
+import io
+import json
+import uuid
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional, Any
+
+import numpy as np
+from langchain_core.documents import Document
+
+VECTORS_FILE = "vectors.npy"
+RECORDS_FILE = "records.json"
+CODES_FILE = "codes.npy"
+SCALES_FILE = "scales.npy"
+SCAN_BLOCK_ROWS = 1024  # Rows widened to float32 at a time during a quantized scan (stays in CPU cache)
+
+def _matches_where(metadata: Dict, where: Optional[Dict]) -> bool:
+    """Evaluate the subset of Chroma's where syntax used by the app"""
+    if not where:
+        return True
+
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches_where(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches_where(metadata, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, expected in condition.items():
+                if op == "$eq" and value != expected:
+                    return False
+                if op == "$ne" and value == expected:
+                    return False
+                if op == "$in" and value not in expected:
+                    return False
+                if op == "$nin" and value in expected:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+
+    return True
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so cosine similarity is a dot product"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def _write_npy_rows(path: Path, count: int, updates: Dict[int, np.ndarray],
+                    appended: Optional[np.ndarray]) -> bool:
+    """Overwrite rows and append new ones to an .npy file in place, without rewriting it.
+
+    The header (row count) is written last, so an interrupted write leaves extra rows past
+    the recorded count, which loading ignores. Returns False without writing anything if the
+    grown header would not fit in the existing one; the caller then rewrites the file.
+    """
+    with open(path, "r+b") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        data_offset = f.tell()
+        if fortran_order or shape[0] < count:
+            return False
+        if appended is not None and tuple(appended.shape[1:]) != tuple(shape[1:]):
+            raise ValueError(f"Row shape {appended.shape[1:]} does not match stored {shape[1:]}")
+
+        added = len(appended) if appended is not None else 0
+        header = io.BytesIO()
+        header_data = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False,
+                       "shape": (count + added,) + tuple(shape[1:])}
+        if version == (1, 0):
+            np.lib.format.write_array_header_1_0(header, header_data)
+        else:
+            np.lib.format.write_array_header_2_0(header, header_data)
+        if header.tell() != data_offset:
+            return False
+
+        row_bytes = dtype.itemsize * int(np.prod(shape[1:], dtype=np.int64))
+        for position, row in updates.items():
+            f.seek(data_offset + position * row_bytes)
+            f.write(np.ascontiguousarray(row, dtype=dtype).tobytes())
+        if added:
+            f.seek(data_offset + count * row_bytes)
+            f.truncate()
+            f.write(np.ascontiguousarray(appended, dtype=dtype).tobytes())
+
+        f.seek(0)
+        f.write(header.getvalue())
+    return True
+
+def _append_to_buffer(buffer: Optional[np.ndarray], used: int, rows: np.ndarray) -> np.ndarray:
+    """Append rows after the first ``used`` rows of a buffer that doubles when full"""
+    needed = used + len(rows)
+    if buffer is None or needed > len(buffer):
+        grown = np.empty((max(needed, 2 * used),) + rows.shape[1:], dtype=rows.dtype)
+        if buffer is not None:
+            grown[:used] = buffer[:used]
+        buffer = grown
+    buffer[used:needed] = rows
+    return buffer
+
+
+class NumpyCollection:
+    """Brute-force vector collection stored as a memory-mapped matrix.
+
+    Mirrors the parts of chromadb's Collection API the app relies on
+    (count/get/add/upsert/delete), so callers can keep using ``vectorstore._collection``.
+    Vectors are stored L2-normalized; distances are reported like Chroma's default
+    squared-L2 space (2 - 2 * cosine) so existing score handling is unchanged.
+    Upserts write only the changed and new rows; records.json is rewritten per write,
+    or once at the end of a ``deferred_records()`` block.
+    """
+
+    def __init__(self, path: Path, dtype: str = "float32"):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dtype = np.dtype(dtype)
+        self.metadata = {"hnsw:space": "l2", "backend": "numpy"}
+
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Dict] = []
+        self._vectors: Optional[np.ndarray] = None
+        self._id_index: Dict[str, int] = {}
+        self._closed = False
+        self._defer_records = 0
+        self._records_dirty = False
+        self._load()
+
+    # ========== PERSISTENCE ==========
+
+    @staticmethod
+    def exists(path: Path) -> bool:
+        return (Path(path) / RECORDS_FILE).exists()
+
+    def _load(self):
+        records_path = self.path / RECORDS_FILE
+        vectors_path = self.path / VECTORS_FILE
+
+        if not records_path.exists():
+            return
+
+        with open(records_path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+
+        self._ids = records.get("ids", [])
+        self._documents = records.get("documents", [])
+        self._metadatas = records.get("metadatas", [])
+        self._id_index = {doc_id: i for i, doc_id in enumerate(self._ids)}
+
+        if vectors_path.exists() and self._ids:
+            # Memory-mapped: pages are only pulled in when a query touches them. Rows past the
+            # record count are left over from an interrupted ingest and are ignored.
+            self._vectors = np.load(vectors_path, mmap_mode="r")[:len(self._ids)]
+        else:
+            self._vectors = None
+
+    def _map_vectors(self):
+        vectors_path = self.path / VECTORS_FILE
+        self._vectors = np.load(vectors_path, mmap_mode="r")[:len(self._ids)] \
+            if vectors_path.exists() and self._ids else None
+
+    def _replace_matrix(self, vectors: Optional[np.ndarray]):
+        """Atomically write the whole matrix, then re-map it"""
+        vectors_path = self.path / VECTORS_FILE
+        self._vectors = None
+
+        if vectors is not None and len(vectors):
+            tmp_vectors = self.path / f"{VECTORS_FILE}.tmp"
+            with open(tmp_vectors, "wb") as f:
+                np.save(f, np.ascontiguousarray(vectors, dtype=self.dtype))
+            os.replace(tmp_vectors, vectors_path)
+        elif vectors_path.exists():
+            vectors_path.unlink()
+
+        self._map_vectors()
+
+    def _write_records(self):
+        """Atomically rewrite records.json (postponed while a deferred_records block is open)"""
+        if self._defer_records:
+            self._records_dirty = True
+            return
+
+        records_path = self.path / RECORDS_FILE
+        tmp_records = self.path / f"{RECORDS_FILE}.tmp"
+        with open(tmp_records, "w", encoding="utf-8") as f:
+            json.dump({
+                "ids": self._ids,
+                "documents": self._documents,
+                "metadatas": self._metadatas
+            }, f)
+        os.replace(tmp_records, records_path)
+        self._records_dirty = False
+
+    def _save(self, vectors: Optional[np.ndarray]):
+        """Atomically rewrite the matrix and records, then re-map the matrix"""
+        self._replace_matrix(vectors)
+        self._write_records()
+        self._id_index = {doc_id: i for i, doc_id in enumerate(self._ids)}
+
+    def _write_rows(self, updates: Dict[int, np.ndarray], appended: Optional[np.ndarray], base: int):
+        """Persist changed rows and rows appended after the first ``base`` rows.
+
+        Rows are written into the existing file, so an upsert costs O(batch) rather than
+        a copy and rewrite of the whole matrix; only a new store's file is written whole.
+        """
+        if not base or self._vectors is None:
+            self._replace_matrix(appended)
+            return
+
+        vectors_path = self.path / VECTORS_FILE
+        self._vectors = None  # Drop the read-only map before writing through the file
+        if not _write_npy_rows(vectors_path, base, updates, appended):
+            matrix = np.array(np.load(vectors_path, mmap_mode="r")[:base])
+            for position, row in updates.items():
+                matrix[position] = row
+            self._replace_matrix(matrix if appended is None else np.vstack([matrix, appended]))
+            return
+        self._map_vectors()
+
+    def _rewrite(self, keep: List[int]):
+        """Rewrite the store with only the rows at the kept positions (deletes are rare)"""
+        vectors = np.asarray(self._vectors[keep]) if self._vectors is not None and keep else None
+        self._ids = [self._ids[i] for i in keep]
+        self._documents = [self._documents[i] for i in keep]
+        self._metadatas = [self._metadatas[i] for i in keep]
+        self._save(vectors)
+
+    @contextmanager
+    def deferred_records(self):
+        """Write records.json once when the block ends instead of after every upsert"""
+        with self._lock:
+            self._defer_records += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._defer_records -= 1
+                if not self._defer_records and self._records_dirty and not self._closed:
+                    self._write_records()
+
+    def _check_open(self):
+        """Refuse to work on a closed collection: its records and matrix are no longer loaded"""
+        if self._closed:
+            raise RuntimeError(f"Vector collection at {self.path} is closed")
+
+    # ========== CHROMA-COMPATIBLE API ==========
+
+    def count(self) -> int:
+        self._check_open()
+        return len(self._ids)
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Optional[List[str]] = None) -> Dict[str, Any]:
+        include = include if include is not None else ["metadatas", "documents"]
+
+        with self._lock:
+            self._check_open()
+            if ids is not None:
+                positions = [self._id_index[i] for i in ids if i in self._id_index]
+            else:
+                positions = range(len(self._ids))
+
+            positions = [p for p in positions if _matches_where(self._metadatas[p], where)]
+
+            start = offset or 0
+            end = start + limit if limit is not None else None
+            positions = positions[start:end]
+
+            result = {"ids": [self._ids[p] for p in positions]}
+            result["documents"] = [self._documents[p] for p in positions] if "documents" in include else None
+            result["metadatas"] = [self._metadatas[p] for p in positions] if "metadatas" in include else None
+            if "embeddings" in include:
+                # Only the requested rows are read from the map
+                result["embeddings"] = np.asarray(self._vectors[positions], dtype=np.float32).tolist() \
+                    if self._vectors is not None and positions else []
+            else:
+                result["embeddings"] = None
+            return result
+
+    def add(self, ids: List[str], embeddings: List[List[float]],
+            documents: Optional[List[str]] = None, metadatas: Optional[List[Dict]] = None):
+        self.upsert(ids, embeddings, documents, metadatas)
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]],
+               documents: Optional[List[str]] = None, metadatas: Optional[List[Dict]] = None):
+        if not ids:
+            return
+
+        new_vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [{} for _ in ids]
+
+        with self._lock:
+            self._check_open()
+            base = len(self._ids)
+            updates = {}
+            appended = []
+
+            for i, doc_id in enumerate(ids):
+                if doc_id in self._id_index:
+                    pos = self._id_index[doc_id]
+                    if pos < base:
+                        updates[pos] = new_vectors[i]
+                    else:
+                        appended[pos - base] = new_vectors[i]
+                    self._documents[pos] = documents[i]
+                    self._metadatas[pos] = metadatas[i] or {}
+                else:
+                    self._id_index[doc_id] = len(self._ids)
+                    self._ids.append(doc_id)
+                    self._documents.append(documents[i])
+                    self._metadatas.append(metadatas[i] or {})
+                    appended.append(new_vectors[i])
+
+            self._write_rows(updates, np.vstack(appended) if appended else None, base)
+            self._write_records()
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        with self._lock:
+            self._check_open()
+            # Like Chroma, ids and where together must both match
+            candidates = set(ids) if ids is not None else set(self._ids)
+            to_delete = {
+                doc_id for doc_id, metadata in zip(self._ids, self._metadatas)
+                if doc_id in candidates and (where is None or _matches_where(metadata, where))
+            } if (ids is not None or where) else set()
+            if not to_delete:
+                return
+
+            keep = [i for i, doc_id in enumerate(self._ids) if doc_id not in to_delete]
+            self._rewrite(keep)
+
+    def query_vector(self, embedding: List[float], k: int, where: Optional[Dict] = None) -> List[Tuple[int, float]]:
+        """Top-k positions by cosine similarity, returned as (position, distance)"""
+        with self._lock:
+            self._check_open()
+            if self._vectors is None or not self._ids or k <= 0:
+                return []
+
+            query = np.asarray(embedding, dtype=np.float32)
+            query_norm = np.linalg.norm(query)
+            if query_norm:
+                query = query / query_norm
+
+            # float32 maps are used in place; float16 is widened for the matmul
+            scores = self._vectors.astype(np.float32, copy=False) @ query
+
+            if where:
+                mask = np.fromiter((_matches_where(m, where) for m in self._metadatas), dtype=bool, count=len(self._metadatas))
+                scores = np.where(mask, scores, -np.inf)
+
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            return [(int(p), max(0.0, float(2.0 - 2.0 * scores[p]))) for p in top if np.isfinite(scores[p])]
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, where: Optional[Dict] = None,
+              include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Chroma-style batched query: one list of ids/documents/metadatas/distances per query vector"""
+        include = include if include is not None else ["metadatas", "documents", "distances"]
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+
+        with self._lock:
+            self._check_open()
+            for embedding in query_embeddings:
+                hits = self.query_vector(embedding, n_results, where=where)
+                positions = [position for position, _ in hits]
+                result["ids"].append([self._ids[p] for p in positions])
+                result["documents"].append([self._documents[p] for p in positions])
+                result["metadatas"].append([self._metadatas[p] for p in positions])
+                result["distances"].append([distance for _, distance in hits])
+                result["embeddings"].append(
+                    np.asarray(self._vectors[positions], dtype=np.float32).tolist() if positions else []
+                )
+
+        for key in ("documents", "metadatas", "distances", "embeddings"):
+            if key not in include:
+                result[key] = None
+        return result
+
+    def record(self, position: int) -> Tuple[str, Optional[str], Dict]:
+        self._check_open()
+        return self._ids[position], self._documents[position], self._metadatas[position]
+
+    def close(self):
+        """Drop the memory map and records; any later call raises instead of using partial state"""
+        with self._lock:
+            if self._records_dirty:
+                self._defer_records = 0
+                self._write_records()
+            self._closed = True
+            self._vectors = None
+            self._ids, self._documents, self._metadatas = [], [], []
+            self._id_index = {}
+
+
+class QuantizedNumpyCollection(NumpyCollection):
+    """NumpyCollection that searches compact in-memory codes and re-scores exactly.
+
+    int8 (one scale per vector) or float16 codes are held in RAM for the first pass.
+    The float32 matrix stays memory-mapped on disk and only the top
+    ``k * rescore_factor`` candidate rows are read from it to compute exact scores.
+    """
+
+    def __init__(self, path: Path, quantization: str = "int8", rescore_factor: int = 4):
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        # _codes/_scales are views of buffers with spare rows, so appends don't copy every code
+        self._code_buffer: Optional[np.ndarray] = None
+        self._scale_buffer: Optional[np.ndarray] = None
+        # Full-precision vectors are kept for re-scoring, so the on-disk matrix is always float32
+        super().__init__(path, dtype="float32")
+        self.metadata = {"hnsw:space": "l2", "backend": "quantized", "quantization": quantization}
+
+    # ========== QUANTIZATION ==========
+
+    def _quantize(self, block: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        block = np.asarray(block, dtype=np.float32)
+        if self.quantization == "float16":
+            return block.astype(np.float16), None
+
+        scales = np.abs(block).max(axis=1)
+        scales[scales == 0] = 1.0
+        codes = np.round(block / scales[:, None] * 127).astype(np.int8)
+        return codes, (scales / 127).astype(np.float32)
+
+    def _build_codes(self, vectors: np.ndarray):
+        """Quantize block by block so a memory-mapped matrix is never fully widened"""
+        code_blocks, scale_blocks = [], []
+        for start in range(0, len(vectors), SCAN_BLOCK_ROWS):
+            codes, scales = self._quantize(vectors[start:start + SCAN_BLOCK_ROWS])
+            code_blocks.append(codes)
+            if scales is not None:
+                scale_blocks.append(scales)
+
+        self._set_codes(np.vstack(code_blocks), np.concatenate(scale_blocks) if scale_blocks else None)
+
+    def _set_codes(self, codes: Optional[np.ndarray], scales: Optional[np.ndarray]):
+        self._code_buffer, self._scale_buffer = codes, scales
+        self._codes, self._scales = codes, scales
+
+    def _write_codes(self):
+        for name, array in ((CODES_FILE, self._codes), (SCALES_FILE, self._scales)):
+            file_path = self.path / name
+            if array is None:
+                if file_path.exists():
+                    file_path.unlink()
+                continue
+            tmp_path = self.path / f"{name}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, file_path)
+
+    def _load(self):
+        super()._load()
+        self._set_codes(None, None)
+        if self._vectors is None:
+            return
+
+        codes_path = self.path / CODES_FILE
+        scales_path = self.path / SCALES_FILE
+        expected = np.int8 if self.quantization == "int8" else np.float16
+
+        if codes_path.exists():
+            # Codes are the hot data, so they are loaded into RAM rather than mapped
+            codes = np.load(codes_path)
+            scales = np.load(scales_path) if scales_path.exists() else None
+            # Like the matrix, codes may hold extra rows from an interrupted ingest
+            if (len(codes) >= len(self._ids) and codes.dtype == expected
+                    and (self.quantization != "int8" or (scales is not None and len(scales) >= len(self._ids)))):
+                self._set_codes(codes[:len(self._ids)], scales[:len(self._ids)] if scales is not None else None)
+                return
+
+        # Plain NumPy store, or quantization setting changed: rebuild codes from the matrix
+        self._build_codes(self._vectors)
+        self._write_codes()
+
+    def _write_rows(self, updates: Dict[int, np.ndarray], appended: Optional[np.ndarray], base: int):
+        """Persist the rows, then quantize and store codes for just the changed and new rows"""
+        new_store = not base or self._codes is None
+        super()._write_rows(updates, appended, base)
+
+        if new_store:
+            if self._vectors is None:
+                self._set_codes(None, None)
+            else:
+                self._build_codes(self._vectors)
+            self._write_codes()
+            return
+
+        positions = sorted(updates)
+        changed_codes, changed_scales = self._quantize(np.vstack([updates[p] for p in positions])) \
+            if positions else (None, None)
+        added_codes, added_scales = self._quantize(appended) if appended is not None else (None, None)
+
+        if positions:
+            self._codes[positions] = changed_codes
+            if changed_scales is not None:
+                self._scales[positions] = changed_scales
+        if added_codes is not None:
+            self._code_buffer = _append_to_buffer(self._code_buffer, base, added_codes)
+            self._codes = self._code_buffer[:base + len(added_codes)]
+            if added_scales is not None:
+                self._scale_buffer = _append_to_buffer(self._scale_buffer, base, added_scales)
+                self._scales = self._scale_buffer[:base + len(added_scales)]
+
+        pending = [(CODES_FILE, changed_codes, added_codes)]
+        if self._scales is not None:
+            pending.append((SCALES_FILE, changed_scales, added_scales))
+        try:
+            in_place = all(
+                _write_npy_rows(self.path / name, base, dict(zip(positions, changed)) if positions else {}, added)
+                for name, changed, added in pending
+            )
+        except (OSError, ValueError):
+            in_place = False
+        if not in_place:
+            self._write_codes()
+
+    def _rewrite(self, keep: List[int]):
+        codes = self._codes[keep] if self._codes is not None and keep else None
+        scales = self._scales[keep] if self._scales is not None and keep else None
+        super()._rewrite(keep)
+        self._set_codes(codes, scales)
+        self._write_codes()
+
+    # ========== SEARCH ==========
+
+    def _approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        scores = np.empty(len(self._codes), dtype=np.float32)
+        buffer = np.empty((min(SCAN_BLOCK_ROWS, len(self._codes)), self._codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(self._codes), SCAN_BLOCK_ROWS):
+            codes = self._codes[start:start + SCAN_BLOCK_ROWS]
+            block = buffer[:len(codes)]
+            np.copyto(block, codes, casting="unsafe")
+            scores[start:start + len(codes)] = block @ query
+        if self._scales is not None:
+            scores *= self._scales
+        return scores
+
+    def query_vector(self, embedding: List[float], k: int, where: Optional[Dict] = None,
+                     rescore: bool = True) -> List[Tuple[int, float]]:
+        """Top-k positions: approximate scan over codes, then exact scores for the candidates"""
+        with self._lock:
+            self._check_open()
+            if self._codes is None or not self._ids or k <= 0:
+                return []
+
+            query = np.asarray(embedding, dtype=np.float32)
+            query_norm = np.linalg.norm(query)
+            if query_norm:
+                query = query / query_norm
+
+            scores = self._approximate_scores(query)
+            if where:
+                mask = np.fromiter((_matches_where(m, where) for m in self._metadatas), dtype=bool, count=len(self._metadatas))
+                scores = np.where(mask, scores, -np.inf)
+
+            k = min(k, len(scores))
+            candidate_count = min(len(scores), k * self.rescore_factor) if rescore else k
+            candidates = np.argpartition(-scores, candidate_count - 1)[:candidate_count]
+            candidates = candidates[np.isfinite(scores[candidates])]
+            if not len(candidates):
+                return []
+
+            if rescore:
+                # Sorted positions keep the memory-mapped reads sequential
+                candidates = np.sort(candidates)
+                final_scores = np.asarray(self._vectors[candidates], dtype=np.float32) @ query
+            else:
+                final_scores = scores[candidates]
+
+            order = np.argsort(-final_scores)[:k]
+            return [(int(candidates[i]), max(0.0, float(2.0 - 2.0 * final_scores[i]))) for i in order]
+
+    def close(self):
+        with self._lock:
+            super().close()
+            self._set_codes(None, None)
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """Bytes held in RAM for search versus the full-precision matrix on disk"""
+        count = len(self._ids)
+        dimensions = self._vectors.shape[1] if self._vectors is not None else 0
+        resident = (self._codes.nbytes if self._codes is not None else 0) + \
+                   (self._scales.nbytes if self._scales is not None else 0)
+        return {
+            "vectors": count,
+            "dimensions": dimensions,
+            "quantization": self.quantization,
+            "resident_bytes": resident,
+            "full_precision_bytes": count * dimensions * 4
+        }
+
+    def evaluate(self, samples: int = 50, k: int = 8) -> Dict[str, Any]:
+        """Recall and latency of first-pass-only and re-scored search against exact search"""
+        count = self.count()
+        if count < 2:
+            return {"probes": 0, **self.memory_stats()}
+
+        k = min(k, count - 1)
+        rng = np.random.default_rng()
+        positions = rng.choice(count, size=min(samples, count), replace=False)
+
+        timings = {"exact": 0.0, "approximate": 0.0, "rescored": 0.0}
+        hits = {"approximate": 0, "rescored": 0}
+        total = 0
+
+        for position in positions:
+            probe = np.asarray(self._vectors[position], dtype=np.float32)
+
+            started = time.perf_counter()
+            exact = NumpyCollection.query_vector(self, probe, k + 1)[:k + 1]
+            timings["exact"] += time.perf_counter() - started
+
+            started = time.perf_counter()
+            approximate = self.query_vector(probe, k + 1, rescore=False)
+            timings["approximate"] += time.perf_counter() - started
+
+            started = time.perf_counter()
+            rescored = self.query_vector(probe, k + 1)
+            timings["rescored"] += time.perf_counter() - started
+
+            expected = {p for p, _ in exact if p != position}
+            hits["approximate"] += len(expected & {p for p, _ in approximate if p != position})
+            hits["rescored"] += len(expected & {p for p, _ in rescored if p != position})
+            total += len(expected)
+
+        probes = len(positions)
+        return {
+            "probes": probes,
+            "k": k,
+            "recall_first_pass": round(hits["approximate"] / total, 4) if total else None,
+            "recall_rescored": round(hits["rescored"] / total, 4) if total else None,
+            "rescore_factor": self.rescore_factor,
+            "mean_query_ms_exact": round(timings["exact"] * 1000 / probes, 3),
+            "mean_query_ms_first_pass": round(timings["approximate"] * 1000 / probes, 3),
+            "mean_query_ms_rescored": round(timings["rescored"] * 1000 / probes, 3),
+            **self.memory_stats()
+        }
+
+
+class NumpyVectorStore:
+    """Minimal LangChain-style vector store backed by a NumpyCollection"""
+
+    backend = "numpy"
+
+    def __init__(self, path: Path, embedding_function, dtype: str = "float32"):
+        self._collection = NumpyCollection(path, dtype=dtype)
+        self._embedding_function = embedding_function
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        texts = [doc.page_content for doc in documents]
+        ids = ids or [str(uuid.uuid4()) for _ in documents]
+        embeddings = self._embedding_function.embed_documents(texts)
+        self._collection.add(
+            ids=ids,
+            embeddings=embeddings,
+            documents=texts,
+            metadatas=[doc.metadata for doc in documents]
+        )
+        return ids
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        embedding = self._embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4, filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        results = []
+        for position, distance in self._collection.query_vector(embedding, k, where=filter):
+            _, text, metadata = self._collection.record(position)
+            results.append((Document(page_content=text or "", metadata=dict(metadata)), distance))
+        return results
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict] = None) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+
+class QuantizedVectorStore(NumpyVectorStore):
+    """NumpyVectorStore over a QuantizedNumpyCollection"""
+
+    backend = "quantized"
+
+    def __init__(self, path: Path, embedding_function, quantization: str = "int8", rescore_factor: int = 4):
+        self._collection = QuantizedNumpyCollection(path, quantization=quantization, rescore_factor=rescore_factor)
+        self._embedding_function = embedding_function
+
+
+def copy_collection(source, target, batch_size: int = 500, transform_metadata=None,
+                    transform_embeddings=None) -> int:
+    """Copy ids, vectors, documents and metadata between Chroma/NumPy collections (no re-embedding)
+
+    transform_embeddings receives each fetched batch and returns the vectors to write,
+    which lets a copy shorten or re-embed vectors on the way through.
+    """
+    copied = 0
+    total = source.count()
+    while copied < total:
+        batch = source.get(
+            limit=batch_size,
+            offset=copied,
+            include=["embeddings", "documents", "metadatas"]
+        )
+        if not batch["ids"]:
+            break
+
+        metadatas = batch["metadatas"]
+        if transform_metadata:
+            metadatas = [transform_metadata(dict(m or {})) for m in metadatas]
+
+        embeddings = batch["embeddings"]
+        if transform_embeddings:
+            embeddings = transform_embeddings(batch)
+
+        target.upsert(
+            ids=batch["ids"],
+            embeddings=embeddings,
+            documents=batch["documents"],
+            metadatas=metadatas
+        )
+        copied += len(batch["ids"])
+
+    return copied
+
+def maximal_marginal_relevance(query_embedding: List[float], embeddings, k: int,
+                               lambda_mult: float = 0.5) -> List[int]:
+    """Indices of k candidates balancing relevance to the query against similarity to picks so far"""
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if k <= 0 or not len(vectors):
+        return []
+
+    vectors = _normalize_rows(vectors)
+    query = _normalize_rows(np.asarray([query_embedding], dtype=np.float32))[0]
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    while len(selected) < min(k, len(vectors)):
+        redundancy = similarity[:, selected].max(axis=1)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+
+    return selected
+
+def truncate_embeddings(embeddings, dimensions: int) -> List[List[float]]:
+    """Shorten text-embedding-3 vectors and re-normalize, matching the API's `dimensions` output"""
+    matrix = np.asarray(embeddings, dtype=np.float32)[:, :dimensions]
+    return _normalize_rows(matrix).tolist()
+
+def dimension_index_path(base_path, dimensions: int) -> Path:
+    """Index root for an embedding size; the model default keeps the original layout"""
+    base_path = Path(base_path)
+    return base_path / f"dim_{dimensions}" if dimensions else base_path
+
+def dimension_collection_name(collection_name: str, dimensions: int) -> str:
+    """Collection name on the shared server for an embedding size"""
+    return f"{collection_name}_d{dimensions}" if dimensions else collection_name
+
+def remove_numpy_store(path: Path):
+    """Delete NumPy store files from a directory (leaves any Chroma files in place)"""
+    for name in (VECTORS_FILE, RECORDS_FILE, CODES_FILE, SCALES_FILE):
+        file_path = Path(path) / name
+        if file_path.exists():
+            file_path.unlink()
+
+
+class UserScopedCollection:
+    """View of a shared collection restricted to one user's chunks via user_email metadata"""
+
+    def __init__(self, collection, user_email: str):
+        self._collection = collection
+        self.user_email = user_email
+
+    def _scoped(self, where: Optional[Dict]) -> Dict:
+        user_filter = {"user_email": self.user_email}
+        return {"$and": [user_filter, where]} if where else user_filter
+
+    def count(self) -> int:
+        return len(self._collection.get(where=self._scoped(None), include=[])["ids"])
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Optional[List[str]] = None) -> Dict[str, Any]:
+        kwargs = {"where": self._scoped(where), "limit": limit, "offset": offset}
+        if ids is not None:
+            kwargs["ids"] = ids
+        if include is not None:
+            kwargs["include"] = include
+        return self._collection.get(**kwargs)
+
+    def add(self, ids: List[str], embeddings: List[List[float]],
+            documents: Optional[List[str]] = None, metadatas: Optional[List[Dict]] = None):
+        self.upsert(ids, embeddings, documents, metadatas)
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]],
+               documents: Optional[List[str]] = None, metadatas: Optional[List[Dict]] = None):
+        metadatas = [dict(m or {}, user_email=self.user_email) for m in (metadatas or [{} for _ in ids])]
+        self._collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        # Never let a scoped delete touch another user's chunks
+        self._collection.delete(ids=ids, where=self._scoped(where))
+
+
+class UserScopedVectorStore:
+    """Per-user facade over the consolidated user collection"""
+
+    backend = "shared"
+
+    def __init__(self, shared_store, user_email: str):
+        self._shared_store = shared_store
+        self.user_email = user_email
+        self._collection = UserScopedCollection(shared_store._collection, user_email)
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        for doc in documents:
+            doc.metadata["user_email"] = self.user_email
+        return self._shared_store.add_documents(documents, ids=ids) if ids else self._shared_store.add_documents(documents)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        return self._shared_store.similarity_search_with_score(query, k=k, filter=self._collection._scoped(filter))
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict] = None) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+
+def close_vectorstore(vectorstore):
+    """Release file handles and memory held by an embedded vector store (best effort)"""
+    if isinstance(vectorstore, UserScopedVectorStore):
+        # The shared collection stays open for other users
+        return
+
+    if isinstance(vectorstore, NumpyVectorStore):
+        vectorstore._collection.close()
+        return
+
+    client = getattr(vectorstore, "_client", None)
+    if client is None:
+        return
+
+    try:
+        if hasattr(client, "close"):
+            client.close()
+            return
+
+        # Older chromadb: drop the cached System for this path and stop it
+        from chromadb.api.shared_system_client import SharedSystemClient
+        identifier = getattr(client, "_identifier", None)
+        system = SharedSystemClient._identifier_to_system.pop(identifier, None)
+        if system is not None:
+            system.stop()
+    except Exception as e:
+        print(f"Warning: could not close vector store cleanly: {e}")
+
+
+class VectorStorePool:
+    """Bounded LRU cache of open vector stores with idle expiry.
+
+    Stores beyond ``max_size`` or unused for ``idle_seconds`` are closed through
+    ``closer`` so long-running workers keep a flat memory and file-handle profile.
+    Callers hold a store through ``lease()``; a leased store is never evicted, so
+    the pool can briefly exceed ``max_size`` while every store in it is in use.
+    ``swap()`` replaces a store in place: new leases wait for it and get the new
+    store, and the old one is closed when the last lease on it is released.
+    """
+
+    def __init__(self, max_size: int, idle_seconds: float, closer=close_vectorstore):
+        self.max_size = max(1, max_size)
+        self.idle_seconds = idle_seconds
+        self._closer = closer
+        self._stores: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._leases: Dict[str, int] = {}
+        self._swapping: set = set()
+        self._retired: Dict[int, List[Any]] = {}  # id(store) -> [store, leases still on it]
+        self._lock = threading.Lock()
+        self._swapped = threading.Condition(self._lock)
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._idle_evictions = 0
+
+    @contextmanager
+    def lease(self, key: str, opener):
+        """Hold the open store for key (opening it with opener() on a miss) for the with block"""
+        store = self._acquire(key, opener)
+        try:
+            yield store
+        finally:
+            self._release(key, store)
+
+    def _acquire(self, key: str, opener):
+        with self._lock:
+            while key in self._swapping:
+                self._swapped.wait()
+            entry = self._stores.get(key)
+            if entry is not None:
+                self._hits += 1
+                self._leases[key] = self._leases.get(key, 0) + 1
+                self._touch(key, entry[0])
+                return entry[0]
+
+        # Open outside the lock so a slow open doesn't block other users
+        store = opener()
+
+        with self._lock:
+            while key in self._swapping:
+                self._swapped.wait()
+            entry = self._stores.get(key)
+            if entry is not None:
+                # Another thread opened it first; keep theirs and drop ours unclosed,
+                # since Chroma clients on the same path share one underlying system
+                self._hits += 1
+                store = entry[0]
+            else:
+                self._misses += 1
+            self._leases[key] = self._leases.get(key, 0) + 1
+            self._touch(key, store)
+            evicted = self._expire_idle(time.monotonic()) + self._evict_over_capacity()
+
+        self._close_all(evicted)
+        return store
+
+    def _release(self, key: str, store):
+        with self._lock:
+            evicted = []
+            retired = self._retired.get(id(store))
+            if retired is not None and retired[0] is store:
+                # Lease taken before a swap: the store is no longer in the pool
+                retired[1] -= 1
+                if retired[1] == 0:
+                    del self._retired[id(store)]
+                    evicted.append(store)
+            else:
+                remaining = self._leases.get(key, 0) - 1
+                if remaining > 0:
+                    self._leases[key] = remaining
+                else:
+                    self._leases.pop(key, None)
+            entry = self._stores.get(key)
+            if entry is not None:
+                self._touch(key, entry[0])
+            evicted += self._expire_idle(time.monotonic()) + self._evict_over_capacity()
+        self._close_all(evicted)
+
+    def _touch(self, key: str, store):
+        """Mark key most recently used (caller holds the lock)"""
+        self._stores[key] = (store, time.monotonic())
+        self._stores.move_to_end(key)
+
+    def peek(self, key: str):
+        """Return the open store for key without opening or touching it"""
+        with self._lock:
+            entry = self._stores.get(key)
+            return entry[0] if entry else None
+
+    def swap(self, key: str, build, held: int = 0) -> bool:
+        """Replace key's open store with build(old_store) unless someone else is using it.
+
+        held is the number of leases the caller itself has on key. Returns False
+        without calling build when other leases exist or key is not open. While
+        build runs, new leases for key wait and then receive the new store; the
+        old store is closed once the caller's leases on it are released.
+        """
+        with self._lock:
+            entry = self._stores.get(key)
+            if entry is None or key in self._swapping or self._leases.get(key, 0) > held:
+                return False
+            old_store = entry[0]
+            self._swapping.add(key)
+
+        try:
+            new_store = build(old_store)
+        except Exception:
+            with self._lock:
+                self._swapping.discard(key)
+                self._swapped.notify_all()
+            raise
+
+        with self._lock:
+            self._swapping.discard(key)
+            self._touch(key, new_store)
+            if held:
+                self._retired[id(old_store)] = [old_store, held]
+                self._leases.pop(key, None)
+            self._swapped.notify_all()
+
+        if not held:
+            self._close_all([old_store])
+        return True
+
+    def close_all(self):
+        """Close every store, leased or not (shutdown only)"""
+        with self._lock:
+            stores = [store for store, _ in self._stores.values()]
+            stores += [store for store, _ in self._retired.values()]
+            self._stores.clear()
+            self._leases.clear()
+            self._retired.clear()
+        self._close_all(stores)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "open_handles": len(self._stores),
+                "leased": len(self._leases),
+                "max_size": self.max_size,
+                "idle_seconds": self.idle_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "idle_evictions": self._idle_evictions
+            }
+
+    def _expire_idle(self, now: float) -> List[Any]:
+        """Pop unleased stores idle past the timeout (caller holds the lock)"""
+        if not self.idle_seconds:
+            return []
+
+        expired = []
+        for key, (store, last_used) in list(self._stores.items()):
+            if now - last_used < self.idle_seconds:
+                break
+            if key in self._leases:
+                continue
+            del self._stores[key]
+            self._idle_evictions += 1
+            expired.append(store)
+        return expired
+
+    def _evict_over_capacity(self) -> List[Any]:
+        """Pop least recently used unleased stores beyond max_size (caller holds the lock)"""
+        evicted = []
+        for key in list(self._stores):
+            if len(self._stores) <= self.max_size:
+                break
+            if key in self._leases:
+                continue
+            store, _ = self._stores.pop(key)
+            self._evictions += 1
+            evicted.append(store)
+        return evicted
+
+    def _close_all(self, stores: List[Any]):
+        for store in stores:
+            try:
+                self._closer(store)
+            except Exception as e:
+                print(f"Warning: error closing vector store: {e}")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# vector_server.py - Run the shared Chroma vector server and migrate embedded indexes into it
+#
+# Usage:
+#   python vector_server.py                    # start the Chroma HTTP server
+#   python vector_server.py --import-embedded  # copy ./rag_index collections into a running server
+#
+# Web workers talk to this server when VECTOR_STORE_MODE=server, so the HNSW
+# indexes are held in memory once and all writes go through a single process.
+
+import os
+import sys
+import shutil
+import argparse
+from pathlib import Path
+
+from config import (
+    RAG_INDEX_PATH, CHROMA_SERVER_HOST, CHROMA_SERVER_PORT, SHARED_USER_COLLECTION_NAME,
+    EMBEDDING_DIMENSIONS
+)
+from vector_backends import NumpyCollection, copy_collection, dimension_index_path, dimension_collection_name
+
+SERVER_DATA_DIR = Path(RAG_INDEX_PATH) / "chroma_server"
+IMPORT_BATCH_SIZE = 500
+
+def run_server():
+    """Replace this process with the Chroma server"""
+    chroma_cli = shutil.which("chroma")
+    if not chroma_cli:
+        print("❌ 'chroma' CLI not found. Install chromadb in this environment.")
+        sys.exit(1)
+
+    SERVER_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    print(f"Starting Chroma server on {CHROMA_SERVER_HOST}:{CHROMA_SERVER_PORT}")
+    print(f"Data directory: {SERVER_DATA_DIR}")
+
+    os.execv(chroma_cli, [
+        chroma_cli, "run",
+        "--path", str(SERVER_DATA_DIR),
+        "--host", CHROMA_SERVER_HOST,
+        "--port", str(CHROMA_SERVER_PORT)
+    ])
+
+def find_embedded_collections():
+    """List (collection_name, persist_directory) pairs from the embedded layout"""
+    index_path = dimension_index_path(RAG_INDEX_PATH, EMBEDDING_DIMENSIONS)
+    collections = []
+
+    common_path = index_path / "common_knowledge"
+    if common_path.exists():
+        collections.append(("common_knowledge", common_path))
+
+    shared_path = index_path / SHARED_USER_COLLECTION_NAME
+    if shared_path.exists():
+        collections.append((SHARED_USER_COLLECTION_NAME, shared_path))
+
+    users_path = index_path / "users"
+    if users_path.exists():
+        for user_dir in sorted(users_path.iterdir()):
+            if user_dir.is_dir():
+                collections.append((user_dir.name, user_dir))
+
+    return collections
+
+def import_collection(name: str, source_path: Path, server_client) -> int:
+    """Copy one embedded collection (vectors included, no re-embedding) to the server"""
+    import chromadb
+
+    if NumpyCollection.exists(source_path):
+        source = NumpyCollection(source_path)
+    else:
+        source_client = chromadb.PersistentClient(path=str(source_path))
+        try:
+            source = source_client.get_collection(name)
+        except Exception:
+            print(f"  ⚠️ No collection '{name}' in {source_path}, skipping")
+            return 0
+
+    target = server_client.get_or_create_collection(
+        dimension_collection_name(name, EMBEDDING_DIMENSIONS),
+        metadata=source.metadata
+    )
+    return copy_collection(source, target, batch_size=IMPORT_BATCH_SIZE)
+
+def import_embedded():
+    """Copy every embedded collection into the running server"""
+    import chromadb
+
+    server_client = chromadb.HttpClient(host=CHROMA_SERVER_HOST, port=CHROMA_SERVER_PORT)
+    try:
+        server_client.heartbeat()
+    except Exception as e:
+        print(f"❌ Chroma server not reachable at {CHROMA_SERVER_HOST}:{CHROMA_SERVER_PORT}: {e}")
+        return
+
+    collections = find_embedded_collections()
+    if not collections:
+        print("No embedded collections found")
+        return
+
+    total_vectors = 0
+    errors = []
+
+    for name, path in collections:
+        try:
+            copied = import_collection(name, path, server_client)
+            print(f"✅ {name}: {copied} vectors")
+            total_vectors += copied
+        except Exception as e:
+            errors.append(f"{name}: {str(e)}")
+
+    print(f"\nImport completed: {len(collections) - len(errors)}/{len(collections)} collections, {total_vectors} vectors")
+    if errors:
+        print(f"Errors: {len(errors)}")
+        for error in errors:
+            print(f"  - {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared Chroma vector server for Sevabot")
+    parser.add_argument("--import-embedded", action="store_true",
+                        help="Copy collections from the embedded rag_index layout into a running server")
+    args = parser.parse_args()
+
+    if args.import_embedded:
+        import_embedded()
+    else:
+        run_server()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# write_behind.py - Buffered bulk inserts for rows nothing reads on the request path
+#
+# message_usage rows are only read by the usage report, so chat turns hand them to a
+# WriteBehindBuffer instead of inserting each one: a background thread writes everything
+# buffered in one bulk insert when a batch fills up or every flush interval. A batch the
+# database rejects (e.g. its conversation was deleted in the meantime) is retried row by
+# row so one bad row does not drop the rest.
+import threading
+from typing import Dict, List
+
+
+class WriteBehindBuffer:
+    """Collects rows for one table and inserts them in batches from a background thread"""
+
+    def __init__(self, client, table: str, batch_size: int, flush_interval: float):
+        self.client = client
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+
+        self._rows: List[Dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, row: Dict):
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= self.batch_size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name=f"write-behind-{self.table}")
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def flush(self) -> int:
+        """Write everything buffered now; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+
+            written = 0
+            for start in range(0, len(rows), self.batch_size):
+                batch = rows[start:start + self.batch_size]
+                try:
+                    self.client.table(self.table).insert(batch).execute()
+                    written += len(batch)
+                except Exception as e:
+                    print(f"Error writing {len(batch)} {self.table} rows, retrying one by one: {e}")
+                    written += self._insert_each(batch)
+
+            self.written += written
+            self.dropped += len(rows) - written
+            return written
+
+    def _insert_each(self, rows: List[Dict]) -> int:
+        written = 0
+        for row in rows:
+            try:
+                self.client.table(self.table).insert(row).execute()
+                written += 1
+            except Exception as e:
+                print(f"Dropping {self.table} row: {e}")
+        return written
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing {self.table} buffer: {e}")